@@ -0,0 +1,68 @@
+"""Benchmark of create_df - one combined mask with compact dtypes vs the original three filters.
+
+python python/benchmarks/bench_create_df.py [nbr of rows]
+"""
+import random
+import tracemalloc
+import sys
+import os
+from datetime import date
+from time import perf_counter
+from typing import Callable, Dict, List
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../scraper')))
+from lib.scraper import BezrealitkyScraper
+
+REGIONS = ["Praha", "Jihomoravský kraj", "Středočeský kraj", "Plzeňský kraj", "Ústecký kraj", "Zlínský kraj"]
+ROOMS = ["1+kk", "1+1", "2+kk", "2+1", "3+kk", "3+1", "4+kk", "", None]
+PRICES = ["1", "", None, "5000000+provize"]
+
+
+def legacy_create_df(json_data: List[Dict]) -> pd.DataFrame:
+    today = date.today()
+    df = pd.DataFrame(json_data)
+    df["datum_stazeni"] = today
+    df = df[~((df["rozloha"] == "") | (df["rozloha"].isna()))]
+    df = df[~((df["dispozice_nemovitosti"] == "") | (df["dispozice_nemovitosti"].isna()) & (df["typ_nemovistosti"] == "Byt"))]
+    df = df[~((df["cena_nemovitosti"] == "1") | (df["cena_nemovitosti"] == "") | (df["cena_nemovitosti"].isna()) | (df["cena_nemovitosti"].str.contains('+', regex=False)))]
+    df = df.astype({'cena_nemovitosti': 'int32', 'rozloha': 'int32'})
+    return df
+
+
+def synthetic_ads(rows: int) -> List[Dict]:
+    random.seed(42)
+    return [{
+        "typ_nemovistosti": "Byt" if i % 3 else "Dům",
+        "region": random.choice(REGIONS),
+        "dispozice_nemovitosti": random.choice(ROOMS) if i % 3 else None,
+        "rozloha": str(random.randint(20, 200)) if i % 50 else "",
+        "cena_nemovitosti": str(random.randint(500, 30000) * 1000) if i % 40 else random.choice(PRICES),
+        "odkaz": "https://www.bezrealitky.cz/nemovitosti-byty-domy/{}-nabidka-prodej-bytu".format(i)
+    } for i in range(rows)]
+
+
+def measure(create_df: Callable, ads: List[Dict]) -> pd.DataFrame:
+    start = perf_counter()
+    df = create_df(ads)
+    elapsed = perf_counter() - start
+    # second run only for memory, tracing slows the code down
+    tracemalloc.start()
+    create_df(ads)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{create_df.__qualname__:>35}: {elapsed:.3f}s, peak allocated {peak / 2 ** 20:.1f} MB, "
+          f"result {df.memory_usage(deep=True).sum() / 2 ** 20:.1f} MB")
+    return df
+
+
+def main(rows: int = 300000) -> None:
+    ads = synthetic_ads(rows)
+    legacy = measure(legacy_create_df, ads)
+    result = measure(BezrealitkyScraper.create_df, ads)
+    assert legacy.index.equals(result.index), "different rows"
+    assert (legacy["cena_nemovitosti"] == result["cena_nemovitosti"]).all(), "different prices"
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,120 @@
+"""End to end benchmark against the local stand-in site (standin.py) - crawl by BezrealitkyScraper.main
+(fetch, parse, create_df), Database.save_to_db and ReportHTML.create_report for every given nbr of ads.
+
+The site runs in a separate process, so rendering of pages doesn't compete with the scraper for the GIL.
+Results are printed and appended to output/benchmarks/end_to_end.jsonl for comparison between runs.
+
+python python/benchmarks/bench_end_to_end.py [latency in ms] [nbr of ads ...]
+
+Results of the default sizes without latency (1 CPU, Python 3.11, lxml 6.1, pandas 3.0; stage times of fetch
+and parse are summed over 8 fetching threads, so they are larger than the crawl itself):
+
+    ads        pages   crawl     ads/s  fetch     parse     extract  create_df  save_to_db  create_report
+    1120       57      0.88s     1269   1.38s     4.02s     0.52s    0.01s      0.04s       1.00s
+    100240     5013    98.24s    1020   103.32s   607.18s   45.08s   0.33s      1.86s       1.06s
+    1000160    50009   1019.54s  981    1078.14s  6264.14s  496.48s  3.54s      22.44s      1.19s
+
+Parsing of listing pages bounds the crawl on one CPU (see crawl.parse_workers for more CPUs), throughput
+stays about 1000 ads/s from 1k to 1M ads.
+"""
+from datetime import datetime
+import json
+import math
+import subprocess
+import tempfile
+import sys
+import os
+from time import perf_counter
+from typing import Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../scraper')))
+from lib.support_functions import get_path, init_config
+from lib.database import Database
+from lib.metrics import metrics
+from lib.report import ReportHTML
+from lib.scraper import BezrealitkyScraper
+
+STANDIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "standin.py")
+
+SIZES = [1000, 100000, 1000000]
+REGIONS = 14
+ADS_PER_PAGE = 20
+CONFIG = {
+    "parser": "lxml",
+    "crawl": {"requests_per_second": 100000, "max_in_flight": 8},
+    "cache": {"enabled": "N"}
+}
+
+
+def start_site(pages: int, latency_ms: int) -> Tuple[subprocess.Popen, str]:
+    """Run stand-in site in a separate process, return the process and url of the site
+    """
+    process = subprocess.Popen([sys.executable, STANDIN, str(REGIONS), str(pages), str(ADS_PER_PAGE), str(latency_ms)],
+                               stdout=subprocess.PIPE, universal_newlines=True)
+    # Serving <ads> ads on <url> , press Ctrl+C to stop
+    return process, process.stdout.readline().split()[4]
+
+
+def run(ads: int, latency_ms: int, sql: dict, tmp_dir: str) -> dict:
+    pages = max(1, math.ceil(ads / (REGIONS * ADS_PER_PAGE)))
+    metrics.reset()
+    process, url = start_site(pages, latency_ms)
+    try:
+        scraper = BezrealitkyScraper(url, ["byt"], CONFIG)
+        start = perf_counter()
+        df = scraper.main()
+        crawl = perf_counter() - start
+        scraper.session.close()
+    finally:
+        process.terminate()
+        process.wait()
+
+    db = Database(df, sql)
+    db.scraper_database = os.path.join(tmp_dir, "scraper_data_{}.db".format(ads))
+    start = perf_counter()
+    db.save_to_db()
+    save = perf_counter() - start
+    db.close()
+
+    report = ReportHTML(df)
+    report.tmp_dir = report.output_dir = tmp_dir
+    report.chart_cache = os.path.join(tmp_dir, "charts_{}.json".format(ads))
+    start = perf_counter()
+    report.create_report()
+    create_report = perf_counter() - start
+
+    stages = metrics.summary()["stages"]
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "ads": len(df.index),
+        "pages": REGIONS * pages + 1,
+        "latency_ms": latency_ms,
+        "crawl": round(crawl, 3),
+        "ads_per_s": round(len(df.index) / crawl),
+        "fetch": stages["fetch"]["seconds"],
+        "fetch_p95": stages["fetch"]["p95"],
+        "parse": stages["parse"]["seconds"],
+        "extract": stages["extract"]["seconds"],
+        "create_df": stages["create_df"]["seconds"],
+        "save_to_db": round(save, 3),
+        "create_report": round(create_report, 3)
+    }
+
+
+def main(latency_ms: int = 0, *sizes: int) -> None:
+    sql = init_config(get_path("config", "sql.yaml"))
+    results_dir = get_path("output", "benchmarks")
+    os.makedirs(results_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for ads in sizes or SIZES:
+            result = run(ads, latency_ms, sql, tmp_dir)
+            print(f"{result['ads']} ads ({result['pages']} pages): crawl {result['crawl']:.2f}s "
+                  f"({result['ads_per_s']} ads/s; fetch {result['fetch']:.2f}s, parse {result['parse']:.2f}s, "
+                  f"extract {result['extract']:.2f}s, create_df {result['create_df']:.2f}s in threads), "
+                  f"save_to_db {result['save_to_db']:.2f}s, create_report {result['create_report']:.2f}s")
+            with open(os.path.join(results_dir, "end_to_end.jsonl"), "a", encoding="utf8") as results:
+                results.write(json.dumps(result) + "\n")
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,127 @@
+"""Benchmark of SCD2 historisation on a long history - NOT IN / correlated subqueries over the whole H_Realty
+vs NOT EXISTS over open versions only.
+
+Partial index on open versions (H_Realty_open) was dropped - with and without it the statements ran
+0.8x - 1.5x of each other on 200000 ads x 10 versions and 50000 ads x 31 versions (5 runs each), no stable gain.
+
+python python/benchmarks/bench_historisation.py [nbr of open ads] [nbr of closed versions per ad]
+"""
+import shutil
+import sqlite3
+import tempfile
+import sys
+import os
+from time import perf_counter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../scraper')))
+from lib.support_functions import get_path, init_config
+from lib.database import Database
+
+# statements of earlier releases
+LEGACY_DML = [
+    """update H_Realty
+    set end_date = cast(strftime('%Y%m%d', CURRENT_DATE) as integer)
+    where ad_id not in (select ad_id from Realty_stg)
+    and end_date = 99991231""",
+    """update H_Realty
+    set end_date = (select cast(strftime('%Y%m%d', Realty_stg.datum_stazeni) as integer) from Realty_stg
+                    where Realty_stg.ad_id = H_Realty.ad_id
+                    and H_Realty.end_date = 99991231 and Realty_stg.cena_nemovitosti <> H_Realty.cena_nemovitosti)
+    where EXISTS (
+    select * from Realty_stg
+    where Realty_stg.ad_id = H_Realty.ad_id and H_Realty.end_date = 99991231
+     and Realty_stg.cena_nemovitosti <> H_Realty.cena_nemovitosti)""",
+    """insert into H_Realty
+    select ad_id, cena_nemovitosti, 1, 1, rozloha, 1, cast(strftime('%Y%m%d', datum_stazeni) as integer), 99991231
+    from Realty_stg
+    where ad_id not in (select distinct ad_id from H_Realty where end_date = 99991231)""",
+]
+
+# ad i has closed versions ending on days before the snapshot and one open version
+HISTORY_DML = """
+insert into H_Realty
+with recursive ad(i) as (select 0 union all select i + 1 from ad where i + 1 < ?),
+ version(v) as (select 0 union all select v + 1 from version where v < ?)
+select
+ i,
+ 100000 + i % 997 * 1000 + v,
+ 1,
+ 1,
+ 60,
+ 1,
+ cast(strftime('%Y%m%d', '2020-11-04', '-' || (v + 2) || ' days') as integer),
+ case when v = ? then 99991231 else cast(strftime('%Y%m%d', '2020-11-04', '-' || (v + 1) || ' days') as integer) end
+from ad, version
+"""
+
+# every 20th ad deleted, every 10th ad repriced, 5 % new ads
+STAGE_DML = """
+insert into Realty_stg
+with recursive ad(i) as (select 0 union all select i + 1 from ad where i + 1 < ?)
+select
+ i,
+ 100000 + i % 997 * 1000 + ? + case when i % 10 = 1 then 500 else 0 end,
+ '2+kk',
+ 'https://www.bezrealitky.cz/nemovitosti-byty-domy/' || i,
+ 'Praha',
+ 60,
+ 'Byt',
+ '2020-11-04'
+from ad
+where i % 20 <> 0
+"""
+
+
+def build_history(db: Database, ads: int, versions: int) -> None:
+    db.create_table()
+    with db.transaction() as conn:
+        conn.execute(HISTORY_DML, (ads, versions, versions))
+        conn.execute(STAGE_DML, (ads + ads // 20, versions))
+        for dml in db.dim_dml:
+            conn.execute(dml)
+    db.connect().execute("ANALYZE")
+    db.close()
+
+
+def timed(conn: sqlite3.Connection, statements) -> float:
+    start = perf_counter()
+    conn.execute("BEGIN")
+    for statement in statements:
+        conn.execute(statement)
+    conn.execute("COMMIT")
+    return perf_counter() - start
+
+
+def open_versions(path: str):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("select ad_id, cena_nemovitosti, start_date from H_Realty where end_date = 99991231 "
+                            "order by ad_id").fetchall()
+
+
+def main(ads: int = 200000, versions: int = 9) -> None:
+    sql = init_config(get_path("config", "sql.yaml"))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = Database(None, sql)
+        db.scraper_database = os.path.join(tmp_dir, "scraper_data.db")
+        start = perf_counter()
+        build_history(db, ads, versions)
+        print(f"{ads * (versions + 1)} history rows built in {perf_counter() - start:.2f}s")
+
+        legacy_database = os.path.join(tmp_dir, "legacy.db")
+        shutil.copyfile(db.scraper_database, legacy_database)
+        conn = sqlite3.connect(legacy_database, isolation_level=None)
+        legacy = timed(conn, LEGACY_DML)
+        conn.close()
+
+        conn = db.connect()
+        current = timed(conn, [db.deleted_dml, db.changed_dml, db.new_dml])
+        db.close()
+
+        assert open_versions(legacy_database) == open_versions(db.scraper_database)
+
+    print(f"{ads} open ads, {ads * versions} closed versions: NOT IN {legacy:.2f}s, "
+          f"NOT EXISTS {current:.2f}s ({legacy / current:.1f}x)")
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
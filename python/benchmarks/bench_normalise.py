@@ -0,0 +1,67 @@
+"""Micro-benchmark of ad field normalisation - table driven parse_ad vs the original chain of str.replace calls.
+
+python python/benchmarks/bench_normalise.py [nbr of ads]
+"""
+import random
+import sys
+import os
+from timeit import timeit
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../scraper')))
+from lib.parser import parse_ad
+
+NOTES = {
+    "Byt": "\n                    Prodej bytu {rooms}, {area} m²\n                ",
+    "Dům": "\n                    Prodej domu, {area} m²\n                ",
+    "Pozemek": "\n                    Prodej pozemku, {area} m²\n                ",
+    "Chata, chalupa": "\n                    Prodej chaty, chalupy, {area} m²\n                ",
+}
+ROOMS = ["1+kk", "1+1", "2+kk", "2+1", "3+kk", "3+1", "4+kk", "5+1"]
+
+
+def legacy_parse_ad(price_text: str, note_text: str, ad_link: str, prop_type: str, region: str) -> Dict[str, Optional[str]]:
+    price_tag = (price_text.replace(" ", "").replace("\n", "").replace(".", "").replace("Kč", ""))
+    disposition_x_square = (note_text
+                            .replace(" ", "")
+                            .replace("Prodejbytu", "")
+                            .replace("Prodejpozemku,", "")
+                            .replace("Prodejdomu,", "")
+                            .replace("Prodejgaráže,", "")
+                            .replace("Prodejkanceláře,", "")
+                            .replace("Prodejnebytovéhoprostoru,", "")
+                            .replace("Prodejchaty,chalupy,", "")
+                            .replace("m²", "")
+                            .replace(".", "")
+                            .replace("\n", ""))
+    if prop_type.lower() == "byt":
+        rooms, _, square = disposition_x_square.partition(",")
+    else:
+        square, rooms = (disposition_x_square, None)
+    return {"typ_nemovistosti": prop_type, "region": region, "dispozice_nemovitosti": rooms, "rozloha": square,
+            "cena_nemovitosti": price_tag, "odkaz": "https://www.bezrealitky.cz{}".format(ad_link)}
+
+
+def synthetic_page(ads: int) -> List[Tuple[str, str, str, str, str]]:
+    random.seed(42)
+    page = []
+    for i in range(ads):
+        prop_type = random.choice(list(NOTES))
+        area = "{:,}".format(random.randint(20, 3000)).replace(",", ".")
+        price = "{:,}".format(random.randint(500, 30000) * 1000).replace(",", ".")
+        page.append(("\n{:>70} Kč\n".format(price), NOTES[prop_type].format(rooms=random.choice(ROOMS), area=area),
+                     "/nemovitosti-byty-domy/{}-nabidka-prodej".format(i), prop_type, "Praha"))
+    return page
+
+
+def main(ads: int = 200000) -> None:
+    page = synthetic_page(ads)
+    assert [legacy_parse_ad(*ad) for ad in page] == [parse_ad(*ad) for ad in page], "results differ"
+
+    legacy = timeit(lambda: [legacy_parse_ad(*ad) for ad in page], number=3) / 3
+    table = timeit(lambda: [parse_ad(*ad) for ad in page], number=3) / 3
+    print(f"{ads} ads: replace chain {legacy:.3f}s, table driven {table:.3f}s, speedup {legacy / table:.2f}x")
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
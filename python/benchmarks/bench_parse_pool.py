@@ -0,0 +1,51 @@
+"""Benchmark of parsing listing pages - fetching threads parsing in process vs parsing pool of worker processes.
+
+Pages are taken from the saved fixture (url_praha.html), no network is involved. Every setting runs the same
+path as the crawl (BezrealitkyScraper.parse_listing called from max_in_flight threads), speedup of the pool
+is limited by nbr of cores.
+
+python python/benchmarks/bench_parse_pool.py [nbr of pages] [max nbr of workers]
+"""
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import os
+from time import perf_counter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../scraper')))
+from lib.support_functions import get_path
+from lib.scraper import BezrealitkyScraper
+
+MAX_IN_FLIGHT = 8
+
+
+def run(content: bytes, pages: int, workers: int) -> float:
+    """Parse the page given nbr of times, return pages per second
+    """
+    config = {"parser": "lxml", "crawl": {"max_in_flight": MAX_IN_FLIGHT, "parse_workers": workers}}
+    scraper = BezrealitkyScraper("http://127.0.0.1/", ["byt"], config)
+    with scraper.parsing_pool(), ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT) as executor:
+        # start worker processes before measuring
+        list(executor.map(lambda _: scraper.parse_listing("", content, "Byt", "Praha"), range(MAX_IN_FLIGHT)))
+        start = perf_counter()
+        for rows, _ in executor.map(lambda _: scraper.parse_listing("", content, "Byt", "Praha"), range(pages)):
+            assert len(rows) == 10
+        elapsed = perf_counter() - start
+    return pages / elapsed
+
+
+def main(pages: int = 2000, max_workers: int = 0) -> None:
+    with open(get_path("python", "tests", "unit", "fixtures", "url_praha.html"), "rb") as html:
+        content = html.read()
+    max_workers = max_workers or os.cpu_count()
+    print(f"{pages} pages, {os.cpu_count()} cores")
+    baseline = run(content, pages, 0)
+    print(f"{'in fetching threads':>20}: {baseline:7.0f} pages/s")
+    workers = 1
+    while workers <= max_workers:
+        speed = run(content, pages, workers)
+        print(f"{str(workers) + ' worker(s)':>20}: {speed:7.0f} pages/s, {speed / baseline:.2f}x")
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
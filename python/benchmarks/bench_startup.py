@@ -0,0 +1,35 @@
+"""Benchmark of CLI startup - modules imported by main.py with eager report import vs lazy report import.
+
+Every measurement runs in a fresh interpreter with -X importtime, the best of given nbr of runs is reported.
+
+python python/benchmarks/bench_startup.py [nbr of runs]
+"""
+import subprocess
+import sys
+import os
+
+SCRAPER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../scraper'))
+
+# main.py imported lib.report at the top before the report was made lazy
+EAGER_IMPORTS = "import lib.database, lib.report, lib.scraper"
+LAZY_IMPORTS = "import main"
+
+
+def import_time(statement: str) -> float:
+    """Return total import time in seconds as reported by -X importtime
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=SCRAPER_DIR,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    # import time: self [us] | cumulative | imported package
+    return sum(int(line.split("|")[0].split(":")[1]) for line in result.stderr.splitlines()
+               if line.startswith("import time:") and line.split("|")[0].split(":")[1].strip().isdigit()) / 1e6
+
+
+def main(runs: int = 5) -> None:
+    eager = min(import_time(EAGER_IMPORTS) for _ in range(runs))
+    lazy = min(import_time(LAZY_IMPORTS) for _ in range(runs))
+    print(f"startup imports: eager report {eager:.3f}s, lazy report {lazy:.3f}s ({eager / lazy:.1f}x)")
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
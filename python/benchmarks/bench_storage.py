@@ -0,0 +1,149 @@
+"""Benchmark of the storage layout - history keyed by links with texts and ISO dates vs normalised layout with
+integer ad ids, dimension tables and YYYYMMDD dates. Legacy database is built, migrated by Database.migrate and
+the same daily snapshot is historised in both layouts - file size and historisation time are compared.
+
+python python/benchmarks/bench_storage.py [nbr of ads] [nbr of closed versions per ad]
+"""
+import shutil
+import sqlite3
+import tempfile
+import sys
+import os
+from time import perf_counter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../scraper')))
+from lib.support_functions import get_path, init_config
+from lib.database import Database
+
+# layout and historisation before integer ad ids
+LEGACY_DDL = [
+    """CREATE TABLE Realty_stg (cena_nemovitosti INTEGER, dispozice_nemovitosti TEXT, odkaz TEXT PRIMARY KEY,
+    region TEXT, rozloha INTEGER, typ_nemovistosti TEXT, datum_stazeni DATE)""",
+    """CREATE TABLE H_Realty (odkaz TEXT NOT NULL, cena_nemovitosti INTEGER NOT NULL, dispozice_nemovitosti TEXT,
+    region TEXT NOT NULL, rozloha INTEGER NOT NULL, typ_nemovistosti TEXT NOT NULL, start_date DATE NOT NULL,
+    end_date DATE NOT NULL, PRIMARY KEY (odkaz, end_date))""",
+    """CREATE INDEX H_Realty_open ON H_Realty (odkaz, cena_nemovitosti) WHERE end_date = '9999-12-31'""",
+]
+LEGACY_DML = [
+    """update H_Realty
+    set end_date = coalesce((select max(datum_stazeni) from Realty_stg), CURRENT_DATE)
+    where end_date = '9999-12-31'
+    and not exists (select 1 from Realty_stg where Realty_stg.odkaz = H_Realty.odkaz)""",
+    """update H_Realty
+    set end_date = (select Realty_stg.datum_stazeni from Realty_stg where Realty_stg.odkaz = H_Realty.odkaz)
+    where end_date = '9999-12-31'
+    and exists (select 1 from Realty_stg where Realty_stg.odkaz = H_Realty.odkaz
+                and Realty_stg.cena_nemovitosti <> H_Realty.cena_nemovitosti)""",
+    """insert into H_Realty
+    select odkaz, cena_nemovitosti, dispozice_nemovitosti, region, rozloha, typ_nemovistosti, datum_stazeni, '9999-12-31'
+    from Realty_stg
+    where not exists (select 1 from H_Realty where H_Realty.odkaz = Realty_stg.odkaz
+                      and H_Realty.end_date = '9999-12-31')""",
+]
+
+# ad i of one of 7 types, 14 regions and 9 dispositions has closed versions ending on days before the snapshot
+# and one open version, links have the shape of the site
+HISTORY_DML = """
+insert into H_Realty
+with recursive ad(i) as (select 0 union all select i + 1 from ad where i + 1 < ?),
+ version(v) as (select 0 union all select v + 1 from version where v < ?)
+select
+ 'https://www.bezrealitky.cz/nemovitosti-byty-domy/' || (600000 + i) || '-nabidka-prodej-bytu-ulice-' || (i % 5000) || '-praha',
+ 100000 + i % 997 * 1000 + v,
+ case when i % 7 = 0 then (i % 9 + 1) || '+kk' end,
+ 'Region ' || (i % 14),
+ 20 + i % 180,
+ 'Typ ' || (i % 7),
+ date('2020-11-04', '-' || (v + 2) || ' days'),
+ case when v = ? then '9999-12-31' else date('2020-11-04', '-' || (v + 1) || ' days') end
+from ad, version
+"""
+
+# every 20th ad deleted, every 10th ad repriced, 5 % new ads
+STAGE_DML = """
+insert into Realty_stg
+with recursive ad(i) as (select 0 union all select i + 1 from ad where i + 1 < ?)
+select
+ 100000 + i % 997 * 1000 + ? + case when i % 10 = 1 then 500 else 0 end,
+ case when i % 7 = 0 then (i % 9 + 1) || '+kk' end,
+ 'https://www.bezrealitky.cz/nemovitosti-byty-domy/' || (600000 + i) || '-nabidka-prodej-bytu-ulice-' || (i % 5000) || '-praha',
+ 'Region ' || (i % 14),
+ 20 + i % 180,
+ 'Typ ' || (i % 7),
+ '2020-11-04'
+from ad
+where i % 20 <> 0
+"""
+
+
+def build_legacy(path: str, ads: int, versions: int) -> None:
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("BEGIN")
+    for ddl in LEGACY_DDL:
+        conn.execute(ddl)
+    conn.execute(HISTORY_DML, (ads, versions, versions))
+    conn.execute(STAGE_DML, (ads + ads // 20, versions))
+    conn.execute("COMMIT")
+    conn.execute("ANALYZE")
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+def legacy_historisation(path: str) -> float:
+    conn = sqlite3.connect(path, isolation_level=None)
+    start = perf_counter()
+    conn.execute("BEGIN")
+    for dml in LEGACY_DML:
+        conn.execute(dml)
+    conn.execute("COMMIT")
+    elapsed = perf_counter() - start
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return elapsed
+
+
+def open_versions(path: str, table: str):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(f"select odkaz, cena_nemovitosti, region, start_date from {table} "
+                            f"where end_date = '9999-12-31' order by odkaz").fetchall()
+
+
+def main(ads: int = 200000, versions: int = 9) -> None:
+    sql = init_config(get_path("config", "sql.yaml"))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_database = os.path.join(tmp_dir, "legacy.db")
+        start = perf_counter()
+        build_legacy(legacy_database, ads, versions)
+        print(f"{ads * (versions + 1)} history rows built in {perf_counter() - start:.2f}s")
+
+        db = Database(None, sql)
+        db.scraper_database = os.path.join(tmp_dir, "scraper_data.db")
+        shutil.copyfile(legacy_database, db.scraper_database)
+        legacy_size = os.path.getsize(legacy_database)
+
+        start = perf_counter()
+        db.migrate()
+        migration = perf_counter() - start
+        size = db.file_size()
+
+        legacy = legacy_historisation(legacy_database)
+        start = perf_counter()
+        db.historisation()
+        normalised = perf_counter() - start
+        db.connect().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        db.close()
+
+        assert open_versions(legacy_database, "H_Realty") == open_versions(db.scraper_database, "V_Realty")
+        grown_legacy, grown = os.path.getsize(legacy_database) - legacy_size, db.file_size() - size
+
+    print(f"{ads} ads, {ads * versions} closed versions, migrated in {migration:.2f}s")
+    print(f"file size: legacy {legacy_size / 2 ** 20:.1f} MB, normalised {size / 2 ** 20:.1f} MB "
+          f"({legacy_size / size:.1f}x smaller)")
+    print(f"historisation: legacy {legacy:.2f}s (+{grown_legacy / 2 ** 20:.1f} MB), "
+          f"normalised {normalised:.2f}s (+{grown / 2 ** 20:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,286 @@
+"""Local stand-in for bezrealitky.cz - serves homepage, paginated listing pages and detail pages of ads generated
+from the structure of saved fixtures (base_url.html, url_praha.html, detail.html) with configurable nbr of regions,
+pages and ads. The same ads are served as JSON by the stand-in of GraphQL API (graphql_praha.json).
+
+python python/benchmarks/standin.py [nbr of regions] [nbr of pages] [ads per page] [latency in ms]
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import json
+import threading
+import time
+import sys
+import os
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../scraper')))
+from lib.support_functions import get_path
+from lib.graphql import ESTATE_TYPES
+from bs4 import BeautifulSoup, Comment
+
+LISTING_PATH = "/vypis/nabidka-prodej/"
+DETAIL_PATH = "/nemovitosti-byty-domy/"
+GRAPHQL_PATH = "/graphql/"
+BUILDINGS = ["Cihla", "Panel", "Skelet", "Smíšená"]
+OWNERSHIP = ["Osobní", "Družstevní"]
+ROOMS = ["1+kk", "1+1", "2+kk", "2+1", "3+kk", "3+1", "4+kk", "4+1", "5+kk"]
+# note of the ad by property type (config.yaml name)
+NOTES = {
+    "byt": "Prodej bytu {rooms}, {area} m²",
+    "dum": "Prodej domu, {area} m²",
+    "pozemek": "Prodej pozemku, {area} m²",
+    "garaz": "Prodej garáže, {area} m²",
+    "kancelar": "Prodej kanceláře, {area} m²",
+    "nebytovy-prostor": "Prodej nebytového prostoru, {area} m²",
+    "chata-chalupa": "Prodej chaty, chalupy, {area} m²",
+}
+AD_MARK = "ads"
+PAGINATION_MARK = "pagination"
+
+
+def read_fixture(file: str) -> str:
+    with open(get_path("python", "tests", "unit", "fixtures", file), "r", encoding="utf8") as fixture:
+        return fixture.read()
+
+
+class StandInSite:
+    """Generated copy of the site - every region of every property type has the same nbr of pages and ads,
+    content of pages is deterministic (the same url returns the same page)
+    """
+
+    def __init__(self, regions: int = 14, pages: int = 5, ads_per_page: int = 20, latency: float = 0.0,
+                 prop_types: Tuple[str, ...] = ("byt",)) -> None:
+        """
+        Args:
+            regions (int): nbr of regions, the first 14 are real regions of the fixture
+            pages (int): nbr of listing pages of every region and property type
+            ads_per_page (int): nbr of ads on a listing page
+            latency (float): delay of every response in seconds
+            prop_types (Tuple[str, ...]): property types with ads, other types have empty listings
+        """
+        self.pages = pages
+        self.ads_per_page = ads_per_page
+        self.latency = latency
+        self.prop_types = list(prop_types)
+        self.region_uris: List[str] = []
+        self.region_ids: List[str] = []
+        self.homepage = self.build_homepage(regions).encode("utf8")
+        self.listing, self.ad_template = self.build_listing()
+        self.detail_template = self.build_detail()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __repr__(self):
+        return "<StandInSite({} regions, {} pages, {} ads per page)>".format(
+            len(self.region_uris), self.pages, self.ads_per_page)
+
+    @property
+    def total_ads(self) -> int:
+        return len(self.prop_types) * len(self.region_uris) * self.pages * self.ads_per_page
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}{}".format(host, port, LISTING_PATH)
+
+    @property
+    def graphql_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}{}".format(host, port, GRAPHQL_PATH)
+
+    def build_homepage(self, regions: int) -> str:
+        soup = BeautifulSoup(read_fixture("base_url.html"), "html.parser")
+        region_selector = soup.find("div", {"id": "regionSelector"})
+        region_children = json.loads(region_selector.get("data-region-children"))
+        real_regions = region_children["161"]["children"]
+        generated = real_regions[:regions] + [
+            {"id": str(1000 + i), "name": "Region {}".format(i), "uri": "region-{}".format(i), "__typename": "Region"}
+            for i in range(len(real_regions), regions)]
+        region_children["161"]["children"] = generated
+        region_selector["data-region-children"] = json.dumps(region_children)
+        self.region_uris = [region["uri"] for region in generated]
+        self.region_ids = [region["id"] for region in generated]
+        return str(soup)
+
+    @staticmethod
+    def build_listing() -> Tuple[str, str]:
+        """Return listing page with marks in place of ads and pagination, and template of one ad
+        """
+        soup = BeautifulSoup(read_fixture("url_praha.html"), "html.parser")
+        ads = soup.find_all("div", {"class": "product__body-new"})
+        ad_template = str(ads[0]).replace("{", "{{").replace("}", "}}")
+        ad_template = (ad_template
+                       .replace("/nemovitosti-byty-domy/649688-nabidka-prodej-bytu-kurta-konrada-praha", "{link}")
+                       .replace("Prodej bytu 2+kk, 60 m²", "{note}")
+                       .replace("6.700.000 Kč", "{price}"))
+        ads[0].replace_with(Comment(AD_MARK))
+        for ad in ads[1:]:
+            ad.decompose()
+        soup.find("ul", {"class": "pagination"}).replace_with(Comment(PAGINATION_MARK))
+        return str(soup), ad_template
+
+    @staticmethod
+    def build_detail() -> str:
+        """Return template of the detail page
+        """
+        detail = read_fixture("detail.html").replace("{", "{{").replace("}", "}}")
+        for value, field in [("<td>3</td>", "<td>{floor}</td>"), ("<td>Cihla</td>", "<td>{building}</td>"),
+                             ("<td>Osobní</td>", "<td>{ownership}</td>"), ("C - Úsporná", "{energy_class}"),
+                             ('data-lat="50.1048"', 'data-lat="{lat}"'), ('data-lng="14.4893"', 'data-lng="{lng}"')]:
+            detail = detail.replace(value, field)
+        return detail
+
+    def ad_id(self, type_index: int, region_index: int, page: int, position: int) -> int:
+        return (((type_index * len(self.region_uris) + region_index) * self.pages + page - 1) * self.ads_per_page
+                + position)
+
+    @staticmethod
+    def ad_price(ad_id: int) -> int:
+        return (ad_id * 7919 % 9000 + 1000) * 1000
+
+    def render_ad(self, prop_type: str, ad_id: int) -> str:
+        note = NOTES.get(prop_type, "Prodej " + prop_type + ", {area} m²").format(
+            rooms=ROOMS[ad_id % len(ROOMS)], area=20 + ad_id % 180)
+        price = "{:,}".format(self.ad_price(ad_id)).replace(",", ".") + " Kč"
+        link = "{}{}-nabidka-prodej-{}".format(DETAIL_PATH, ad_id, prop_type)
+        return self.ad_template.format(link=link, note=note, price=price)
+
+    def render_advert(self, prop_type: str, ad_id: int) -> Dict:
+        """Return the ad as advert of GraphQL API - the same values as render_ad
+        """
+        rooms = ROOMS[ad_id % len(ROOMS)].upper().replace("+", "_")
+        return {"id": str(ad_id), "uri": "{}-nabidka-prodej-{}".format(ad_id, prop_type),
+                "estateType": ESTATE_TYPES.get(prop_type, prop_type.upper()),
+                "disposition": "DISP_" + rooms if prop_type == "byt" else None,
+                "surface": 20 + ad_id % 180, "price": self.ad_price(ad_id)}
+
+    def render_graphql(self, variables: str) -> bytes:
+        """Return response of listAdverts query - ads of one property type and region, limit and offset paginate
+        over all pages of the listing
+        """
+        try:
+            variables = json.loads(variables)
+            estate_type, region_id = variables["estateType"][0], variables["regionOsmIds"][0]
+            limit, offset = int(variables["limit"]), int(variables["offset"])
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            return json.dumps({"errors": [{"message": "Invalid variables: {!r}".format(e)}]}).encode("utf8")
+        prop_types = [prop_type for prop_type, estate in ESTATE_TYPES.items() if estate == estate_type]
+        if not prop_types or region_id not in self.region_ids:
+            return json.dumps({"data": {"listAdverts": {"totalCount": 0, "list": []}}}).encode("utf8")
+        prop_type = prop_types[0]
+        if prop_type in self.prop_types:
+            type_index, region_index = self.prop_types.index(prop_type), self.region_ids.index(region_id)
+            first = self.ad_id(type_index, region_index, 1, 0)
+            total = self.pages * self.ads_per_page
+            adverts = [self.render_advert(prop_type, first + i) for i in range(offset, min(offset + limit, total))]
+        else:
+            total, adverts = 0, []
+        return json.dumps({"data": {"listAdverts": {"totalCount": total, "list": adverts}}}).encode("utf8")
+
+    def render_pagination(self, path: str, page: int) -> str:
+        links = "".join('<li class="page-item"><a class="page-link pagination__page" href="{}?page={}">{}</a></li>'
+                        .format(path, i, i) for i in sorted({1, page, self.pages}))
+        return '<ul class="pagination justify-content-md-end">{}</ul>'.format(links)
+
+    def render_detail(self, ad_id: int) -> str:
+        return self.detail_template.format(
+            floor=ad_id % 12, building=BUILDINGS[ad_id % len(BUILDINGS)], ownership=OWNERSHIP[ad_id % len(OWNERSHIP)],
+            energy_class="ABCDEFG"[ad_id % 7], lat=49 + ad_id % 1000 / 1000, lng=14 + ad_id % 997 / 1000)
+
+    def render(self, path: str, page: int) -> Optional[bytes]:
+        """Return page on the path, None if there is no such page
+        """
+        if path == LISTING_PATH:
+            return self.homepage
+        if path.startswith(DETAIL_PATH):
+            # /nemovitosti-byty-domy/<ad id>-nabidka-prodej-<property type>
+            ad_id, _, prop_type = path[len(DETAIL_PATH):].partition("-nabidka-prodej-")
+            if not ad_id.isdigit() or prop_type not in self.prop_types or int(ad_id) >= self.total_ads:
+                return None
+            return self.render_detail(int(ad_id)).encode("utf8")
+        parts = path[len(LISTING_PATH):].split("/")
+        if not path.startswith(LISTING_PATH) or len(parts) != 2 or parts[1] not in self.region_uris:
+            return None
+        prop_type, region = parts
+        if prop_type in self.prop_types and 1 <= page <= self.pages:
+            type_index, region_index = self.prop_types.index(prop_type), self.region_uris.index(region)
+            ads = "".join(self.render_ad(prop_type, self.ad_id(type_index, region_index, page, position))
+                          for position in range(self.ads_per_page))
+        else:
+            ads = ""
+        return (self.listing.replace("<!--{}-->".format(AD_MARK), ads)
+                .replace("<!--{}-->".format(PAGINATION_MARK), self.render_pagination(path, page)).encode("utf8"))
+
+    def start(self) -> "StandInSite":
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if site.latency:
+                    time.sleep(site.latency)
+                url = urlsplit(self.path)
+                query = parse_qs(url.query)
+                content_type = "text/html; charset=utf-8"
+                if url.path == GRAPHQL_PATH:
+                    content = site.render_graphql(query.get("variables", ["{}"])[0])
+                    content_type = "application/json"
+                else:
+                    page = query.get("page", ["1"])[0]
+                    content = site.render(url.path, int(page)) if page.isdigit() else None
+                if content is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                etag = '"{}"'.format(hashlib.md5(content).hexdigest())
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(content)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "StandInSite":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main(regions: int = 14, pages: int = 5, ads_per_page: int = 20, latency_ms: int = 0) -> None:
+    with StandInSite(regions, pages, ads_per_page, latency_ms / 1000) as site:
+        # the first line is read by benchmarks running the site in a separate process
+        print(f"Serving {site.total_ads} ads on {site.url} , press Ctrl+C to stop", flush=True)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,197 @@
+from lib.metrics import metrics
+from lib.support_functions import get_path, running_script_name
+from datetime import date
+import hashlib
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Optional
+import requests
+
+logger = logging.getLogger(running_script_name(__name__))
+
+# reason of 404 response of page missing in the archive, page not found by the crawl is 404 Not Found
+NOT_ARCHIVED = "Not archived"
+
+INDEX_DDL = """
+CREATE TABLE IF NOT EXISTS archive_page
+(
+ day TEXT NOT NULL,
+ url TEXT NOT NULL,
+ fetched_at REAL NOT NULL,
+ file TEXT NOT NULL,
+ offset INTEGER NOT NULL,
+ length INTEGER NOT NULL,
+ content_hash TEXT NOT NULL,
+ PRIMARY KEY (day, url)
+)
+"""
+
+
+class PageArchive:
+    """Append-only archive of downloaded pages - one file of zlib compressed pages per day with offset index.
+
+    Index (index.db) keys every page by day and url, fetch time is stored with it. Page that didn't change
+    since it was archived last time (the same content hash or 304 Not Modified) is not written again, its index
+    row points to the older record. Page that was not found (404) by the crawl has index row without record
+    (length -1). Writers (threads and processes) are serialized by the write lock of the index, files are read
+    memory mapped.
+    """
+
+    def __init__(self, directory: str, level: int = 6) -> None:
+        """
+        Args:
+            directory (str): directory of archive files and index
+            level (int): zlib compression level
+        """
+        self.directory = directory
+        self.level = level
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._maps: Dict[str, mmap.mmap] = {}
+        # explicit transactions, writers from other processes are waited for
+        self._conn = sqlite3.connect(os.path.join(directory, "index.db"), timeout=60, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(INDEX_DDL)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS archive_page_url ON archive_page (url, fetched_at)")
+
+    def __repr__(self):
+        return "<PageArchive({})>".format(self.directory)
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional["PageArchive"]:
+        """Create archive from application config ("archive" section), None if the archive is switched off
+        """
+        archive = config.get("archive", {})
+        if archive.get("enabled", "N") != "Y":
+            return None
+        return cls(get_path("output", "archive"), archive.get("level", 6))
+
+    @staticmethod
+    def file_name(day: date) -> str:
+        return "{}.pages".format(day.isoformat())
+
+    def put(self, url: str, content: Optional[bytes], day: Optional[date] = None, not_found: bool = False) -> bool:
+        """Archive downloaded page, None content (304 Not Modified, page taken from crawl checkpoint) refers
+        to the last archived version
+
+        Args:
+            url (str): url of the page
+            content (Optional[bytes]): html code of the page, None if it didn't change since the last download
+            day (Optional[date]): day of the crawl (download date of its data), default today
+            not_found (bool): page was not found (404), content is not stored
+
+        Returns:
+            bool: False if page was not modified but it has never been archived
+        """
+        day = day or date.today()
+        content_hash = hashlib.sha256(content).hexdigest() if content is not None else None
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                last = self._conn.execute(
+                    "select file, offset, length, content_hash from archive_page where url = ? "
+                    "order by fetched_at desc limit 1", (url,)).fetchone()
+                if not_found:
+                    last = ("", 0, -1, "")
+                elif content is None and last is None:
+                    self._conn.execute("ROLLBACK")
+                    return False
+                elif content is not None and (last is None or last[3] != content_hash):
+                    data = zlib.compress(content, self.level)
+                    file = self.file_name(day)
+                    with open(os.path.join(self.directory, file), "ab") as archive_file:
+                        # appends are serialized by the write lock of the index
+                        offset = archive_file.seek(0, os.SEEK_END)
+                        archive_file.write(data)
+                    last = (file, offset, len(data), content_hash)
+                self._conn.execute("insert or replace into archive_page values (?, ?, ?, ?, ?, ?, ?)",
+                                   (day.isoformat(), url, time.time()) + tuple(last))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def get(self, day: date, url: str) -> Optional[bytes]:
+        """Return page archived by the crawl of the given day, None if it is not in the archive or it was
+        not found by the crawl (see not_found)
+        """
+        with self._lock:
+            row = self._conn.execute("select file, offset, length from archive_page where day = ? and url = ?",
+                                     (day.isoformat(), url)).fetchone()
+            if row is None or row[2] < 0:
+                return None
+            file, offset, length = row
+            archive_map = self._maps.get(file)
+            if archive_map is None or offset + length > len(archive_map):
+                # file grew since it was mapped
+                if archive_map is not None:
+                    archive_map.close()
+                with open(os.path.join(self.directory, file), "rb") as archive_file:
+                    archive_map = self._maps[file] = mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ)
+            data = archive_map[offset:offset + length]
+        return zlib.decompress(data)
+
+    def not_found(self, day: date, url: str) -> bool:
+        """Check if the page was not found (404) by the crawl of the given day
+        """
+        with self._lock:
+            return self._conn.execute("select 1 from archive_page where day = ? and url = ? and length < 0",
+                                      (day.isoformat(), url)).fetchone() is not None
+
+    def pages(self, day: date) -> int:
+        """Return nbr of pages archived by the crawl of the given day
+        """
+        with self._lock:
+            return self._conn.execute("select count(*) from archive_page where day = ?",
+                                      (day.isoformat(),)).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            for archive_map in self._maps.values():
+                archive_map.close()
+            self._maps = {}
+            self._conn.close()
+
+
+class ArchiveSession:
+    """Replacement of HttpSession serving pages archived by the crawl of one day - replay without network
+    """
+
+    def __init__(self, archive: PageArchive, day: date) -> None:
+        self.archive = archive
+        self.day = day
+
+    def __repr__(self):
+        return "<ArchiveSession({}, {})>".format(self.archive.directory, self.day)
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """Return archived page as response, page missing in the archive is 404 Not archived, page not found
+        by the crawl is 404 Not Found as it was
+
+        Raises:
+            requests.exceptions.HTTPError: when the page is not in the archive or it was not found by the crawl
+        """
+        start = time.perf_counter()
+        content = self.archive.get(self.day, url)
+        response = requests.Response()
+        response.url = url
+        response.status_code = 200 if content is not None else 404
+        if content is not None:
+            response.reason = "OK"
+        else:
+            response.reason = "Not Found" if self.archive.not_found(self.day, url) else NOT_ARCHIVED
+        response._content = content or b""
+        metrics.record("archive_read", time.perf_counter() - start, url=url, status=response.status_code,
+                       bytes=len(response.content))
+        response.raise_for_status()
+        return response
+
+    def close(self) -> None:
+        self.archive.close()
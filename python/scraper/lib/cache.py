@@ -0,0 +1,149 @@
+from lib.support_functions import get_path, running_script_name
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional
+
+logger = logging.getLogger(running_script_name(__name__))
+
+CACHE_DDL = """
+CREATE TABLE IF NOT EXISTS http_cache
+(
+ url TEXT PRIMARY KEY,
+ version TEXT NOT NULL,
+ etag TEXT,
+ last_modified TEXT,
+ content_hash TEXT NOT NULL,
+ payload TEXT NOT NULL,
+ size INTEGER NOT NULL,
+ fetched_at REAL NOT NULL,
+ used_at REAL NOT NULL
+)
+"""
+
+
+class CacheEntry(NamedTuple):
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_hash: str
+    payload: Any
+
+    def validators(self) -> Dict[str, str]:
+        """Return headers for conditional GET
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    """On-disk cache of listing pages for conditional GET.
+
+    Stores validators (ETag, Last-Modified) and content hash of every page together with the result parsed
+    from it, so unchanged pages are neither downloaded again nor parsed. Every entry has the version of the code
+    that parsed it - entry of another version is a miss, the page is downloaded and parsed again. Entries are
+    evicted by version, by age and by total size (least recently used first). The cache is shared by worker
+    processes, it runs in WAL journal mode and writers wait for each other.
+    """
+
+    def __init__(self, path: str, max_age_days: float = 7, max_size_mb: float = 100, version: str = "") -> None:
+        """
+        Args:
+            path (str): path to the cache database
+            max_age_days (float): entries not used for longer time are evicted
+            max_size_mb (float): max size of cached payloads, least recently used entries are evicted first
+            version (str): version of parsed results (parser_version of scraper)
+        """
+        self.path = path
+        self.max_age = max_age_days * 24 * 3600
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.version = version
+        self._lock = threading.Lock()
+        # writers from other processes are waited for
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        if "version" not in {row[1] for row in self._conn.execute("PRAGMA table_info(http_cache)")}:
+            # cache of results without version can't be trusted
+            self._conn.execute("DROP TABLE IF EXISTS http_cache")
+        self._conn.execute(CACHE_DDL)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS http_cache_used_at ON http_cache (used_at)")
+        self._conn.commit()
+
+    def __repr__(self):
+        return "<HttpCache({})>".format(self.path)
+
+    @classmethod
+    def from_config(cls, config: Dict, version: str = "") -> Optional["HttpCache"]:
+        """Create cache from application config ("cache" section), None if the cache is switched off
+        """
+        cache = config.get("cache", {})
+        if cache.get("enabled", "N") != "Y":
+            return None
+        return cls(get_path("output", "http_cache.db"), cache.get("max_age_days", 7), cache.get("max_size_mb", 100),
+                   version)
+
+    @staticmethod
+    def content_hash(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                "select url, etag, last_modified, content_hash, payload from http_cache where url = ? and version = ?",
+                (url, self.version)).fetchone()
+        if row is None:
+            return None
+        return CacheEntry(*row[:4], json.loads(row[4]))
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str], content_hash: str, payload: Any) -> None:
+        data = json.dumps(payload, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("insert or replace into http_cache values (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               (url, self.version, etag, last_modified, content_hash, data, len(data.encode("utf8")),
+                                now, now))
+            self._conn.commit()
+
+    def touch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        """Mark entry as used (and valid), refresh validators sent by server
+        """
+        with self._lock:
+            self._conn.execute("update http_cache set used_at = ?, etag = coalesce(?, etag), "
+                               "last_modified = coalesce(?, last_modified) where url = ? and version = ?",
+                               (time.time(), etag, last_modified, url, self.version))
+            self._conn.commit()
+
+    def evict(self) -> int:
+        """Remove entries of other versions and entries older than max age, then least recently used entries
+        over max size
+
+        Returns:
+            int: nbr of evicted entries
+        """
+        with self._lock:
+            evicted = self._conn.execute("delete from http_cache where version <> ? or used_at < ?",
+                                         (self.version, time.time() - self.max_age)).rowcount
+            total = self._conn.execute("select coalesce(sum(size), 0) from http_cache").fetchone()[0]
+            if total > self.max_size:
+                # running total from the most recently used entry, delete everything over the limit
+                evicted += self._conn.execute("""
+                    delete from http_cache where url in (
+                     select url from (
+                      select url, sum(size) over (order by used_at desc, url) as running_size from http_cache)
+                     where running_size > ?)""", (self.max_size,)).rowcount
+            self._conn.commit()
+        if evicted:
+            logger.info(f"{evicted} entries evicted from http cache.")
+        return evicted
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
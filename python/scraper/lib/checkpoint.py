@@ -0,0 +1,113 @@
+from lib.support_functions import get_path, running_script_name
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(running_script_name(__name__))
+
+CHECKPOINT_DDL = """
+CREATE TABLE IF NOT EXISTS crawl_page
+(
+ url TEXT PRIMARY KEY,
+ typ_nemovistosti TEXT NOT NULL,
+ region TEXT NOT NULL,
+ last_page INTEGER,
+ rows TEXT NOT NULL,
+ done_at REAL NOT NULL
+)
+"""
+RUN_DDL = """
+CREATE TABLE IF NOT EXISTS crawl_run
+(
+ run_key TEXT NOT NULL,
+ started_at REAL NOT NULL
+)
+"""
+
+
+class CrawlCheckpoint:
+    """Progress of the running crawl - parsed rows of every completed listing page.
+
+    Crawl that failed (e.g. on page 180 of Praha) is resumed by the next run, completed pages are not requested
+    again. Progress is cleared when the snapshot is saved and historised, or when it is older than max age.
+    """
+
+    def __init__(self, path: str, max_age_hours: float = 24) -> None:
+        """
+        Args:
+            path (str): path to the checkpoint database
+            max_age_hours (float): older unfinished crawl is started again from scratch
+        """
+        self.path = path
+        self.max_age = max_age_hours * 3600
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(CHECKPOINT_DDL)
+        self._conn.execute(RUN_DDL)
+        self._conn.commit()
+
+    def __repr__(self):
+        return "<CrawlCheckpoint({})>".format(self.path)
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional["CrawlCheckpoint"]:
+        """Create checkpoint from application config ("checkpoint" section), None if it is switched off
+        """
+        checkpoint = config.get("checkpoint", {})
+        if checkpoint.get("enabled", "N") != "Y":
+            return None
+        return cls(get_path("output", "crawl_checkpoint.db"), checkpoint.get("max_age_hours", 24))
+
+    def begin(self, run_key: str) -> int:
+        """Start the crawl - resume unfinished crawl with the same key or start a new one
+
+        Args:
+            run_key (str): identification of the crawl (url, property types, mode)
+
+        Returns:
+            int: nbr of already completed pages
+        """
+        with self._lock:
+            run = self._conn.execute("select run_key, started_at from crawl_run").fetchone()
+            if run is not None and run[0] == run_key and time.time() - run[1] < self.max_age:
+                return self._conn.execute("select count(*) from crawl_page").fetchone()[0]
+            self._conn.execute("delete from crawl_page")
+            self._conn.execute("delete from crawl_run")
+            self._conn.execute("insert into crawl_run values (?, ?)", (run_key, time.time()))
+            self._conn.commit()
+        return 0
+
+    def get(self, url: str) -> Optional[Tuple[List[Dict[str, Any]], Optional[int]]]:
+        """Return parsed rows and total nbr of pages (first pages only) of completed page
+        """
+        with self._lock:
+            row = self._conn.execute("select rows, last_page from crawl_page where url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, url: str, prop_type: str, region: str, rows: List[Dict[str, Any]],
+            last_page: Optional[int] = None) -> None:
+        data = json.dumps(rows, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute("insert or replace into crawl_page values (?, ?, ?, ?, ?, ?)",
+                               (url, prop_type, region, last_page, data, time.time()))
+            self._conn.commit()
+
+    def finish(self) -> None:
+        """Clear progress of the completed crawl
+        """
+        with self._lock:
+            pages = self._conn.execute("delete from crawl_page").rowcount
+            self._conn.execute("delete from crawl_run")
+            self._conn.commit()
+        logger.info(f"Crawl completed, checkpoint of {pages} pages cleared.")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
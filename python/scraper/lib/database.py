@@ -1,61 +1,443 @@
 import os
 import logging
 import sqlite3
-from typing import Dict
-from pandas import DataFrame
+from contextlib import contextmanager
+from datetime import date
+from time import perf_counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from pandas import DataFrame, concat, read_sql
+from pandas.api.types import is_datetime64_any_dtype
+from lib.metrics import metrics
+from lib.parser import parse_ad_id
 from lib.support_functions import get_path, running_script_name
 
 logger = logging.getLogger(running_script_name(__name__))
 
+# columns of the stage table in the order of parameters of stage_dml, ad_id is added by create_df
+STAGE_COLUMNS = ["cena_nemovitosti", "dispozice_nemovitosti", "odkaz", "region", "rozloha", "typ_nemovistosti",
+                 "datum_stazeni", "ad_id"]
+# attributes from detail pages in the order of parameters of detail_dml, ad_id is parsed from odkaz
+DETAIL_COLUMNS = ["ad_id", "cena_nemovitosti", "podlazi", "typ_budovy", "vlastnictvi", "energeticka_trida", "lat", "lng"]
+# tables keyed by link (odkaz) before integer ad ids, converted by Database.migrate
+LEGACY_TABLES = ["Realty_stg", "H_Realty", "Realty_detail"]
+
 
 class Database:
     """Class for saving and historisation of scraper data.
+
+    All statements go through one connection in autocommit mode, transactions are explicit. The database
+    runs in WAL journal mode with synchronous=NORMAL - commits don't wait for fsync of the whole database
+    and readers are not blocked by the load.
+
+    History is stored in normalised layout - ads are keyed by integer id parsed from the link (Realty_ad keeps
+    the link once per ad), property type, region and disposition are ids of dimension tables and dates are
+    YYYYMMDD integers. View V_Realty shows the history with links, texts and ISO dates.
     """
 
-    def __init__(self, df: DataFrame, sql: Dict) -> None:
+    def __init__(self, df: Optional[DataFrame], sql: Dict, full_snapshot: bool = True) -> None:
+        """
+        Args:
+            df (Optional[DataFrame]): scraped data, None when only reading the history
+            sql (Dict): sql statements
+            full_snapshot (bool): data contains all open ads, False for incremental crawl - deleted ads are not detected
+        """
         self.df = df
+        self.full_snapshot = full_snapshot
         self.ddl = sql['ddl']
         self.h_ddl = sql['h_ddl']
+        self.h_view_ddl = sql['h_view_ddl']
+        self.dim_ddl = sql['dim_ddl']
+        self.ad_ddl = sql['ad_ddl']
+        self.dim_dml = sql['dim_dml']
+        self.ad_dml = sql['ad_dml']
+        self.crawl_log_ddl = sql['crawl_log_ddl']
+        self.same_day_deleted_dml = sql['same_day_deleted_dml']
         self.deleted_dml = sql['deleted_dml']
+        self.same_day_changed_dml = sql['same_day_changed_dml']
         self.changed_dml = sql['changed_dml']
         self.new_dml = sql['new_dml']
+        self.crawl_log_dml = sql['crawl_log_dml']
+        self.last_full_sweep = sql['last_full_sweep']
+        self.last_run = sql['last_run']
+        self.open_ads = sql['open_ads']
+        self.stage_data = sql['stage_data']
+        self.stage_dml = sql['stage_dml']
+        self.report_trend_ddl = sql['report_trend_ddl']
+        self.report_activity_ddl = sql['report_activity_ddl']
+        self.report_since = sql['report_since']
+        self.report_trend_dml = sql['report_trend_dml']
+        self.report_activity_dml = sql['report_activity_dml']
+        self.report_trend_data = sql['report_trend_data']
+        self.report_activity_data = sql['report_activity_data']
+        self.report_snapshot = {"history": sql['report_snapshot_history'], "stage": sql['report_snapshot_stage']}
+        self.detail_ddl = sql['detail_ddl']
+        self.detail_candidates = sql['detail_candidates']
+        self.detail_dml = sql['detail_dml']
+        self.migrate_dml = sql['migrate_dml']
         self.scraper_database = get_path("output", "scraper_data.db")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def connect(self) -> sqlite3.Connection:
+        """Return shared connection, opened on first use
+        """
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.scraper_database, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        return self._conn
 
-    def create_table(self) -> None:
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run statements in one explicit transaction, rollback on any exception
+        """
+        conn = self.connect()
+        conn.execute("BEGIN")
         try:
-            with sqlite3.connect(self.scraper_database) as conn:
-                cur = conn.cursor()
-                cur.execute(self.ddl)
-                cur.execute(self.h_ddl)
-        except Exception as ex:
-            logger.exception("Exception occurred:")
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
 
-    def insert(self) -> None:
-        logger.info(f"Inserting new records to stage table: scraper_data.Realty_stg.")
+    def create_table(self) -> bool:
+        """Migrate legacy database and create missing tables
+
+        Returns:
+            bool: False if the database could not be migrated or created - nothing can be stored to it
+        """
         try:
-            with sqlite3.connect(self.scraper_database) as conn:
-                cur = conn.cursor()
-                cur.execute("delete from Realty_stg")
-                self.df.to_sql("Realty_stg", conn, index=False, if_exists="append")
-                logger.info(f"{len(self.df.index)} rows have been inserted to stage.")
+            self.migrate()
+            with self.transaction() as conn:
+                self.create_schema(conn.cursor())
         except Exception as ex:
             logger.exception("Exception occurred:")
+            return False
+        return True
+
+    def create_schema(self, cur: sqlite3.Cursor) -> None:
+        cur.execute(self.ddl)
+        for ddl in self.dim_ddl:
+            cur.execute(ddl)
+        cur.execute(self.ad_ddl)
+        cur.execute(self.h_ddl)
+        # partial index on open versions of earlier releases gave no stable gain, it only slowed down writes
+        cur.execute("DROP INDEX IF EXISTS H_Realty_open")
+        cur.execute(self.h_view_ddl)
+        cur.execute(self.crawl_log_ddl)
+        cur.execute(self.detail_ddl)
+
+    def file_size(self) -> int:
+        """Return size of the database file including its write-ahead log
+        """
+        return sum(os.path.getsize(path) for path in (self.scraper_database, self.scraper_database + "-wal")
+                   if os.path.isfile(path))
+
+    def migrate(self) -> bool:
+        """Convert database keyed by links (H_Realty with odkaz) to the normalised layout
+
+        Legacy tables are renamed and copied to the new tables in one transaction - ad ids are parsed from links,
+        texts are moved to dimension tables, dates are converted to YYYYMMDD integers. The file is vacuumed
+        afterwards, size before and after is logged.
+
+        Raises:
+            ValueError: when links of different ads share the ad id - their versions would be merged,
+                the database is left in the legacy layout
+
+        Returns:
+            bool: True if the database has been migrated
+        """
+        conn = self.connect()
+        if "odkaz" not in {row[1] for row in conn.execute("PRAGMA table_info(H_Realty)")}:
+            return False
+        tables = [table for table in LEGACY_TABLES
+                  if conn.execute("select 1 from sqlite_master where type = 'table' and name = ?", (table,)).fetchone()]
+        size = self.file_size()
+        logger.info(f"Migrating {', '.join(tables)} to integer ad ids and dimension tables.")
+        start = perf_counter()
+        conn.create_function("ad_id", 1, parse_ad_id, deterministic=True)
+        for table in tables:
+            collisions = conn.execute(f"select odkaz from {table} where ad_id(odkaz) in ("
+                                      f"select ad_id(odkaz) from {table} group by 1 having count(distinct odkaz) > 1) "
+                                      f"group by odkaz order by ad_id(odkaz), odkaz").fetchall()
+            if collisions:
+                logger.error(f"Links sharing ad id in {table}: {', '.join(link for link, in collisions)}")
+                raise ValueError(f"{len(collisions)} links of {table} share {len({parse_ad_id(link) for link, in collisions})} "
+                                 f"ad id(s), database is not migrated")
+        with metrics.timer("migrate", bytes=size) as record, self.transaction() as conn:
+            cur = conn.cursor()
+            # partial index of the legacy table is not used any more
+            cur.execute("DROP INDEX IF EXISTS H_Realty_open")
+            for table in tables:
+                cur.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+            self.create_schema(cur)
+            for table in tables:
+                for dml in self.migrate_dml[table]:
+                    cur.execute(dml)
+                # the last statement copies rows of the table
+                record[table] = cur.rowcount
+                cur.execute(f"DROP TABLE {table}_legacy")
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        logger.info(f"Database migrated in {perf_counter() - start:.2f}s, "
+                    f"size {size / 2 ** 20:.1f} MB -> {self.file_size() / 2 ** 20:.1f} MB.")
+        return True
+
+    @staticmethod
+    def to_records(df: DataFrame) -> List[Tuple]:
+        """Convert data to tuples of python values in the order of STAGE_COLUMNS
+
+        Dates are converted to ISO format (YYYY-MM-DD) used in sql statements, missing values to None,
+        id of the ad is taken from ad_id column of create_df (parsed from link for data without it).
+
+        Args:
+            df (DataFrame): cleaned data
+
+        Returns:
+            List[Tuple]: rows ready for executemany
+        """
+        columns = []
+        for column in STAGE_COLUMNS:
+            if column == "ad_id" and column not in df:
+                columns.append([parse_ad_id(link) for link in df["odkaz"].tolist()])
+                continue
+            values = df[column]
+            if is_datetime64_any_dtype(values):
+                values = values.dt.strftime("%Y-%m-%d")
+            if values.hasnans:
+                columns.append([None if value != value else value for value in values.tolist()])
+            else:
+                columns.append(values.tolist())
+        return list(zip(*columns))
+
+    def insert(self) -> Optional[int]:
+        return self.insert_batches([self.df])
+
+    def insert_batches(self, batches: Iterable[DataFrame]) -> Optional[int]:
+        """Replace stage data with data streamed in batches, every batch is appended as soon as it arrives
+
+        The whole load is one transaction - stage is never left half loaded. Batch that fails aborts the load,
+        the transaction is rolled back and the previous stage is kept - stage with missing ads would close them
+        as deleted in historisation.
+
+        The transaction starts before the first batch, so the write lock of the database is held while the crawl
+        runs. Readers are not blocked (WAL), another writer waits until the load is finished.
+
+        Args:
+            batches (Iterable[DataFrame]): cleaned data in batches
+
+        Returns:
+            Optional[int]: nbr of inserted rows, None if a batch failed and the load was rolled back
+        """
+        logger.info(f"Inserting new records to stage table in batches: scraper_data.Realty_stg.")
+        row_count = 0
+        start = perf_counter()
+        try:
+            with self.transaction() as conn:
+                conn.execute("delete from Realty_stg")
+                for batch in batches:
+                    with metrics.timer("insert", rows=len(batch.index)):
+                        conn.executemany(self.stage_dml, self.to_records(batch))
+                    row_count += len(batch.index)
+        except sqlite3.Error as ex:
+            logger.exception(f"Batch could not be inserted to stage after {row_count} rows, stage load is rolled back:")
+            return None
+        elapsed = perf_counter() - start
+        logger.info(f"{row_count} rows have been inserted to stage in {elapsed:.2f}s "
+                    f"({row_count / elapsed if elapsed else 0:.0f} rows/s).")
+        return row_count
+
+    def read_stage(self, prop_type: str) -> DataFrame:
+        """Return stage data of one property type
+
+        Args:
+            prop_type (str): type of the property
+
+        Returns:
+            DataFrame: stage data
+        """
+        return read_sql(self.stage_data, self.connect(), params=(prop_type,))
+
+    @staticmethod
+    def execute_dml(cur: sqlite3.Cursor, name: str, dml: str) -> int:
+        """Execute statement of historisation, time and nbr of affected rows are recorded in metrics
+        """
+        with metrics.timer("historisation", statement=name) as record:
+            record["rows"] = cur.execute(dml).rowcount
+        return record["rows"]
 
-    def historisation(self) -> None:
+    def historisation(self) -> bool:
+        """Close deleted and repriced ads and open new versions in one transaction
+
+        New property types, regions, dispositions and links are added to dimension tables and Realty_ad first.
+        Every statement scans H_Realty once and looks ads up in stage by ad id (new versions by the primary
+        key of H_Realty), a failure rolls back the whole step - no ad is closed without its successor.
+
+        Version opened on the day of the crawl by an earlier run of the same day (hourly incremental crawl) is
+        not closed - its price is updated in place and it is removed when the ad is deleted, so there are no
+        versions of zero length and at most one version of an ad ends on a day.
+
+        Returns:
+            bool: True if history has been updated
+        """
         logger.info("Historization starts scraper_data.H_Realty.")
         try:
-            with sqlite3.connect(self.scraper_database) as conn:
+            with self.transaction() as conn:
                 cur = conn.cursor()
-                row_count=cur.execute(self.deleted_dml).rowcount
-                logger.info(f"{row_count} ad(s) was deleted from web.")
-                row_count=cur.execute(self.changed_dml).rowcount
+                for dml in self.dim_dml:
+                    cur.execute(dml)
+                self.execute_dml(cur, "ad_dml", self.ad_dml)
+                if self.full_snapshot:
+                    row_count=self.execute_dml(cur, "same_day_deleted_dml", self.same_day_deleted_dml)
+                    row_count+=self.execute_dml(cur, "deleted_dml", self.deleted_dml)
+                    logger.info(f"{row_count} ad(s) was deleted from web.")
+                else:
+                    logger.info("Incremental crawl - deleted ads are detected in the next full sweep.")
+                row_count=self.execute_dml(cur, "same_day_changed_dml", self.same_day_changed_dml)
+                row_count+=self.execute_dml(cur, "changed_dml", self.changed_dml)
                 logger.info(f"{row_count} ad(s) changed the price.")
-                row_count=cur.execute(self.new_dml).rowcount
+                row_count=self.execute_dml(cur, "new_dml", self.new_dml)
                 logger.info(f"{row_count} new ad(s) was published.")
+                cur.execute(self.crawl_log_dml, (int(self.full_snapshot),))
         except Exception as ex:
             logger.exception("Exception occurred:")
+            return False
+        return True
 
-    def save_to_db(self) -> None:
+    def read_report_data(self, prop_type: str, source: str = "history", chunksize: int = 10000) -> DataFrame:
+        """Return the latest snapshot of one property type with columns needed by the report only
+
+        Rows are read in chunks, numbers are stored as int32.
+
+        Args:
+            prop_type (str): type of the property
+            source (str): history - open ads in H_Realty, stage - the last crawl in Realty_stg
+            chunksize (int): nbr of rows read at once
+
+        Returns:
+            DataFrame: snapshot for the report
+        """
+        if source not in self.report_snapshot:
+            raise ValueError("Unknown report source {}, use one of: {}".format(source, ", ".join(self.report_snapshot)))
+        chunks = [chunk.astype({"rozloha": "int32", "cena_nemovitosti": "int32"})
+                  for chunk in read_sql(self.report_snapshot[source], self.connect(), params=(prop_type,),
+                                        chunksize=chunksize)]
+        if not chunks:
+            return DataFrame(columns=["typ_nemovistosti", "region", "dispozice_nemovitosti", "rozloha",
+                                      "cena_nemovitosti"])
+        return concat(chunks, ignore_index=True)
+
+    def refresh_report_tables(self) -> None:
+        """Materialise median price per m² by region and counts of new, deleted and repriced ads per day
+
+        Summary tables are computed from history in SQL, only days since the last refresh are computed again.
+        """
+        start = perf_counter()
+        with metrics.timer("report_tables"), self.transaction() as conn:
+            conn.execute(self.report_trend_ddl)
+            conn.execute(self.report_activity_ddl)
+            since = conn.execute(self.report_since).fetchone()[0]
+            conn.execute("delete from Report_price_trend where report_date >= ?", (since,))
+            conn.execute("delete from Report_activity where report_date >= ?", (since,))
+            conn.execute(self.report_trend_dml, {"since": since})
+            conn.execute(self.report_activity_dml, {"since": since})
+        logger.info(f"Report tables refreshed since {since} in {perf_counter() - start:.2f}s.")
+
+    def read_trends(self, prop_type: str) -> Tuple[DataFrame, DataFrame]:
+        """Return materialised price trend and daily activity of one property type
+
+        Args:
+            prop_type (str): type of the property
+
+        Returns:
+            Tuple[DataFrame, DataFrame]: median price per m² by day and region, counts of ads by day
+        """
+        conn = self.connect()
+        return (read_sql(self.report_trend_data, conn, params=(prop_type,)),
+                read_sql(self.report_activity_data, conn, params=(prop_type,)))
+
+    def get_open_ads(self) -> Dict[str, int]:
+        """Return link and current price of all open ads in history
+        """
+        self.create_table()
+        return dict(self.connect().execute(self.open_ads).fetchall())
+
+    def get_detail_candidates(self) -> List[Tuple[str, int]]:
+        """Return link and price of open ads without details - new ads, repriced ads and ads not enriched yet
+
+        Details are stored with the price they were downloaded at, unchanged ads are never requested again.
+        """
         self.create_table()
-        self.insert()
-        self.historisation()
+        return self.connect().execute(self.detail_candidates).fetchall()
+
+    def save_details(self, details: Iterable[Dict[str, Any]], batch_size: int = 100) -> int:
+        """Save attributes from detail pages to Realty_detail, every batch is committed as soon as it is complete
+
+        Details saved before a failure are kept - they are not requested again by the next run.
+
+        Args:
+            details (Iterable[Dict[str, Any]]): detail of ad with link and price
+            batch_size (int): nbr of details committed at once
+
+        Returns:
+            int: nbr of saved details
+        """
+        row_count = 0
+        batch: List[Tuple] = []
+        for detail in details:
+            batch.append((parse_ad_id(detail["odkaz"]),) + tuple(detail.get(column) for column in DETAIL_COLUMNS[1:]))
+            if len(batch) >= batch_size:
+                row_count += self.insert_details(batch)
+                batch = []
+        if batch:
+            row_count += self.insert_details(batch)
+        logger.info(f"{row_count} ad detail(s) saved to scraper_data.Realty_detail.")
+        return row_count
+
+    def insert_details(self, rows: List[Tuple]) -> int:
+        with metrics.timer("insert_details", rows=len(rows)), self.transaction() as conn:
+            conn.executemany(self.detail_dml, rows)
+        return len(rows)
+
+    def full_sweep_due(self, days: int) -> bool:
+        """Check if the last full crawl is older than given nbr of days
+        """
+        self.create_table()
+        last_full_sweep = self.connect().execute(self.last_full_sweep).fetchone()[0]
+        return last_full_sweep is None or (date.today() - date.fromisoformat(last_full_sweep)).days >= days
+
+    def can_replay(self, day: date) -> bool:
+        """Check that history doesn't contain crawls after the given day - historisation of an older snapshot
+        would close versions before they started and reopen stale prices
+        """
+        self.create_table()
+        last_run = self.connect().execute(self.last_run).fetchone()[0]
+        return last_run is None or date.fromisoformat(last_run) <= day
+
+    def save_to_db(self) -> None:
+        if self.create_table() and self.insert() is not None:
+            self.historisation()
+
+    def stream_to_db(self, batches: Iterable[DataFrame]) -> bool:
+        """Save data streamed in batches from scraper, historisation runs after the last batch
+
+        Crawl that fails raises from batches, batch that can't be inserted aborts the load - in both cases
+        stage load is rolled back and history is not touched.
+
+        Args:
+            batches (Iterable[DataFrame]): cleaned data in batches
+
+        Returns:
+            bool: True if history has been updated
+        """
+        if not self.create_table():
+            logger.error("Database is not ready, snapshot is not stored.")
+            return False
+        if self.insert_batches(batches) is None:
+            logger.error("Stage load failed, historisation is skipped.")
+            return False
+        return self.historisation()
@@ -0,0 +1,53 @@
+from lib.parser import parse_ad_id
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class AdDeduplicator:
+    """Streaming de-duplication of parsed ads by id of the ad parsed from link (odkaz) - the key of the stage table.
+
+    Listings shift between pages while the crawl paginates - ad pushed to the next page by a new ad is scraped
+    twice. Only the first occurrence of every ad passes, links of the same ad with different slugs are
+    duplicates too. Seen ads are kept as integer ids, not as texts. Passed ads carry their id (ad_id),
+    so it is parsed once per ad - create_df and the stage load take it from there.
+    Duplicate first seen in the same section (property type x region) is counted as page shift, duplicate
+    from another section as cross-section duplicate.
+    """
+
+    def __init__(self) -> None:
+        self._seen: Set[int] = set()
+        self._section: Optional[Tuple[str, str]] = None
+        self._section_seen: Set[int] = set()
+        self.ads = 0
+        self.duplicates = 0
+        self.page_shifts = 0
+
+    def __repr__(self):
+        return "<AdDeduplicator({} ads, {} duplicates, {} page shifts)>".format(
+            self.ads, self.duplicates, self.page_shifts)
+
+    def filter(self, parsed_page: List[Dict[str, Optional[str]]]) -> List[Dict[str, Optional[str]]]:
+        """Return ads of the page not seen before, pages have to come section by section
+
+        Args:
+            parsed_page (List[Dict[str, Optional[str]]]): parsed ads from one page
+
+        Returns:
+            List[Dict[str, Optional[str]]]: ads seen for the first time with their id (ad_id)
+        """
+        unique = []
+        for ad in parsed_page:
+            section = (ad["typ_nemovistosti"], ad["region"])
+            if section != self._section:
+                self._section = section
+                self._section_seen = set()
+            key = parse_ad_id(ad["odkaz"])
+            self.ads += 1
+            if key in self._seen:
+                self.duplicates += 1
+                if key in self._section_seen:
+                    self.page_shifts += 1
+                continue
+            self._seen.add(key)
+            self._section_seen.add(key)
+            unique.append(dict(ad, ad_id=key))
+        return unique
@@ -0,0 +1,158 @@
+from lib.metrics import metrics
+from lib.support_functions import get_path, running_script_name
+from datetime import date
+import glob
+import logging
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from pandas import DataFrame
+
+logger = logging.getLogger(running_script_name(__name__))
+
+
+class SnapshotExport:
+    """Columnar copy of scraped snapshots - Parquet dataset partitioned by date of the crawl.
+
+    Every full crawl is written to daily partition daily/YYYY-MM-DD.parquet, compaction rolls daily partitions
+    of finished months to monthly/YYYY-MM.parquet. Texts are dictionary encoded, numbers are int32, all files
+    have the same schema, so the whole directory is read as one dataset.
+    """
+
+    def __init__(self, directory: str, row_group_size: int = 100000) -> None:
+        """
+        Args:
+            directory (str): root directory of the dataset
+            row_group_size (int): nbr of rows buffered and written as one row group
+        """
+        # imported here, pyarrow is needed only when the export is switched on
+        import pyarrow
+        import pyarrow.parquet
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.directory = directory
+        self.row_group_size = row_group_size
+        text = pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+        self.schema = pyarrow.schema([
+            ("typ_nemovistosti", text),
+            ("region", text),
+            ("dispozice_nemovitosti", text),
+            ("rozloha", pyarrow.int32()),
+            ("cena_nemovitosti", pyarrow.int32()),
+            ("odkaz", pyarrow.string()),
+            ("datum_stazeni", pyarrow.date32())])
+
+    def __repr__(self):
+        return "<SnapshotExport({})>".format(self.directory)
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional["SnapshotExport"]:
+        """Create export from application config ("export" section), None if the export is switched off
+        """
+        export = config.get("export", {})
+        if export.get("enabled", "N") != "Y":
+            return None
+        return cls(get_path("output", "snapshots"), export.get("row_group_size", 100000))
+
+    def daily_path(self, day: date) -> str:
+        return os.path.join(self.directory, "daily", "{}.parquet".format(day.isoformat()))
+
+    def monthly_path(self, month: str) -> str:
+        return os.path.join(self.directory, "monthly", "{}.parquet".format(month))
+
+    @staticmethod
+    def tmp_path(path: str) -> str:
+        """Return path of the file being written - hidden files are skipped by dataset discovery
+        """
+        return os.path.join(os.path.dirname(path), ".{}.tmp".format(os.path.basename(path)))
+
+    def to_table(self, df: DataFrame) -> Any:
+        """Convert cleaned data (create_df) to arrow table of the dataset schema
+        """
+        table = self._pa.Table.from_pandas(df, preserve_index=False)
+        return table.select(self.schema.names).cast(self.schema)
+
+    def write(self, batches: Iterable[DataFrame]) -> Iterator[DataFrame]:
+        """Pass batches through and write them to daily partition of their download date
+
+        The partition is written to a temporary file and renamed when the last batch has passed, crawl that
+        fails leaves the previous partition untouched.
+
+        Args:
+            batches (Iterable[DataFrame]): cleaned data in batches, all batches have the same download date
+
+        Yields:
+            Iterator[DataFrame]: the same batches
+        """
+        writer = None
+        buffered: List[Any] = []
+        buffered_rows = 0
+        try:
+            for batch in batches:
+                if len(batch.index):
+                    with metrics.timer("export", rows=len(batch.index)):
+                        if writer is None:
+                            path = self.daily_path(batch["datum_stazeni"].iloc[0].date())
+                            os.makedirs(os.path.dirname(path), exist_ok=True)
+                            writer = self._pq.ParquetWriter(self.tmp_path(path), self.schema)
+                        buffered.append(self.to_table(batch))
+                        buffered_rows += len(batch.index)
+                        if buffered_rows >= self.row_group_size:
+                            writer.write_table(self._pa.concat_tables(buffered), self.row_group_size)
+                            buffered, buffered_rows = [], 0
+                yield batch
+            if buffered:
+                writer.write_table(self._pa.concat_tables(buffered), self.row_group_size)
+        except BaseException:
+            if writer is not None:
+                writer.close()
+                os.remove(self.tmp_path(path))
+            raise
+        if writer is not None:
+            writer.close()
+            os.replace(self.tmp_path(path), path)
+            logger.info(f"Snapshot exported to {path}.")
+
+    def compact(self, before: Optional[date] = None) -> List[str]:
+        """Roll daily partitions of months before the given date to monthly partitions
+
+        Daily partitions arriving after the month was compacted are merged to the existing monthly partition.
+        Dictionaries of the text columns are unified, the monthly partition is sorted by download date.
+
+        Args:
+            before (Optional[date]): only months finished before this date are compacted, default today
+
+        Returns:
+            List[str]: compacted months (YYYY-MM)
+        """
+        current_month = (before or date.today()).isoformat()[:7]
+        months: Dict[str, List[str]] = {}
+        for path in sorted(glob.glob(os.path.join(self.directory, "daily", "*.parquet"))):
+            month = os.path.basename(path)[:7]
+            if month < current_month:
+                months.setdefault(month, []).append(path)
+
+        for month, daily_paths in months.items():
+            with metrics.timer("compact") as record:
+                monthly_path = self.monthly_path(month)
+                paths = ([monthly_path] if os.path.isfile(monthly_path) else []) + daily_paths
+                table = self._pa.concat_tables(self.read(path) for path in paths)
+                table = table.sort_by("datum_stazeni").unify_dictionaries().combine_chunks()
+                os.makedirs(os.path.dirname(monthly_path), exist_ok=True)
+                self._pq.write_table(table, self.tmp_path(monthly_path), row_group_size=self.row_group_size)
+                os.replace(self.tmp_path(monthly_path), monthly_path)
+                for path in daily_paths:
+                    os.remove(path)
+                record["rows"] = table.num_rows
+            logger.info(f"{len(daily_paths)} daily partition(s) compacted to {monthly_path}.")
+        return list(months)
+
+    def read(self, path: str) -> Any:
+        """Read one partition as arrow table, the file is memory mapped
+        """
+        return self._pq.read_table(path, schema=self.schema, memory_map=True)
+
+    def dataset(self) -> Any:
+        """Return all partitions (monthly and daily) as one pyarrow dataset
+        """
+        import pyarrow.dataset
+        return pyarrow.dataset.dataset(self.directory, schema=self.schema, format="parquet")
@@ -0,0 +1,145 @@
+from lib.support_functions import running_script_name
+import json
+import logging
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+logger = logging.getLogger(running_script_name(__name__))
+
+# property types from config.yaml and their estate type in the API
+ESTATE_TYPES = {
+    "byt": "BYT",
+    "dum": "DUM",
+    "pozemek": "POZEMEK",
+    "garaz": "GARAZ",
+    "kancelar": "KANCELAR",
+    "nebytovy-prostor": "NEBYTOVY_PROSTOR",
+    "chata-chalupa": "REKREACNI_OBJEKT",
+}
+# dispositions without rooms in the name, e.g. DISP_2_KK -> 2+kk otherwise
+DISPOSITIONS = {"GARSONIERA": "Garsoniéra", "OSTATNI": "Ostatní"}
+DISPOSITION_RE = re.compile(r"^DISP_(\d+)_(KK|\d+)$")
+AD_URL = "https://www.bezrealitky.cz/nemovitosti-byty-domy/"
+
+# newest ads first - incremental crawl stops at the first page of known ads
+LIST_ADVERTS = """
+query ListAdverts($offerType: [OfferType], $estateType: [EstateType], $regionOsmIds: [ID], $limit: Int,
+                  $offset: Int, $order: ResultOrder) {
+  listAdverts(offerType: $offerType, estateType: $estateType, regionOsmIds: $regionOsmIds, limit: $limit,
+              offset: $offset, order: $order) {
+    totalCount
+    list { id uri estateType disposition surface price }
+  }
+}
+"""
+
+
+def parse_disposition(disposition: Optional[str]) -> Optional[str]:
+    """Return disposition in the format of the listing page, e.g. DISP_2_KK -> 2+kk
+    """
+    if not disposition:
+        return None
+    rooms = DISPOSITION_RE.match(disposition)
+    if rooms is not None:
+        return "{}+{}".format(rooms.group(1), rooms.group(2).lower())
+    return DISPOSITIONS.get(disposition, disposition)
+
+
+class GraphQLSource:
+    """Source backend requesting listings as JSON from GraphQL API of the site instead of rendered html pages.
+
+    Sections (property type x region) are still read from the homepage, ads of a section are requested by
+    GET requests (query and variables in query string) in large pages, so http cache, archive and rate limit
+    work the same way as for html pages. Ads are mapped to the same rows as parse_ad returns.
+
+    Experimental: the query and the mapping are written against a hand-written response
+    (tests/unit/fixtures/graphql_praha.json), not a recorded one, and regionOsmIds is filled with the region id
+    of the homepage, which is not known to be an OSM id. The source is used only with graphql.experimental: Y
+    until it is verified against the live API - html source is used otherwise.
+    """
+
+    name = "graphql"
+
+    def __init__(self, endpoint: str, page_size: int = 200) -> None:
+        """
+        Args:
+            endpoint (str): url of GraphQL API
+            page_size (int): nbr of ads requested at once
+        """
+        self.endpoint = endpoint
+        self.page_size = page_size
+        self.query = " ".join(LIST_ADVERTS.split())
+
+    def __repr__(self):
+        return "<GraphQLSource({}, {})>".format(self.endpoint, self.page_size)
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional["GraphQLSource"]:
+        """Create source from application config ("source" and "graphql" sections), None for html source
+        and for graphql source without graphql.experimental: Y
+        """
+        if config.get("source", "html") != cls.name:
+            return None
+        graphql = config.get("graphql", {})
+        if graphql.get("experimental", "N") != "Y":
+            logger.error("GraphQL source is not verified against the live API, html source is used - "
+                         "set graphql.experimental: Y to use it anyway.")
+            return None
+        logger.warning("GraphQL source is experimental, its responses are not verified against the live API.")
+        return cls(graphql.get("endpoint", "https://api.bezrealitky.cz/graphql/"), graphql.get("page_size", 200))
+
+    def section_url(self, prop_type: str, region: Dict) -> str:
+        """Return url of the first page of ads of the section
+
+        Args:
+            prop_type (str): property type from config.yaml (byt, dum...)
+            region (Dict): region from homepage (id, name, uri)
+
+        Returns:
+            str: url of the API request
+        """
+        variables = {"offerType": ["PRODEJ"], "estateType": [ESTATE_TYPES.get(prop_type, prop_type.upper())],
+                     "regionOsmIds": [region["id"]], "limit": self.page_size, "offset": 0, "order": "TIMEORDER_DESC"}
+        return self.endpoint + "?" + urlencode({"query": self.query, "variables": json.dumps(variables)})
+
+    def page_url(self, url: str, page: int) -> str:
+        """Return url of the given page (from 1) of the section
+        """
+        params = {key: values[0] for key, values in parse_qs(urlsplit(url).query).items()}
+        variables = json.loads(params["variables"])
+        variables["offset"] = (page - 1) * variables["limit"]
+        params["variables"] = json.dumps(variables)
+        return self.endpoint + "?" + urlencode(params)
+
+    def extract_content(self, content: bytes, prop_type: str, region: str) -> Tuple[List[Dict[str, Optional[str]]], int]:
+        """Map ads of API response to rows of parse_ad
+
+        Args:
+            content (bytes): JSON response
+            prop_type (str): type of the property
+            region (str): region
+
+        Raises:
+            ValueError: when the API returns errors or no list of ads
+
+        Returns:
+            Tuple[List[Dict[str, Optional[str]]], int]: parsed ads and total nbr of pages of the section
+        """
+        response = json.loads(content)
+        if response.get("errors"):
+            raise ValueError("GraphQL API returned errors: {}".format(
+                "; ".join(error.get("message", "") for error in response["errors"])))
+        adverts = (response.get("data") or {}).get("listAdverts")
+        if adverts is None:
+            raise ValueError("GraphQL API returned no listAdverts: {:.200}".format(content.decode(errors="replace")))
+        rows = [{
+            "typ_nemovistosti": prop_type,
+            "region": region,
+            "dispozice_nemovitosti": parse_disposition(advert.get("disposition")),
+            "rozloha": str(advert["surface"]) if advert.get("surface") is not None else None,
+            "cena_nemovitosti": str(advert["price"]) if advert.get("price") is not None else None,
+            "odkaz": AD_URL + advert["uri"]
+        } for advert in adverts.get("list") or []]
+        return rows, max(1, math.ceil((adverts.get("totalCount") or 0) / self.page_size))
@@ -0,0 +1,135 @@
+from contextlib import contextmanager
+import csv
+from datetime import datetime
+import json
+import os
+import threading
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, Tuple
+
+# fields added up in run summary
+SUMMED_FIELDS = ("bytes", "ads", "rows", "retries", "duplicates", "page_shifts")
+
+
+class Metrics:
+    """Collector of timings of pipeline stages (fetch, parse, create_df, insert, historisation, charts).
+
+    One instance is shared by all threads of the run (module variable metrics), every measured step is stored
+    as an event with its stage, start offset, duration and stage specific fields (url, bytes, ads, rows...).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __repr__(self):
+        return "<Metrics({} events)>".format(len(self._events))
+
+    def reset(self) -> None:
+        """Drop all events and start a new run
+        """
+        with self._lock:
+            self.started = datetime.now()
+            self._start = perf_counter()
+            self._events: List[Dict[str, Any]] = []
+
+    def record(self, stage: str, seconds: float, **fields: Any) -> None:
+        """Store one measured step
+
+        Args:
+            stage (str): name of the stage
+            seconds (float): duration of the step
+            **fields (Any): stage specific values
+        """
+        event = {"stage": stage, "start": perf_counter() - self._start - seconds, "seconds": seconds, **fields}
+        with self._lock:
+            self._events.append(event)
+
+    def merge(self, events: List[Dict[str, Any]], started: datetime, **fields: Any) -> None:
+        """Add events recorded by another process (worker of distributed crawl) to this run
+
+        Args:
+            events (List[Dict[str, Any]]): events of the other process
+            started (datetime): start of the other process run, start offsets of its events are shifted by it
+            **fields (Any): values added to every event, e.g. name of the worker
+        """
+        shift = (started - self.started).total_seconds()
+        with self._lock:
+            self._events.extend(dict(event, start=event["start"] + shift, **fields) for event in events)
+
+    @contextmanager
+    def timer(self, stage: str, **fields: Any) -> Iterator[Dict[str, Any]]:
+        """Measure the block, fields yielded by the context manager can be completed inside the block
+        """
+        start = perf_counter()
+        yield fields
+        self.record(stage, perf_counter() - start, **fields)
+
+    @property
+    def events(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._events)
+
+    def summary(self) -> Dict[str, Any]:
+        """Return run summary - count, total, mean, median, 95th percentile and max duration of every stage
+        together with totals of SUMMED_FIELDS
+
+        Returns:
+            Dict[str, Any]: run summary
+        """
+        stages: Dict[str, List[Dict[str, Any]]] = {}
+        for event in self.events:
+            stages.setdefault(event["stage"], []).append(event)
+
+        summary = {}
+        for stage, events in stages.items():
+            seconds = sorted(event["seconds"] for event in events)
+            stage_summary = {
+                "count": len(seconds),
+                "seconds": round(sum(seconds), 6),
+                "mean": round(sum(seconds) / len(seconds), 6),
+                "p50": round(seconds[(len(seconds) - 1) // 2], 6),
+                "p95": round(seconds[int(0.95 * (len(seconds) - 1))], 6),
+                "max": round(seconds[-1], 6)
+            }
+            for field in SUMMED_FIELDS:
+                values = [event[field] for event in events if event.get(field) is not None]
+                if values:
+                    stage_summary[field] = sum(values)
+            summary[stage] = stage_summary
+
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "seconds": round(perf_counter() - self._start, 6),
+            "stages": summary
+        }
+
+    def write(self, directory: str) -> Tuple[str, str]:
+        """Write run summary as JSON and all events as CSV
+
+        Args:
+            directory (str): output folder, created if missing
+
+        Returns:
+            Tuple[str, str]: paths of JSON summary and CSV events
+        """
+        os.makedirs(directory, exist_ok=True)
+        name = "run_{}".format(self.started.strftime("%Y%m%d_%H%M%S"))
+        summary_path = os.path.join(directory, name + ".json")
+        events_path = os.path.join(directory, name + ".csv")
+
+        with open(summary_path, "w", encoding="utf8") as summary_file:
+            json.dump(self.summary(), summary_file, ensure_ascii=False, indent=2)
+
+        events = self.events
+        fields = ["stage", "start", "seconds"]
+        fields += sorted({key for event in events for key in event} - set(fields))
+        with open(events_path, "w", encoding="utf8", newline="") as events_file:
+            writer = csv.DictWriter(events_file, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(events)
+        return summary_path, events_path
+
+
+# metrics of the current run
+metrics = Metrics()
@@ -0,0 +1,293 @@
+from functools import lru_cache
+import hashlib
+import json
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+from bs4 import BeautifulSoup
+
+
+# property types from config.yaml - prefix of the ad note (without whitespace) and whether the note states
+# disposition ("Prodej bytu 2+kk, 60 m²") or only area ("Prodej domu, 150 m²")
+PROPERTY_TYPES = {
+    "byt": ("Prodejbytu", True),
+    "dum": ("Prodejdomu,", False),
+    "pozemek": ("Prodejpozemku,", False),
+    "garaz": ("Prodejgaráže,", False),
+    "kancelar": ("Prodejkanceláře,", False),
+    "nebytovy-prostor": ("Prodejnebytovéhoprostoru,", False),
+    "chata-chalupa": ("Prodejchaty,chalupy,", False),
+}
+# unknown property type - everything up to the first digit is the prefix
+PREFIX_RE = re.compile(r"^Prodej\D*")
+# columns of parsed ad (parse_ad) in the order of row tuples returned by parse_listing
+AD_COLUMNS = ["typ_nemovistosti", "region", "dispozice_nemovitosti", "rozloha", "cena_nemovitosti", "odkaz"]
+# labels of the parameter table on the detail page of the ad and columns of Realty_detail
+DETAIL_LABELS = {
+    "Podlaží": "podlazi",
+    "Typ budovy": "typ_budovy",
+    "Konstrukce budovy": "typ_budovy",
+    "Vlastnictví": "vlastnictvi",
+    "PENB": "energeticka_trida",
+    "Energetická náročnost budovy": "energeticka_trida",
+}
+DETAIL_COLUMNS = ["podlazi", "typ_budovy", "vlastnictvi", "energeticka_trida", "lat", "lng"]
+ENERGY_CLASS_RE = re.compile(r"^([A-G])\b")
+# id of the ad is the number at the start of the last part of the path of its link (query and fragment follow)
+AD_ID_RE = re.compile(r"/(\d+)(?:-[^/?#]*)?/?(?:[?#].*)?$")
+
+
+@lru_cache(maxsize=None)
+def property_type_slug(prop_type: str) -> str:
+    """Return config.yaml name of the property type, e.g. "Chata, chalupa" -> "chata-chalupa"
+    """
+    ascii_name = unicodedata.normalize("NFKD", prop_type).encode("ascii", "ignore").decode("ascii")
+    return "-".join(ascii_name.replace(",", " ").lower().split())
+
+
+def parse_ad(price_text: str, note_text: str, ad_link: str, prop_type: str, region: str) -> Dict[str, Optional[str]]:
+    """Clean texts of one ad and return it as a row
+
+    Whitespace is removed by one split/join pass per field, prefix of the note is looked up by property type.
+
+    Args:
+        price_text (str): text of the price tag
+        note_text (str): text of the note with disposition and area
+        ad_link (str): relative link to the ad
+        prop_type (str): type of the property
+        region (str): region
+
+    Returns:
+        Dict[str, Optional[str]]: parsed ad
+    """
+    price_tag = "".join(price_text.split()).replace(".", "").replace("Kč", "")
+
+    note = "".join(note_text.split())
+    prefix, with_disposition = PROPERTY_TYPES.get(property_type_slug(prop_type), ("", False))
+    if prefix and note.startswith(prefix):
+        note = note[len(prefix):]
+    else:
+        note = PREFIX_RE.sub("", note, count=1)
+    disposition_x_square = note.replace("m²", "").replace(".", "")
+
+    if with_disposition:
+        rooms: Optional[str]
+        rooms, _, square = disposition_x_square.partition(",")
+    else:
+        square, rooms = (disposition_x_square, None)
+
+    return {
+        "typ_nemovistosti": prop_type,
+        "region": region,
+        "dispozice_nemovitosti": rooms,
+        "rozloha": square,
+        "cena_nemovitosti": price_tag,
+        "odkaz": "https://www.bezrealitky.cz{}".format(ad_link)
+    }
+
+
+def parse_ad_id(link: str) -> int:
+    """Return id of the ad parsed from its link, e.g. /nemovitosti-byty-domy/649688-nabidka-prodej-bytu -> 649688
+
+    Link without a number gets a stable negative id derived from the whole link - ids of the site are positive.
+    Link is matched as it is without splitting, the id is parsed for every scraped ad.
+    """
+    ad_id = AD_ID_RE.search(link)
+    if ad_id is not None:
+        return int(ad_id.group(1))
+    return -1 - int.from_bytes(hashlib.blake2b(link.encode("utf8"), digest_size=7).digest(), "big")
+
+
+def parse_detail(params: List[Tuple[str, str]], lat: Optional[str], lng: Optional[str]) -> Dict[str, Any]:
+    """Clean parameters of the ad detail page and return them as a row of Realty_detail (without link and price)
+
+    Args:
+        params (List[Tuple[str, str]]): label and value of every row of the parameter table
+        lat (Optional[str]): latitude from the map
+        lng (Optional[str]): longitude from the map
+
+    Returns:
+        Dict[str, Any]: parsed attributes, None for attributes missing on the page
+    """
+    detail: Dict[str, Any] = dict.fromkeys(DETAIL_COLUMNS)
+    for label, value in params:
+        column = DETAIL_LABELS.get(" ".join(label.split()).rstrip(":"))
+        value = " ".join(value.split())
+        if column is not None and value:
+            detail[column] = value
+    if detail["energeticka_trida"] is not None:
+        # "B - Velmi úsporná" -> "B"
+        energy_class = ENERGY_CLASS_RE.match(detail["energeticka_trida"])
+        detail["energeticka_trida"] = energy_class.group(1) if energy_class else detail["energeticka_trida"]
+    try:
+        detail["lat"], detail["lng"] = float(lat), float(lng)
+    except (TypeError, ValueError):
+        pass
+    return detail
+
+
+def select_regions(countries: str, region_children: str) -> List[Dict]:
+    """Return regions of Czech Republic from JSON attributes of region selector
+    """
+    # get all countries first, then find Czech Republic ID a get all regions
+    coutry_id = {country['uri']: country['id'] for country in json.loads(countries)}['ceska-republika']
+    return json.loads(region_children)[coutry_id]['children']
+
+
+def select_lastpage(pages: List[str]) -> int:
+    """Return the highest page number from pagination texts, 1 when there is no pagination
+    """
+    return max((int(page) for page in pages if page.isnumeric()), default=1)
+
+
+class SoupParser:
+    """Parser backend using BeautifulSoup with pure python html.parser
+    """
+
+    name = "bs4"
+
+    @staticmethod
+    def parse(content: bytes) -> BeautifulSoup:
+        return BeautifulSoup(content, "html.parser")
+
+    @staticmethod
+    def extract_content(soup: BeautifulSoup, prop_type: str, region: str) -> List[Dict[str, Optional[str]]]:
+        return [parse_ad(item.find('strong', {"class": "product__value"}).text,
+                         item.find('p', {"class": "product__note"}).text,
+                         item.find('a', {"class": "product__link js-product-link"}).get("href"),
+                         prop_type, region)
+                for item in soup.find_all("div", {"class": "product__body-new"})]
+
+    @staticmethod
+    def get_property_type(soup: BeautifulSoup, prop_types: List[str]) -> Dict[str, str]:
+        property_type = soup.find_all("div", {"class": "dropdown-menu select-menu no-js-hide"})[1].find_all("span", {
+            "class": "dropdown-item select-item"})
+
+        # get uri for all types of property in config file - create dictionary
+        property_type_dict = {}
+        for prop in prop_types:
+            property_type_dict.update({i.text: i.get('for') for i in property_type if i.get('for') == prop})
+        return property_type_dict
+
+    @staticmethod
+    def get_regions(soup: BeautifulSoup) -> List[Dict]:
+        region_selector = soup.find("div", {"id": "regionSelector"})
+        return select_regions(region_selector.get('data-countries'), region_selector.get('data-region-children'))
+
+    @staticmethod
+    def get_lastpage(soup: BeautifulSoup) -> int:
+        return select_lastpage([page.text for page in soup.find_all("a", {"class": "page-link pagination__page"})])
+
+    @staticmethod
+    def extract_detail(soup: BeautifulSoup) -> Dict[str, Any]:
+        params = [(row.th.text, row.td.text) for row in soup.find_all("tr") if row.th and row.td]
+        location = soup.find(attrs={"data-lat": True, "data-lng": True})
+        if location is None:
+            return parse_detail(params, None, None)
+        return parse_detail(params, location.get("data-lat"), location.get("data-lng"))
+
+
+class LxmlParser:
+    """Parser backend using C-accelerated lxml with precompiled XPath selectors (CSS class selectors
+    translated to XPath), produces the same rows as SoupParser
+    """
+
+    name = "lxml"
+
+    def __init__(self) -> None:
+        # imported here, lxml is needed only when selected in config
+        from lxml import etree, html
+        self._html = html
+        self._html_parser = html.HTMLParser(encoding="utf-8")
+        self._ads = etree.XPath("//div[{}]".format(self.has_class("product__body-new")))
+        self._price = etree.XPath("(.//strong[{}])[1]".format(self.has_class("product__value")))
+        self._note = etree.XPath("(.//p[{}])[1]".format(self.has_class("product__note")))
+        self._link = etree.XPath("(.//a[{}])[1]/@href".format(self.has_class("product__link", "js-product-link")))
+        self._property_menus = etree.XPath("//div[{}]".format(self.has_class("dropdown-menu", "select-menu", "no-js-hide")))
+        self._property_items = etree.XPath(".//span[{}]".format(self.has_class("dropdown-item", "select-item")))
+        self._region_selector = etree.XPath("(//div[@id='regionSelector'])[1]")
+        self._pages = etree.XPath("//a[{}]".format(self.has_class("page-link", "pagination__page")))
+        self._params = etree.XPath("//tr[th and td]")
+        self._location = etree.XPath("(//*[@data-lat and @data-lng])[1]")
+
+    @staticmethod
+    def has_class(*names: str) -> str:
+        """XPath condition matching elements with all given classes
+        """
+        return " and ".join("contains(concat(' ', normalize-space(@class), ' '), ' {} ')".format(name) for name in names)
+
+    def parse(self, content: bytes) -> Any:
+        return self._html.document_fromstring(content, parser=self._html_parser)
+
+    def extract_content(self, doc: Any, prop_type: str, region: str) -> List[Dict[str, Optional[str]]]:
+        return [parse_ad(self._price(item)[0].text_content(), self._note(item)[0].text_content(), self._link(item)[0],
+                         prop_type, region)
+                for item in self._ads(doc)]
+
+    def get_property_type(self, doc: Any, prop_types: List[str]) -> Dict[str, str]:
+        property_type = self._property_items(self._property_menus(doc)[1])
+        property_type_dict = {}
+        for prop in prop_types:
+            property_type_dict.update({i.text_content(): i.get('for') for i in property_type if i.get('for') == prop})
+        return property_type_dict
+
+    def get_regions(self, doc: Any) -> List[Dict]:
+        region_selector = self._region_selector(doc)[0]
+        return select_regions(region_selector.get('data-countries'), region_selector.get('data-region-children'))
+
+    def get_lastpage(self, doc: Any) -> int:
+        return select_lastpage([page.text_content() for page in self._pages(doc)])
+
+    def extract_detail(self, doc: Any) -> Dict[str, Any]:
+        params = [(row.find("th").text_content(), row.find("td").text_content()) for row in self._params(doc)]
+        location = self._location(doc)
+        if not location:
+            return parse_detail(params, None, None)
+        return parse_detail(params, location[0].get("data-lat"), location[0].get("data-lng"))
+
+
+PARSERS = {SoupParser.name: SoupParser, LxmlParser.name: LxmlParser}
+
+
+def get_parser(engine: str) -> Any:
+    """Return parser backend by its name
+
+    Args:
+        engine (str): bs4 or lxml
+
+    Returns:
+        Any: parser backend instance
+    """
+    if engine not in PARSERS:
+        raise ValueError("Unknown parser engine {}, use one of: {}".format(engine, ", ".join(PARSERS)))
+    return PARSERS[engine]()
+
+
+@lru_cache(maxsize=None)
+def worker_parser(engine: str) -> Any:
+    """Return parser backend of the worker process, it is created only once per process
+    """
+    return get_parser(engine)
+
+
+def parse_listing(engine: str, content: bytes, prop_type: str, region: str,
+                  lastpage: bool = False) -> Tuple[List[Tuple[Optional[str], ...]], Optional[int]]:
+    """Parse listing page in worker process of parsing pool
+
+    Ads are returned as tuples in the order of AD_COLUMNS - they are pickled back to the crawling process,
+    tuples are smaller and faster to transfer than dicts.
+
+    Args:
+        engine (str): parser backend (bs4, lxml)
+        content (bytes): html code of the page
+        prop_type (str): type of the property
+        region (str): region
+        lastpage (bool): find total nbr of pages too (first page of the section)
+
+    Returns:
+        Tuple[List[Tuple[Optional[str], ...]], Optional[int]]: parsed ads and total nbr of pages (None if not requested)
+    """
+    parser = worker_parser(engine)
+    doc = parser.parse(content)
+    rows = [tuple(ad[column] for column in AD_COLUMNS) for ad in parser.extract_content(doc, prop_type, region)]
+    return rows, parser.get_lastpage(doc) if lastpage else None
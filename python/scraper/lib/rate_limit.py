@@ -0,0 +1,63 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Token bucket limiting both the request rate and the number of requests in flight.
+
+    Used as a context manager around a single request, shared by all fetching threads.
+    """
+
+    def __init__(self, requests_per_second: float, max_in_flight: int) -> None:
+        """
+        Args:
+            requests_per_second (float): average number of requests started per second
+            max_in_flight (int): max number of requests running at the same time
+        """
+        if requests_per_second <= 0 or max_in_flight < 1:
+            raise ValueError("requests_per_second must be > 0 and max_in_flight >= 1")
+        self.requests_per_second = float(requests_per_second)
+        self.max_in_flight = int(max_in_flight)
+        # bucket capacity - allows short burst up to the number of parallel requests
+        self.capacity = float(self.max_in_flight)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+
+    def __repr__(self):
+        return "<RateLimiter({}, {})>".format(self.requests_per_second, self.max_in_flight)
+
+    def _take_token(self) -> float:
+        """Take one token from the bucket
+
+        Returns:
+            float: 0 if token was taken, otherwise number of seconds to wait for the next token
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.requests_per_second)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.requests_per_second
+
+    def acquire(self) -> None:
+        """Block until a request slot and a token are available
+        """
+        self._in_flight.acquire()
+        wait = self._take_token()
+        while wait > 0:
+            time.sleep(wait)
+            wait = self._take_token()
+
+    def release(self) -> None:
+        self._in_flight.release()
+
+    def __enter__(self) -> "RateLimiter":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
@@ -1,50 +1,241 @@
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import hashlib
+import json
 import logging
 import os
-from typing import Dict
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple, Union
 import jinja2
-import matplotlib.pyplot as plt
+import matplotlib
+# headless backend - charts are only saved to files, also from worker processes
+matplotlib.use("Agg")
+import matplotlib.cm
+from matplotlib.figure import Figure
 from matplotlib.ticker import StrMethodFormatter
 import numpy as np
 from pandas import DataFrame, Series
+from lib.metrics import metrics
 from lib.support_functions import get_path, running_script_name
 
 logger = logging.getLogger(running_script_name(__name__))
 
+# chart to render - file name, drawing function, aggregated data and extra arguments of the function
+Chart = Tuple[str, Callable, Union[Series, DataFrame], Tuple]
+
+
+def get_cmap(name: str):
+    # colormap registry is available since matplotlib 3.5, cm.get_cmap was removed in 3.9
+    colormaps = getattr(matplotlib, "colormaps", None)
+    return colormaps[name] if colormaps is not None else matplotlib.cm.get_cmap(name)
+
+
+def horizontal_bar_chart(data: Series, graph_path: str) -> None:
+    fig = Figure(figsize=(8, 8))
+    ax = fig.add_subplot()
+    data.sort_values().plot(kind='barh', ax=ax, color='#86bf91', zorder=2, width=0.75)
+
+    # Despine
+    ax.spines['right'].set_visible(False)
+    ax.spines['top'].set_visible(False)
+    ax.spines['left'].set_visible(False)
+    ax.spines['bottom'].set_visible(False)
+
+    # Switch off ticks
+    ax.tick_params(labelsize="10", axis="both", which="both", bottom=False, top=False, labelbottom=True, left=False,
+                   right=False, labelleft=True)
+
+    # Draw vertical axis lines
+    vals = ax.get_xticks()
+    for tick in vals:
+        ax.axvline(x=tick, linestyle='dashed', alpha=0.4, color='#eeeeee', zorder=1)
+
+    # Set y-axis label
+    ax.set_ylabel("Region", labelpad=20, weight='bold', size=12)
+
+    # Set x-axis label
+    ax.set_xlabel("Průměrná cena za m²", labelpad=20, weight='bold', size=12)
+
+    # Format x-axis label
+    ax.xaxis.set_major_formatter(StrMethodFormatter('{x:,g} Kč'))
+
+    fig.savefig(graph_path, dpi=85, bbox_inches='tight')
+
+
+def make_pie(df: DataFrame, graph_path: str, color: str, head: str) -> None:
+    total = int(np.sum(df.iloc[:, 0]))
+
+    fig = Figure()
+    ax = fig.add_subplot()
+    ax.axis('equal')
+
+    theme = get_cmap(color)
+    ax.set_prop_cycle("color", [theme(1. * i / len(df)) for i in range(len(df))])
+
+    outside, _ = ax.pie(df.iloc[:, 0], radius=1.1, startangle=180)
+
+    for wedge in outside:
+        wedge.set(width=0.2, edgecolor='white')
+
+    ax.text(0, 0, total, ha='center', va='center', size=30)
+    ax.legend(['{:.0f}%: {}'.format(row.iloc[0] / total * 100, index) for index, row in df.iterrows()],
+              frameon=False, bbox_to_anchor=(0.75, 0.02), labelspacing=0.7)
+    ax.annotate(head, size=14, fontweight="semibold", xy=(1, 1), xycoords='data',
+                horizontalalignment='center', verticalalignment='top', xytext=(0.1, 1.4))
+
+    fig.savefig(graph_path, dpi=80, bbox_inches='tight')
+
+
+def price_trend_chart(df: DataFrame, graph_path: str) -> None:
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    df.plot(ax=ax, colormap='tab20', marker='o', markersize=3, linewidth=1.5, zorder=2)
+
+    # Despine
+    ax.spines['right'].set_visible(False)
+    ax.spines['top'].set_visible(False)
+
+    ax.grid(axis='y', linestyle='dashed', alpha=0.4, color='#eeeeee', zorder=1)
+    ax.set_xlabel("")
+    ax.set_ylabel("Medián ceny za m²", labelpad=20, weight='bold', size=12)
+    ax.yaxis.set_major_formatter(StrMethodFormatter('{x:,g} Kč'))
+    ax.legend(frameon=False, bbox_to_anchor=(1.02, 1), loc='upper left')
+
+    fig.savefig(graph_path, dpi=85, bbox_inches='tight')
+
+
+def activity_chart(df: DataFrame, graph_path: str) -> None:
+    fig = Figure(figsize=(10, 4))
+    ax = fig.add_subplot()
+    df.plot(kind='bar', ax=ax, color=['#86bf91', '#e07a5f', '#f2cc8f'], width=0.8, rot=45, zorder=2)
+
+    # Despine
+    ax.spines['right'].set_visible(False)
+    ax.spines['top'].set_visible(False)
+
+    ax.grid(axis='y', linestyle='dashed', alpha=0.4, color='#eeeeee', zorder=1)
+    ax.set_xlabel("")
+    ax.set_ylabel("Počet inzerátů", labelpad=20, weight='bold', size=12)
+    ax.legend(frameon=False)
+
+    fig.savefig(graph_path, dpi=85, bbox_inches='tight')
+
+
+def render_chart(draw: Callable, data: Union[Series, DataFrame], graph_path: str, params: Tuple) -> float:
+    """Draw one chart (in worker process) and return time of rendering in seconds
+    """
+    start = perf_counter()
+    draw(data, graph_path, *params)
+    return perf_counter() - start
+
 
 class ReportHTML:
     """Class for rendering html reports based on data from web scraper
     """
 
-    def __init__(self, data: DataFrame) -> None:
-        self.data = data[(data["typ_nemovistosti"] == "Byt")]
+    def __init__(self, data: DataFrame, trend: Optional[DataFrame] = None,
+                 activity: Optional[DataFrame] = None) -> None:
+        """
+        Args:
+            data (DataFrame): snapshot of ads
+            trend (Optional[DataFrame]): median price per m² by day and region from history, no trend section if None
+            activity (Optional[DataFrame]): counts of new, deleted and repriced ads by day from history
+        """
+        data = data[(data["typ_nemovistosti"] == "Byt")]
+        # categorical columns from scraper are grouped and relabeled as plain strings
+        self.data = data.astype({column: object for column in data.select_dtypes("category").columns})
         self.tmp_dir = get_path("output", "temp")
         self.template_dir = get_path("templates")
         self.template_file = "report.html"
         self.output_dir = get_path("output")
-
+        self.chart_cache = os.path.join(self.tmp_dir, "charts.json")
+        self.trend = trend
+        self.activity = activity
 
     def create_report(self) -> None:
-        # create horizontal chart
         sq_m_avg = self.get_avg_price_sq_m()
 
-        self.horizontal_bar_chart(sq_m_avg, "prumer.png")
-
-        # create pie charts
         # number of displayed items in pie charts + create group of other
         n = 6
 
         flats_ttl = self.get_total_flats_by_region(n)
-        self.make_pie(flats_ttl, color='Pastel1', head='Počet nabídek podle kraje', graph_name='kraje.png')
-
         flat_disp = self.get_flats_structure_prague(n)
-        self.make_pie(flat_disp, color='Pastel2', head="Struktura bytů v Praze", graph_name='struktura.png')
 
-        # generate final report
+        # horizontal chart and pie charts
+        charts = [
+            ("prumer.png", horizontal_bar_chart, sq_m_avg, ()),
+            ("kraje.png", make_pie, flats_ttl, ('Pastel1', 'Počet nabídek podle kraje')),
+            ("struktura.png", make_pie, flat_disp, ('Pastel2', "Struktura bytů v Praze")),
+        ]
         template_vars = self.prepare_template_vars(sq_m_avg, flats_ttl, flat_disp)
-        self.generate_html(template_vars)
+
+        # price trend section from history
+        if self.trend is not None and not self.trend.empty:
+            price_trend = self.get_price_trend()
+            daily_activity = self.get_daily_activity(30)
+            charts.append(("trend.png", price_trend_chart, price_trend, ()))
+            charts.append(("aktivita.png", activity_chart, daily_activity, ()))
+            template_vars.update(self.prepare_trend_vars(price_trend, daily_activity))
+
+        self.render_charts(charts)
+
+        # generate final report
         self.save_report(self.generate_html(template_vars))
 
+    @staticmethod
+    def chart_key(draw: Callable, data: Union[Series, DataFrame], params: Tuple) -> str:
+        """Return hash of the aggregated data and arguments of the chart
+        """
+        digest = hashlib.sha256(data.to_csv().encode("utf8"))
+        digest.update(repr((draw.__name__, params)).encode("utf8"))
+        return digest.hexdigest()
+
+    def render_charts(self, charts: List[Chart]) -> List[str]:
+        """Render charts in process pool, chart is skipped when its data haven't changed since the last run
+
+        Args:
+            charts (List[Chart]): charts to render
+
+        Returns:
+            List[str]: names of rendered charts
+        """
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        try:
+            with open(self.chart_cache, "r", encoding="utf8") as cache_file:
+                cached_keys = json.load(cache_file)
+        except (OSError, ValueError):
+            cached_keys = {}
+
+        keys = {}
+        pending = []
+        for graph_name, draw, data, params in charts:
+            keys[graph_name] = self.chart_key(draw, data, params)
+            graph_path = os.path.join(self.tmp_dir, graph_name)
+            if cached_keys.get(graph_name) == keys[graph_name] and os.path.isfile(graph_path):
+                logger.info(f"Chart {graph_name} hasn't changed, served from cache.")
+                metrics.record("chart", 0.0, chart=graph_name, cached=True)
+            else:
+                pending.append((graph_name, draw, data, graph_path, params))
+
+        if pending:
+            with ProcessPoolExecutor(max_workers=len(pending)) as executor:
+                futures = [(graph_name, executor.submit(render_chart, draw, data, graph_path, params))
+                           for graph_name, draw, data, graph_path, params in pending]
+                for graph_name, future in futures:
+                    try:
+                        elapsed = future.result()
+                        logger.info(f"Chart {graph_name} rendered in {elapsed:.2f}s.")
+                        metrics.record("chart", elapsed, chart=graph_name, cached=False)
+                    except Exception as ex:
+                        # rendered again in the next run
+                        keys.pop(graph_name)
+                        cached_keys.pop(graph_name, None)
+                        logger.exception("Exception occurred:")
+
+        with open(self.chart_cache, "w", encoding="utf8") as cache_file:
+            json.dump({**cached_keys, **keys}, cache_file, indent=2)
+        return [graph_name for graph_name, *_ in pending if graph_name in keys]
+
     def get_avg_price_sq_m(self) -> Series:
         sq_m_avg = self.data.set_index('region')
         sq_m_avg['price_4_m2'] = sq_m_avg['cena_nemovitosti'] / sq_m_avg['rozloha']
@@ -67,6 +258,14 @@ class ReportHTML:
         flat_disp = flat_disp.groupby('Dispozice').sum().sort_values(ascending=False, by='Počet bytů')
         return flat_disp
 
+    def get_price_trend(self) -> DataFrame:
+        return self.trend.pivot(index="report_date", columns="region", values="median_price_m2")
+
+    def get_daily_activity(self, days: int) -> DataFrame:
+        daily_activity = self.activity.set_index("report_date").tail(days)
+        daily_activity.columns = ["Nové", "Smazané", "Změna ceny"]
+        return daily_activity
+
     @staticmethod
     def get_sum(df: DataFrame) -> int:
         return int(np.sum(df))
@@ -97,62 +296,23 @@ class ReportHTML:
             "vygenerovano": datetime.now().strftime("%d.%m.%Y %H:%M")
         }
 
-    def horizontal_bar_chart(self, data: Series, graph_name: str) -> None:
-        ax = data.sort_values().plot(kind='barh', figsize=(8, 8), color='#86bf91', zorder=2, width=0.75)
-
-        # Despine
-        ax.spines['right'].set_visible(False)
-        ax.spines['top'].set_visible(False)
-        ax.spines['left'].set_visible(False)
-        ax.spines['bottom'].set_visible(False)
-
-        # Switch off ticks
-        ax.tick_params(labelsize="10", axis="both", which="both", bottom=False, top=False, labelbottom=True, left=False,
-                       right=False, labelleft=True)
-
-        # Draw vertical axis lines
-        vals = ax.get_xticks()
-        for tick in vals:
-            ax.axvline(x=tick, linestyle='dashed', alpha=0.4, color='#eeeeee', zorder=1)
-
-        # Set y-axis label
-        ax.set_ylabel("Region", labelpad=20, weight='bold', size=12)
-
-        # Set x-axis label
-        ax.set_xlabel("Průměrná cena za m²", labelpad=20, weight='bold', size=12)
-
-        # Format x-axis label
-        ax.xaxis.set_major_formatter(StrMethodFormatter('{x:,g} Kč'))
-
-        graph_path = os.path.join(self.tmp_dir, graph_name)
-        plt.savefig(graph_path, dpi=85, bbox_inches='tight')
-
-    def make_pie(self, df: DataFrame, color: str, head: str, graph_name: str) -> None:
-
-        total = self.get_sum(df)
-
-        fig, ax = plt.subplots()
-        ax.axis('equal')
-
-        theme = plt.get_cmap(color)
-        ax.set_prop_cycle("color", [theme(1. * i / len(df)) for i in range(len(df))])
-
-        outside, _ = ax.pie(df.iloc[:, 0], radius=1.1, startangle=180)
-
-        plt.setp(outside, width=0.2, edgecolor='white')
-
-        ax.text(0, 0, total, ha='center', va='center', size=30)
-        ax.legend(['{:.0f}%: {}'.format(int(row.values) / total * 100, index) for index, row in df.iterrows()],
-                  frameon=False, bbox_to_anchor=(0.75, 0.02), labelspacing=0.7)
-        ax.annotate(head, size=14, fontweight="semibold", xy=(1, 1), xycoords='data',
-                    horizontalalignment='center', verticalalignment='top', xytext=(0.1, 1.4))
-
-        graph_path = os.path.join(self.tmp_dir, graph_name)
-        plt.savefig(graph_path, dpi=80, bbox_inches='tight')
+    @staticmethod
+    def prepare_trend_vars(price_trend: DataFrame, daily_activity: DataFrame) -> Dict:
+        # trend section variables - the last day with activity
+        last_day = daily_activity.iloc[-1]
+        return {
+            "trend": True,
+            "trend_od": datetime.strptime(price_trend.index[0], "%Y-%m-%d").strftime("%d.%m.%Y"),
+            "posledni_den": datetime.strptime(daily_activity.index[-1], "%Y-%m-%d").strftime("%d.%m.%Y"),
+            "nove_inzeraty": int(last_day["Nové"]),
+            "smazane_inzeraty": int(last_day["Smazané"]),
+            "zmenene_ceny": int(last_day["Změna ceny"])
+        }
 
     def generate_html(self, template_vars: Dict[str, str]) -> str:
         templateLoader = jinja2.FileSystemLoader(self.template_dir)
-        templateEnv = jinja2.Environment(loader=templateLoader)
+        # lines with block tags only are left out of the output
+        templateEnv = jinja2.Environment(loader=templateLoader, trim_blocks=True, lstrip_blocks=True)
         template = templateEnv.get_template(self.template_file)
         rendered_report = template.render(template_vars)
         return rendered_report
@@ -1,28 +1,126 @@
-from lib.support_functions import running_script_name
+from lib.support_functions import get_path, running_script_name
+from lib.rate_limit import RateLimiter
+from lib.session import HttpSession
+from lib.cache import HttpCache
+from lib.archive import NOT_ARCHIVED, ArchiveSession, PageArchive
+from lib.checkpoint import CrawlCheckpoint
+from lib.dedup import AdDeduplicator
+from lib.graphql import GraphQLSource
+from lib.metrics import metrics
+from lib.work_queue import CrawlTask, WorkQueue
+from lib.parser import AD_COLUMNS, SoupParser, get_parser, parse_ad_id, parse_listing
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import date
+from multiprocessing.connection import wait
+import hashlib
 import json
 import logging
+import multiprocessing
+import sys
 import time
-from typing import List, Dict, Optional, Union
+from typing import Any, Callable, Iterable, Iterator, List, Dict, Optional, Tuple, Union
+from urllib.parse import urljoin, urlsplit
 from bs4 import BeautifulSoup
+import numpy as np
 import pandas as pd
 import requests
 
 logger = logging.getLogger(running_script_name(__name__))
 
+# columns of parsed ads in the order of dataframe and stage table
+COLUMNS = ["typ_nemovistosti", "region", "dispozice_nemovitosti", "rozloha", "cena_nemovitosti", "odkaz"]
+
+
+def ordered_map(executor: Executor, fn: Callable, items: Iterable, window: int) -> Iterator:
+    """Like Executor.map, but submits at most window tasks ahead of the consumer to keep memory bounded
+    """
+    pending: deque = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def parser_version(*names: str) -> str:
+    """Return version of results parsed from listing pages - hash of the parsing code (lib.parser, lib.graphql)
+    and of the selected backends, results cached by another version are not used
+
+    Args:
+        *names (str): names of the selected parser backend and source
+
+    Returns:
+        str: version of parsed results
+    """
+    digest = hashlib.sha256("/".join(names).encode("utf8"))
+    for module in (get_parser.__module__, GraphQLSource.__module__):
+        with open(sys.modules[module].__file__, "rb") as code:
+            digest.update(code.read())
+    return digest.hexdigest()[:16]
+
+
+def run_worker(queue_path: str, base_url: str, prop_type: List[str], config: Dict[str, Any],
+               known_ads: Optional[Dict[str, int]], worker: str, crawl_date: Optional[date] = None) -> None:
+    """Entry point of worker process of distributed crawl - consume the work queue with own rate limit,
+    pages are archived under the date of the coordinator's crawl
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # progress is kept by the work queue
+    scraper = BezrealitkyScraper(base_url, prop_type, dict(config, checkpoint={"enabled": "N"}), known_ads)
+    scraper.crawl_date = crawl_date
+    queue = WorkQueue(queue_path)
+    try:
+        completed = scraper.work(queue, worker)
+    finally:
+        # metrics of the worker are merged into the run summary by the coordinator
+        queue.put_metrics(worker, metrics.started, metrics.events)
+        queue.close()
+        scraper.session.close()
+    logger.info(f"Worker {worker} finished, {completed} pages completed.")
+
 
 class BezrealitkyScraper:
     """Class for handling web scraping
     """
 
-    def __init__(self, base_url: str, prop_type: List[str]) -> None:
+    def __init__(self, base_url: str, prop_type: List[str], config: Optional[Dict[str, Any]] = None,
+                 known_ads: Optional[Dict[str, int]] = None) -> None:
         """
         Args:
             base_url (str): homepage url
             prop_type (List[str]): property types list
+            config (Optional[Dict[str, Any]]): application config, "crawl" section rate limit and parsing pool,
+                "http" section timeouts and retries, "cache" section conditional GET cache of listing pages,
+                "checkpoint" section resumable crawl, "distributed" section nbr of worker processes,
+                "archive" section archive of downloaded pages,
+                "parser" selects parser backend (bs4, lxml), "source" html listing pages or "graphql" API (with graphql.experimental: Y)
+            known_ads (Optional[Dict[str, int]]): links and prices of open ads for incremental crawl,
+                None for full crawl
         """
         self.base_url = base_url
         self.prop_type = prop_type
+        self.known_ads = known_ads
+        self.config = config or {}
+        crawl = self.config.get("crawl", {})
+        self.rate_limiter = RateLimiter(crawl.get("requests_per_second", 4), crawl.get("max_in_flight", 8))
+        self.parse_workers = crawl.get("parse_workers", 0)
+        self.parse_pool: Optional[ProcessPoolExecutor] = None
+        self.session = HttpSession.from_config(self.config, self.rate_limiter)
+        self.parser = get_parser(self.config.get("parser", SoupParser.name))
+        self.source = GraphQLSource.from_config(self.config)
+        self.cache = HttpCache.from_config(self.config, parser_version(
+            self.parser.name, self.source.name if self.source is not None else "html"))
+        self.checkpoint = CrawlCheckpoint.from_config(self.config)
+        self.archive = PageArchive.from_config(self.config)
+        self.download_date: Optional[date] = None
+        # download date of the running crawl, fixed when the crawl starts - data and archived pages get it
+        self.crawl_date: Optional[date] = None
+        self.workers = self.config.get("distributed", {}).get("workers", 0)
+        self.queue_path = get_path("output", "crawl_queue.db")
+        self.dedup = AdDeduplicator()
 
     def __str__(self):
         return "BezrealitkyScraper, args(url:{}, type:{})".format(self.base_url, self.prop_type)
@@ -30,26 +128,158 @@ class BezrealitkyScraper:
     def __repr__(self):
         return "<BezrealitkyScraper({}, {})>".format(self.base_url, self.prop_type)
 
-    def get_content(self, url: str) -> BeautifulSoup:
-        """Method that requests the page and returns html code as BeautifulSoup object
+    def fetch(self, url: str, headers: Optional[Dict[str, str]] = None,
+              missing_ok: bool = False) -> requests.Response:
+        """Method that requests the page, any failed request stops the run
 
         Args:
             url (str): url of scraping web page
+            headers (Optional[Dict[str, str]]): additional request headers
+            missing_ok (bool): return 404 Not Found response of the site instead of stopping the run (listing
+                page that disappeared during the crawl, archived as not found for replay), page missing
+                in the archive of replay still stops it
 
         Returns:
-            BeautifulSoup: final page result as BeautifulSoup
+            requests.Response: response of the page
         """
 
         try:
-            response = requests.get(url)
-            return BeautifulSoup(response.content, "html.parser")
+            return self.session.get(url, headers)
         except requests.exceptions.HTTPError as e:
-            logger.exception("Exception HTTPError occurred:")
+            if missing_ok and e.response.status_code == 404 and e.response.reason != NOT_ARCHIVED:
+                logger.warning(f"Page {url} was not found (404), it is taken as a page without ads.")
+                return e.response
+            logger.exception("Exception RequestException occurred:")
             raise SystemError(1)
+        except requests.exceptions.RequestException as e:
+            logger.exception("Exception RequestException occurred:")
+            raise SystemError(1)
+
+    def get_content(self, url: str) -> Any:
+        """Method that requests the page and returns html code parsed by selected parser backend
+
+        Args:
+            url (str): url of scraping web page
+
+        Returns:
+            Any: final page result as document of parser backend (BeautifulSoup for bs4)
+        """
+        content = self.fetch(url).content
+        if self.archive is not None:
+            self.archive.put(url, content, self.crawl_date)
+        return self.parse_document(url, content)
+
+    def parse_document(self, url: str, content: bytes) -> Any:
+        """Parse html code of the page by selected parser backend, parsing time is recorded in metrics
+        """
+        with metrics.timer("parse", url=url, bytes=len(content)):
+            return self.parser.parse(content)
+
+    def extract(self, doc: Any, url: str, prop_type: str, region: str) -> List[Dict[str, Optional[str]]]:
+        """Extract ads from parsed listing page, time and nbr of ads are recorded in metrics
+        """
+        with metrics.timer("extract", url=url) as record:
+            parsed_page = self.parser.extract_content(doc, prop_type, region)
+            record["ads"] = len(parsed_page)
+        return parsed_page
+
+    def parse_listing(self, url: str, content: bytes, prop_type: str, region: str,
+                      lastpage: bool = False) -> Tuple[List[Dict[str, Optional[str]]], Optional[int]]:
+        """Parse ads (and total nbr of pages) from html code of listing page
+
+        With parsing pool running the page is parsed in worker process, the fetching thread waits for the result,
+        so at most max_in_flight pages are queued for parsing. Otherwise the page is parsed by fetching thread.
+        JSON response of GraphQL source is mapped by fetching thread, there is no html to parse.
+
+        Args:
+            url (str): url of listing page
+            content (bytes): html code of the page
+            prop_type (str): type of the property
+            region (str): region
+            lastpage (bool): find total nbr of pages too (first page of the section)
+
+        Returns:
+            Tuple[List[Dict[str, Optional[str]]], Optional[int]]: parsed ads and total nbr of pages (None if not requested)
+        """
+        if self.source is not None:
+            with metrics.timer("extract", url=url, bytes=len(content)) as record:
+                parsed_page, last_page = self.source.extract_content(content, prop_type, region)
+                record["ads"] = len(parsed_page)
+            return parsed_page, last_page if lastpage else None
+
+        if self.parse_pool is None:
+            doc = self.parse_document(url, content)
+            return self.extract(doc, url, prop_type, region), self.parser.get_lastpage(doc) if lastpage else None
+
+        with metrics.timer("parse_pool", url=url, bytes=len(content)) as record:
+            rows, last_page = self.parse_pool.submit(
+                parse_listing, self.parser.name, content, prop_type, region, lastpage).result()
+            record["ads"] = len(rows)
+        return [dict(zip(AD_COLUMNS, row)) for row in rows], last_page
+
+    @contextmanager
+    def parsing_pool(self) -> Iterator[None]:
+        """Parse listing pages in worker processes (crawl.parse_workers) while the crawl runs, fetching
+        threads only download pages - parsing is CPU bound and doesn't scale in threads
+        """
+        if not self.parse_workers:
+            yield
+            return
+        self.parse_pool = ProcessPoolExecutor(self.parse_workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            yield
+        finally:
+            self.parse_pool.shutdown(cancel_futures=True)
+            self.parse_pool = None
+
+    def get_parsed(self, url: str, parse: Callable[[bytes], Any], missing: Any = None) -> Any:
+        """Method that requests the page and returns result parsed from it, using conditional GET cache
+
+        Unchanged pages (304 Not Modified or the same content hash as last time) are not parsed again,
+        the result cached from the previous run is returned instead.
+
+        Args:
+            url (str): url of scraping web page
+            parse (Callable[[bytes], Any]): function parsing html code of the page, result must be JSON serializable
+            missing (Any): result of the page that was not found (404), None - not found page stops the run
+
+        Returns:
+            Any: parsed result
+        """
+        entry = self.cache.get(url) if self.cache is not None else None
+        response = self.fetch(url, entry.validators() if entry is not None else None, missing_ok=missing is not None)
+        if response.status_code == 404:
+            if self.archive is not None:
+                self.archive.put(url, None, self.crawl_date, not_found=True)
+            return missing
+
+        if self.cache is None:
+            if self.archive is not None:
+                self.archive.put(url, response.content, self.crawl_date)
+            return parse(response.content)
+
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+
+        if entry is not None and response.status_code == 304:
+            self.cache.touch(url, etag, last_modified)
+            if self.archive is not None and not self.archive.put(url, None, self.crawl_date):
+                logger.warning(f"Page {url} was not modified, but it is not in the archive - it can't be replayed.")
+            return entry.payload
+
+        if self.archive is not None:
+            self.archive.put(url, response.content, self.crawl_date)
+        content_hash = HttpCache.content_hash(response.content)
+        if entry is not None and entry.content_hash == content_hash:
+            self.cache.touch(url, etag, last_modified)
+            return entry.payload
+
+        result = parse(response.content)
+        self.cache.put(url, etag, last_modified, content_hash, result)
+        return result
 
     @staticmethod
     def extract_content(soup: BeautifulSoup, prop_type: str, region: str) -> List[Dict[str, Optional[str]]]:
-        """Method for extracting data from ads
+        """Method for extracting data from ads (BeautifulSoup backend)
 
         Args:
             soup (BeautifulSoup): page to parse
@@ -59,47 +289,10 @@ class BezrealitkyScraper:
         Returns:
             List[Dict[str, Optional[str]]]: List of parsed ads from one page
         """
-        parsed_page: List[Dict[str, Optional[str]]] = []
-        for item in soup.find_all("div", {"class": "product__body-new"}):
-            price_tag = (item.find('strong', {"class": "product__value"}).text
-                         .replace(" ", "")
-                         .replace("\n", "")
-                         .replace(".", "")
-                         .replace("Kč", "")
-                         )
-
-            disposition_x_square = (item.find('p', {"class": "product__note"}).text
-                                    .replace(" ", "")
-                                    .replace("Prodejbytu", "")
-                                    .replace("Prodejpozemku,", "")
-                                    .replace("Prodejdomu,", "")
-                                    .replace("Prodejgaráže,", "")
-                                    .replace("Prodejkanceláře,", "")
-                                    .replace("Prodejnebytovéhoprostoru,", "")
-                                    .replace("Prodejchaty,chalupy,", "")
-                                    .replace("m²", "")
-                                    .replace(".", "")
-                                    .replace("\n", ""))
-
-            if prop_type.lower() == "byt":
-                rooms, _, square = disposition_x_square.partition(",")
-            else:
-                square, rooms = (disposition_x_square, None)
-
-            ad_link = item.find('a', {"class": "product__link js-product-link"}).get("href")
-
-            parsed_page.append({
-                    "typ_nemovistosti": prop_type,
-                    "region": region,
-                    "dispozice_nemovitosti": rooms,
-                    "rozloha": square,
-                    "cena_nemovitosti": price_tag,
-                    "odkaz": "https://www.bezrealitky.cz{}".format(ad_link)
-                })
-        return parsed_page
+        return SoupParser.extract_content(soup, prop_type, region)
 
     def get_property_type(self, soup: BeautifulSoup) -> Dict:
-        """Return types of property and its URI
+        """Return types of property and its URI (BeautifulSoup backend)
 
         Args:
             soup (BeautifulSoup): home page to parse
@@ -107,36 +300,23 @@ class BezrealitkyScraper:
         Returns:
             Dict: Property types and its URI
         """
-        property_type = soup.find_all("div", {"class": "dropdown-menu select-menu no-js-hide"})[1].find_all("span", {
-            "class": "dropdown-item select-item"})
-
-        # get uri for all types of property in config file - create dictionary
-        # property_type_dict = {i.text: i.get('for') for i in property_type}
-        property_type_dict = {}
-        for prop in self.prop_type:
-            property_type_dict.update({i.text: i.get('for') for i in property_type if i.get('for') == prop})
-
-        return property_type_dict
+        return SoupParser.get_property_type(soup, self.prop_type)
 
     @staticmethod
     def get_regions(soup: BeautifulSoup) -> List[Dict]:
-        """Return all regions in country
+        """Return all regions in country (BeautifulSoup backend)
 
         Args:
             soup (BeautifulSoup): home page to parse
 
         Returns:
             List[Dict]: List of parsed regions and its URI
-        """        
-        # get all countries first, then find Czech Republic ID a get all regions
-        countries = json.loads(soup.find("div", {"id": "regionSelector"}).get('data-countries'))
-        coutry_id = {country['uri']: country['id'] for country in countries}['ceska-republika']
-        regions = json.loads(soup.find("div", {"id": "regionSelector"}).get('data-region-children'))[coutry_id]['children']
-        return regions
+        """
+        return SoupParser.get_regions(soup)
 
     @staticmethod
     def get_lastpage(soup: BeautifulSoup) -> int:
-        """Return number of pages
+        """Return number of pages (BeautifulSoup backend)
 
         Args:
             soup (BeautifulSoup): html to parse
@@ -144,68 +324,439 @@ class BezrealitkyScraper:
         Returns:
             int: total nbr of pages for property type in region
         """
-        return int(max([page.text for page in soup.find_all("a", {"class": "page-link pagination__page"}) if page.text.isnumeric()]))
+        return SoupParser.get_lastpage(soup)
 
     @staticmethod
-    def create_df(json_data: List[Dict]) -> pd.DataFrame:
+    def create_df(json_data: List[Dict], download_date: Optional[date] = None) -> pd.DataFrame:
         """Method for cleaning and converting input data in json to pandas dataframe
 
         0.Convert data to pandas dataframe.
-        1.Add new column with current date.
-        2.Remove all ads that are missing values such as price or size of the property.
-        3.Cast price and size from string to int32.
+        1.Remove all ads that are missing values such as price or size of the property - one combined mask.
+        2.Cast price and size from string to int32, low-cardinality texts to category.
+        3.Add new column with current date (datetime64).
+        4.Add id of the ad (int64) - taken from ads passed by de-duplication, parsed from link otherwise.
 
         Args:
             json_data (List[dict]): input data from scraper
+            download_date (Optional[date]): date of the crawl, default today
 
         Returns:
             pd.DataFrame: converted data in pandas dataframe format
         """
-        today = date.today()
-        df = pd.DataFrame(json_data)
-        df["datum_stazeni"] = today
-        # DataFrame cleaning
-        df = df[~((df["rozloha"] == "") | (df["rozloha"].isna()))]
-        df = df[~((df["dispozice_nemovitosti"] == "") | (df["dispozice_nemovitosti"].isna()) & (df["typ_nemovistosti"] == "Byt"))]
-        df = df[~((df["cena_nemovitosti"] == "1") | (df["cena_nemovitosti"] == "") | (df["cena_nemovitosti"].isna()) | (df["cena_nemovitosti"].str.contains('+', regex=False)))]
-
-        # Data type casting
-        df = df.astype({'cena_nemovitosti': 'int32', 'rozloha': 'int32'})
+        with metrics.timer("create_df", ads=len(json_data)) as record:
+            df = BezrealitkyScraper.clean(json_data, download_date or date.today())
+            record["rows"] = len(df.index)
         return df
 
-    def main(self) -> pd.DataFrame:
-        """Main function
+    @staticmethod
+    def clean(json_data: List[Dict], today: date) -> pd.DataFrame:
+        """Cleaning and casting of create_df without metrics
+        """
+        columns = {column: np.array([ad.get(column) for ad in json_data], dtype=object) for column in COLUMNS}
+        price = columns["cena_nemovitosti"]
+        square = columns["rozloha"]
+        rooms = columns["dispozice_nemovitosti"]
+        keep = ~BezrealitkyScraper.dropped(columns)
+        ad_id = np.fromiter((ad["ad_id"] if "ad_id" in ad else parse_ad_id(ad["odkaz"])
+                             for ad, kept in zip(json_data, keep) if kept), dtype=np.int64, count=int(keep.sum()))
+
+        # Data type casting - every column is filtered only once, no copies of the whole frame
+        return pd.DataFrame({
+            "typ_nemovistosti": pd.Categorical(columns["typ_nemovistosti"][keep]),
+            "region": pd.Categorical(columns["region"][keep]),
+            "dispozice_nemovitosti": pd.Categorical(rooms[keep]),
+            "rozloha": square[keep].astype("int32"),
+            "cena_nemovitosti": price[keep].astype("int32"),
+            "odkaz": columns["odkaz"][keep],
+            "datum_stazeni": pd.Timestamp(today),
+            "ad_id": ad_id}, index=np.flatnonzero(keep), copy=False)
+
+    @staticmethod
+    def dropped(columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """Return mask of ads dropped by cleaning - ads without size, flats without disposition, ads without
+        price or with price on request
+
+        Args:
+            columns (Dict[str, np.ndarray]): parsed values of ads by column
 
         Returns:
-            pd.DataFrame: pandas dataframe containing parsed data
+            np.ndarray: True for ads that are not stored
         """
+        price = columns["cena_nemovitosti"]
+        square = columns["rozloha"]
+        rooms = columns["dispozice_nemovitosti"]
+        return (pd.isna(square) | (square == "")
+                | (rooms == "") | (pd.isna(rooms) & (columns["typ_nemovistosti"] == "Byt"))
+                | pd.isna(price) | (price == "") | (price == "1")
+                | np.fromiter((isinstance(value, str) and '+' in value for value in price), dtype=bool, count=len(price)))
 
-        soup_homepage = self.get_content(self.base_url)
-        property_type_dict = self.get_property_type(soup_homepage)
+    def scrape_page(self, url: str, prop_type: str, region: str) -> List[Dict[str, Optional[str]]]:
+        """Request one listing page and parse ads from it
 
-        regions = self.get_regions(soup_homepage)
+        Args:
+            url (str): url of listing page
+            prop_type (str): type of the property
+            region (str): region
 
-        result_json: List[Dict] = []
+        Returns:
+            List[Dict[str, Optional[str]]]: List of parsed ads from one page
+        """
+        if self.checkpoint is not None:
+            completed = self.checkpoint.get(url)
+            if completed is not None:
+                self.archive_completed(url)
+                return completed[0]
+
+        parsed_page = self.get_parsed(url, lambda content: self.parse_listing(url, content, prop_type, region)[0], [])
+        if self.checkpoint is not None:
+            self.checkpoint.put(url, prop_type, region, parsed_page)
+        return parsed_page
 
-        for prop_type, prop_type_url in property_type_dict.items():
-            for region in regions:
-                # extract data from every section to find total nbr of pages - avoid requesting the same page twice
-                url = self.base_url + prop_type_url + "/" + region['uri']
+    def scrape_first_page(self, url: str, prop_type: str, region: str) -> Tuple[List[Dict[str, Optional[str]]], int]:
+        """Request first listing page of the section and parse ads together with total nbr of pages
 
-                soup = self.get_content(url)
+        Args:
+            url (str): url of the section (property type and region)
+            prop_type (str): type of the property
+            region (str): region
 
-                result_json.extend(self.extract_content(soup, prop_type, region["name"]))
+        Returns:
+            Tuple[List[Dict[str, Optional[str]]], int]: parsed ads and total nbr of pages
+        """
+        completed = self.checkpoint.get(url) if self.checkpoint is not None else None
+        if completed is not None:
+            self.archive_completed(url)
+            return completed[0], completed[1]
+
+        parsed_page, last_page = self.get_parsed(
+            url, lambda content: self.parse_listing(url, content, prop_type, region, lastpage=True), ([], 1))
+        if self.checkpoint is not None:
+            self.checkpoint.put(url, prop_type, region, parsed_page, last_page)
+        logger.info(f"Parsing data from region: {region}, type: {prop_type}. Total pages: {last_page}, url: {url}.")
+        return parsed_page, last_page
+
+    def archive_completed(self, url: str) -> None:
+        """Archive page taken from checkpoint of unfinished crawl under the date of this crawl - it refers
+        to the version archived by the unfinished crawl
+        """
+        if self.archive is not None and not self.archive.put(url, None, self.crawl_date):
+            logger.warning(f"Page {url} was taken from checkpoint, but it is not archived - it can't be replayed.")
+
+    def is_known_page(self, parsed_page: List[Dict[str, Optional[str]]]) -> bool:
+        """Check if all ads on the page are already known with unchanged price
+
+        Ads dropped by cleaning (without price, size...) never reach history, they are not compared.
+
+        Args:
+            parsed_page (List[Dict[str, Optional[str]]]): parsed ads from one page
+
+        Returns:
+            bool: True when there is nothing new on the page
+        """
+        dropped = self.dropped({column: np.array([ad.get(column) for ad in parsed_page], dtype=object)
+                                for column in COLUMNS})
+        return all(str(self.known_ads.get(ad["odkaz"])) == ad["cena_nemovitosti"]
+                   for ad, drop in zip(parsed_page, dropped) if not drop)
+
+    def scrape_section(self, url: str, prop_type: str, region: str) -> List[Dict[str, Optional[str]]]:
+        """Walk pages of the section (newest ads first) until a page contains only known ads - incremental crawl
+
+        Args:
+            url (str): url of the section (property type and region)
+            prop_type (str): type of the property
+            region (str): region
+
+        Returns:
+            List[Dict[str, Optional[str]]]: parsed ads from walked pages
+        """
+        parsed_page, last_page = self.scrape_first_page(url, prop_type, region)
+        parsed_section = list(parsed_page)
+        i = 1
+        while i < last_page and not self.is_known_page(parsed_page):
+            i += 1
+            parsed_page = self.scrape_page(self.page_url(url, i), prop_type, region)
+            parsed_section.extend(parsed_page)
+        logger.info(f"Incremental crawl of region: {region}, type: {prop_type} stopped at page {i} of {last_page}.")
+        return parsed_section
+
+    def page_url(self, url: str, page: int) -> str:
+        """Return url of the given page (from 1) of the section
+        """
+        if self.source is not None:
+            return self.source.page_url(url, page)
+        return url + '?page=' + str(page)
+
+    def get_sections(self, homepage: Any) -> List[Tuple[str, str, str]]:
+        """Return url, property type and region of every section (property type x region) listed on homepage
+
+        With GraphQL source the url is the API request of the section, property types and regions are still
+        taken from homepage.
+        """
+        property_type_dict = self.parser.get_property_type(homepage, self.prop_type)
+
+        regions = self.parser.get_regions(homepage)
+
+        if self.source is not None:
+            return [(self.source.section_url(prop_type_url, region), prop_type, region["name"])
+                    for prop_type, prop_type_url in property_type_dict.items() for region in regions]
+        return [(self.base_url + prop_type_url + "/" + region['uri'], prop_type, region["name"])
+                for prop_type, prop_type_url in property_type_dict.items() for region in regions]
+
+    def work(self, queue: WorkQueue, worker: str, poll: float = 0.2) -> int:
+        """Consume tasks from the work queue until all pages are completed - worker of distributed crawl
+
+        Tasks are processed by max_in_flight threads sharing the rate limiter of the worker. First page of
+        a section adds the remaining pages of the section to the queue, incremental crawl walks the whole section.
+        Failed task is logged and returned to the queue for another attempt, the worker goes on with other
+        tasks - task failed max attempts times stays failed and the coordinator reports incomplete crawl.
+
+        Args:
+            queue (WorkQueue): shared work queue
+            worker (str): name of the worker
+            poll (float): seconds to wait for new tasks while other workers still process first pages
+
+        Returns:
+            int: nbr of completed tasks
+        """
+        def consume() -> int:
+            completed = 0
+            while True:
+                task = queue.claim(worker)
+                if task is None:
+                    if not queue.in_progress():
+                        return completed
+                    time.sleep(poll)
+                    continue
+                next_tasks: List[CrawlTask] = []
+                try:
+                    if self.known_ads is not None:
+                        rows = self.scrape_section(task.url, task.prop_type, task.region)
+                    elif task.page == 1:
+                        rows, last_page = self.scrape_first_page(task.url, task.prop_type, task.region)
+                        next_tasks = [task._replace(page=i, url=self.page_url(task.url, i))
+                                      for i in range(2, last_page + 1)]
+                    else:
+                        rows = self.scrape_page(task.url, task.prop_type, task.region)
+                except Exception:
+                    queue.release(task)
+                    logger.exception(f"Page {task.url} failed on {worker}, it is returned to the queue:")
+                    continue
+                except BaseException:
+                    queue.release(task)
+                    raise
+                queue.complete(task, rows, next_tasks)
+                completed += 1
+
+        threads = self.rate_limiter.max_in_flight
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            futures = [executor.submit(consume) for _ in range(threads)]
+            return sum(future.result() for future in futures)
+
+    def iter_distributed_pages(self) -> Iterator[List[Dict[str, Optional[str]]]]:
+        """Coordinator of distributed crawl - put sections to the work queue, run worker processes and yield
+        parsed pages from the queue once all of them are completed
+
+        Every worker has its own rate limit (crawl section of config), so the total request rate is
+        workers x requests_per_second. Tasks of a worker process that died are returned to the queue.
+        Metrics recorded by worker processes are merged into metrics of the run, their events have worker field.
+
+        Yields:
+            Iterator[List[Dict[str, Optional[str]]]]: parsed ads page by page in the order of the sequential crawl
+        """
+        homepage = self.get_content(self.base_url)
+        sections = self.get_sections(homepage)
+
+        queue = WorkQueue(self.queue_path)
+        queue.reset(CrawlTask(i, 1, url, prop_type, region) for i, (url, prop_type, region) in enumerate(sections))
+        logger.info(f"Distributed crawl of {len(sections)} sections by {self.workers} workers.")
+
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=run_worker, name="worker-{}".format(i),
+                                     args=(queue.path, self.base_url, self.prop_type, self.config, self.known_ads,
+                                           "worker-{}".format(i), self.crawl_date))
+                     for i in range(self.workers)]
+        try:
+            with metrics.timer("workers", workers=self.workers) as record:
+                for process in processes:
+                    process.start()
+                running = {process.sentinel: process for process in processes}
+                while running:
+                    for sentinel in wait(list(running)):
+                        process = running.pop(sentinel)
+                        process.join()
+                        if process.exitcode != 0:
+                            released = queue.release_worker(process.name)
+                            logger.warning(f"Worker {process.name} failed with exit code {process.exitcode}, "
+                                           f"{released} pages returned to the queue.")
+                stats = queue.stats()
+                record["pages"] = stats["done"]
+            for worker, started, events in queue.iter_metrics():
+                metrics.merge(events, started, worker=worker)
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+
+        try:
+            if stats["done"] < sum(stats.values()):
+                logger.error(f"Distributed crawl is not complete: {stats}.")
+                raise SystemError(1)
+            yield from queue.iter_results()
+        finally:
+            queue.close()
+
+        if self.cache is not None:
+            self.cache.evict()
+
+    def iter_pages(self) -> Iterator[List[Dict[str, Optional[str]]]]:
+        """Crawl all sections and yield parsed pages in the order of the sequential crawl
+
+        Pages are requested concurrently - first pages of all sections (property type x region) to find
+        total nbr of pages, then all remaining pages. Request rate is limited by the shared rate limiter,
+        only a limited nbr of pages is requested ahead of the consumer.
+        Incremental crawl walks sections in parallel, each section only until it reaches already known ads.
+        Pages completed by unfinished previous crawl are taken from checkpoint without request.
+        Pages are parsed by fetching threads, or by worker processes of parsing pool (crawl.parse_workers).
+        With distributed workers configured the crawl runs in worker processes (iter_distributed_pages).
+
+        Yields:
+            Iterator[List[Dict[str, Optional[str]]]]: parsed ads page by page (section by section for incremental crawl)
+        """
+        if self.workers:
+            yield from self.iter_distributed_pages()
+            return
+
+        if self.checkpoint is not None:
+            run_key = json.dumps([self.base_url, self.prop_type, self.known_ads is not None])
+            completed = self.checkpoint.begin(run_key)
+            if completed:
+                logger.info(f"Resuming unfinished crawl, {completed} pages are already completed.")
 
-                last_page = self.get_lastpage(soup)
-                
-                logger.info(f"Parsing data from region: {region['name']}, type: {prop_type}. Total pages: {last_page}, url: {url}.")
-                i = 1
-                while last_page > 1 and i <= (last_page - 1):
-                    i += 1
-                    url_for_loop = url + '?page=' + str(i)
-                    soup = self.get_content(url_for_loop)
+        homepage = self.get_content(self.base_url)
+        sections = self.get_sections(homepage)
 
-                    result_json.extend((self.extract_content(soup, prop_type, region["name"])))
+        window = self.rate_limiter.max_in_flight * 4
 
-                    time.sleep(0.5)
-        return self.create_df(result_json)
+        with self.parsing_pool(), ThreadPoolExecutor(max_workers=self.rate_limiter.max_in_flight) as executor:
+            if self.known_ads is not None:
+                yield from ordered_map(executor, lambda section: self.scrape_section(*section), sections, window)
+            else:
+                # extract data from first page of every section to find total nbr of pages - avoid requesting the same page twice
+                first_pages = list(executor.map(lambda section: self.scrape_first_page(*section), sections))
+
+                next_pages = [[(self.page_url(url, i), prop_type, region) for i in range(2, last_page + 1)]
+                              for (url, prop_type, region), (_, last_page) in zip(sections, first_pages)]
+                next_pages_rows = ordered_map(executor, lambda page: self.scrape_page(*page),
+                                              (page for pages in next_pages for page in pages), window)
+
+                # keep the order of the sequential crawl - section by section, page by page
+                for (first_page_rows, _), pages in zip(first_pages, next_pages):
+                    yield first_page_rows
+                    for _ in pages:
+                        yield next(next_pages_rows)
+
+        if self.cache is not None:
+            self.cache.evict()
+
+    def scrape_detail(self, link: str, price: int) -> Optional[Dict[str, Any]]:
+        """Request detail page of the ad and parse its attributes (floor, building type, ownership, energy class, GPS)
+
+        Args:
+            link (str): link to the ad (odkaz)
+            price (int): current price of the ad, stored with details to find repriced ads
+
+        Returns:
+            Optional[Dict[str, Any]]: detail of the ad, None when the page is not available (ad was removed)
+        """
+        # links are absolute, detail page is requested from the host of base url
+        url = urljoin(self.base_url, urlsplit(link).path)
+        try:
+            content = self.session.get(url).content
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Detail of ad {link} is not available ({e.__class__.__name__}), it is requested next time.")
+            return None
+        doc = self.parse_document(url, content)
+        with metrics.timer("extract_detail", url=url):
+            detail = self.parser.extract_detail(doc)
+        return dict(detail, odkaz=link, cena_nemovitosti=price)
+
+    def iter_details(self, ads: Iterable[Tuple[str, int]]) -> Iterator[Dict[str, Any]]:
+        """Request detail pages of given ads concurrently and yield parsed details
+
+        At most max_in_flight pages are requested at the same time (shared rate limiter), only a limited
+        nbr of pages is requested ahead of the consumer. Unavailable pages are skipped.
+
+        Args:
+            ads (Iterable[Tuple[str, int]]): link and current price of ads to enrich
+
+        Yields:
+            Iterator[Dict[str, Any]]: details of ads
+        """
+        window = self.rate_limiter.max_in_flight * 4
+        with ThreadPoolExecutor(max_workers=self.rate_limiter.max_in_flight) as executor:
+            for detail in ordered_map(executor, lambda ad: self.scrape_detail(*ad), ads, window):
+                if detail is not None:
+                    yield detail
+
+    def replay(self, archive: PageArchive, day: date) -> None:
+        """Serve pages from the archive of the given day instead of the network - the crawl of the day is parsed
+        and cleaned again, data get the download date of the day
+        """
+        self.session = ArchiveSession(archive, day)
+        self.download_date = day
+
+    def finish(self) -> None:
+        """Mark the crawl as completed after the snapshot has been saved - the next run starts from scratch
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.finish()
+
+    def iter_unique_pages(self) -> Iterator[List[Dict[str, Optional[str]]]]:
+        """Crawl all sections and yield parsed pages without ads already scraped from previous pages
+
+        Nbr of duplicates and page shifts is logged and recorded in metrics (stage dedup). Download date
+        of the crawl (crawl_date) is fixed here - crawl running past midnight keeps the date it started with.
+
+        Yields:
+            Iterator[List[Dict[str, Optional[str]]]]: parsed ads page by page, every link only once
+        """
+        self.crawl_date = self.download_date or date.today()
+        self.dedup = AdDeduplicator()
+        seconds = 0.0
+        for parsed_page in self.iter_pages():
+            start = time.perf_counter()
+            unique_page = self.dedup.filter(parsed_page)
+            seconds += time.perf_counter() - start
+            yield unique_page
+        metrics.record("dedup", seconds, ads=self.dedup.ads, duplicates=self.dedup.duplicates,
+                       page_shifts=self.dedup.page_shifts)
+        if self.dedup.duplicates:
+            logger.warning(f"{self.dedup.duplicates} duplicate ad(s) skipped, {self.dedup.page_shifts} of them "
+                           f"shifted to the next page during the crawl.")
+
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[pd.DataFrame]:
+        """Crawl all sections and yield cleaned data in small dataframes
+
+        Args:
+            batch_size (int): min nbr of parsed ads in one batch (before cleaning)
+
+        Yields:
+            Iterator[pd.DataFrame]: cleaned data, all batches have the same download date
+        """
+        batch: List[Dict] = []
+        for parsed_page in self.iter_unique_pages():
+            batch.extend(parsed_page)
+            if len(batch) >= batch_size:
+                yield self.create_df(batch, self.crawl_date)
+                batch = []
+        if batch:
+            yield self.create_df(batch, self.crawl_date)
+
+    def main(self) -> pd.DataFrame:
+        """Main function
+
+        Returns:
+            pd.DataFrame: pandas dataframe containing parsed data
+        """
+        return self.create_df([ad for parsed_page in self.iter_unique_pages() for ad in parsed_page], self.crawl_date)
@@ -0,0 +1,129 @@
+from lib.support_functions import running_script_name
+from lib.rate_limit import RateLimiter
+from lib.metrics import metrics
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import logging
+import time
+from typing import Dict, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+logger = logging.getLogger(running_script_name(__name__))
+
+# status codes worth another attempt - rate limited or temporary server error
+RETRY_STATUS = {429, 500, 502, 503, 504}
+MAX_BACKOFF = 60.0
+# requests slower than this (seconds) or retried are logged at info level, others at debug level
+SLOW_REQUEST = 5.0
+
+
+class HttpSession:
+    """Shared keep-alive HTTP session with connection pooling, timeouts and retries with exponential backoff.
+
+    Accept-Encoding offers every encoding urllib3 can decode (br only if brotli package is installed).
+    """
+
+    def __init__(self, connect_timeout: float = 5, read_timeout: float = 30, retries: int = 5,
+                 backoff_factor: float = 0.5, pool_size: int = 8, rate_limiter: Optional[RateLimiter] = None) -> None:
+        """
+        Args:
+            connect_timeout (float): connect timeout in seconds
+            read_timeout (float): read timeout in seconds
+            retries (int): max nbr of retries on 429/5xx status or connection error
+            backoff_factor (float): base of exponential backoff in seconds (factor * 2 ** retry)
+            pool_size (int): max nbr of pooled connections per host
+            rate_limiter (Optional[RateLimiter]): limiter applied to every single attempt
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.rate_limiter = rate_limiter
+        self.session = requests.Session()
+        self.session.headers.update({"Accept-Encoding": ACCEPT_ENCODING})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def __repr__(self):
+        return "<HttpSession(timeout={}, retries={})>".format(self.timeout, self.retries)
+
+    @classmethod
+    def from_config(cls, config: Dict, rate_limiter: Optional[RateLimiter] = None) -> "HttpSession":
+        """Create session from application config ("http" section), pool size follows the rate limiter
+        """
+        http = config.get("http", {})
+        pool_size = rate_limiter.max_in_flight if rate_limiter is not None else 8
+        return cls(http.get("connect_timeout", 5), http.get("read_timeout", 30), http.get("retries", 5),
+                   http.get("backoff_factor", 0.5), pool_size, rate_limiter)
+
+    def _send(self, url: str, headers: Optional[Dict[str, str]]) -> requests.Response:
+        if self.rate_limiter is None:
+            return self.session.get(url, headers=headers, timeout=self.timeout)
+        with self.rate_limiter:
+            return self.session.get(url, headers=headers, timeout=self.timeout)
+
+    def backoff(self, retry: int, response: Optional[requests.Response] = None) -> float:
+        """Return nbr of seconds to wait before the next attempt - Retry-After header has priority
+
+        Args:
+            retry (int): nbr of the retry starting from 0
+            response (Optional[requests.Response]): failed response, None for connection errors
+
+        Returns:
+            float: seconds to wait
+        """
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(max(float(retry_after), 0.0), MAX_BACKOFF)
+            except ValueError:
+                try:
+                    delta = parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)
+                    return min(max(delta.total_seconds(), 0.0), MAX_BACKOFF)
+                except (TypeError, ValueError):
+                    pass
+        return min(self.backoff_factor * 2 ** retry, MAX_BACKOFF)
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """GET request with retries on 429/5xx status and connection errors
+
+        Args:
+            url (str): requested url
+            headers (Optional[Dict[str, str]]): additional request headers
+
+        Raises:
+            requests.exceptions.RequestException: when the request fails even after all retries
+
+        Returns:
+            requests.Response: successful response
+        """
+        retry = 0
+        start = time.perf_counter()
+        while True:
+            try:
+                response = self._send(url, headers)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ex:
+                if retry >= self.retries:
+                    raise
+                wait = self.backoff(retry)
+                logger.warning(f"Request {url} failed ({ex.__class__.__name__}), retry {retry + 1} in {wait:.1f}s.")
+            else:
+                if response.status_code not in RETRY_STATUS or retry >= self.retries:
+                    break
+                wait = self.backoff(retry, response)
+                logger.warning(f"Request {url} returned {response.status_code}, retry {retry + 1} in {wait:.1f}s.")
+            time.sleep(wait)
+            retry += 1
+
+        elapsed = time.perf_counter() - start
+        logger.log(logging.INFO if retry or elapsed >= SLOW_REQUEST else logging.DEBUG,
+                   f"GET {url} {response.status_code} in {elapsed:.3f}s, retries: {retry}.")
+        metrics.record("fetch", elapsed, url=url, status=response.status_code, bytes=len(response.content),
+                       retries=retry)
+        response.raise_for_status()
+        return response
+
+    def close(self) -> None:
+        self.session.close()
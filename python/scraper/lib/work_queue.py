@@ -0,0 +1,182 @@
+from lib.support_functions import running_script_name
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(running_script_name(__name__))
+
+QUEUE_DDL = """
+CREATE TABLE IF NOT EXISTS crawl_task
+(
+ section INTEGER NOT NULL,
+ page INTEGER NOT NULL,
+ url TEXT NOT NULL,
+ typ_nemovistosti TEXT NOT NULL,
+ region TEXT NOT NULL,
+ state TEXT NOT NULL DEFAULT 'pending',
+ worker TEXT,
+ attempts INTEGER NOT NULL DEFAULT 0,
+ rows TEXT,
+ PRIMARY KEY (section, page)
+)
+"""
+METRICS_DDL = """
+CREATE TABLE IF NOT EXISTS crawl_metrics
+(
+ worker TEXT PRIMARY KEY,
+ started TEXT NOT NULL,
+ events TEXT NOT NULL
+)
+"""
+
+
+class CrawlTask(NamedTuple):
+    section: int
+    page: int
+    url: str
+    prop_type: str
+    region: str
+
+
+class WorkQueue:
+    """Work queue of distributed crawl shared by worker processes - one task per listing page.
+
+    Coordinator puts the first page of every section (property type x region) to the queue, worker completing
+    the first page adds the remaining pages of the section. Parsed rows of completed pages stay in the queue,
+    it is the staging area read by the coordinator once all tasks are done. Metrics of finished workers are
+    stored in the queue too and merged into the run summary by the coordinator.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3) -> None:
+        """
+        Args:
+            path (str): path to the queue database
+            max_attempts (int): task failed so many times is not given to workers any more
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # writers from other processes are waited for
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(QUEUE_DDL)
+        self._conn.execute(METRICS_DDL)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS crawl_task_state ON crawl_task (state, page, section)")
+        self._conn.commit()
+
+    def __repr__(self):
+        return "<WorkQueue({})>".format(self.path)
+
+    def reset(self, tasks: Iterable[CrawlTask]) -> None:
+        """Remove all tasks of the previous crawl and put new tasks to the queue
+        """
+        with self._lock:
+            self._conn.execute("delete from crawl_task")
+            self._conn.execute("delete from crawl_metrics")
+            self._conn.executemany("insert into crawl_task (section, page, url, typ_nemovistosti, region) "
+                                   "values (?, ?, ?, ?, ?)", tasks)
+            self._conn.commit()
+
+    def claim(self, worker: str) -> Optional[CrawlTask]:
+        """Take the next pending task - first pages of all sections go first
+
+        Args:
+            worker (str): name of the worker taking the task
+
+        Returns:
+            Optional[CrawlTask]: task, None if there is no pending task
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "update crawl_task set state = 'taken', worker = ?, attempts = attempts + 1 "
+                "where rowid = (select rowid from crawl_task where state = 'pending' and attempts < ? "
+                "order by page, section limit 1) "
+                "returning section, page, url, typ_nemovistosti, region", (worker, self.max_attempts)).fetchone()
+            self._conn.commit()
+        return CrawlTask(*row) if row is not None else None
+
+    def complete(self, task: CrawlTask, rows: List[Dict[str, Any]], next_tasks: Iterable[CrawlTask] = ()) -> None:
+        """Store parsed rows of the task and add tasks found by it (remaining pages of the section)
+        """
+        data = json.dumps(rows, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute("update crawl_task set state = 'done', rows = ? where section = ? and page = ?",
+                               (data, task.section, task.page))
+            self._conn.executemany("insert or ignore into crawl_task (section, page, url, typ_nemovistosti, region) "
+                                   "values (?, ?, ?, ?, ?)", next_tasks)
+            self._conn.commit()
+
+    def release(self, task: CrawlTask) -> None:
+        """Return failed task to the queue, it is given to another worker until max attempts
+        """
+        with self._lock:
+            self._conn.execute("update crawl_task set state = 'pending', worker = null "
+                               "where section = ? and page = ? and state = 'taken'", (task.section, task.page))
+            self._conn.commit()
+
+    def release_worker(self, worker: str) -> int:
+        """Return tasks taken by the worker to the queue (worker process died)
+
+        Returns:
+            int: nbr of returned tasks
+        """
+        with self._lock:
+            released = self._conn.execute("update crawl_task set state = 'pending', worker = null "
+                                          "where worker = ? and state = 'taken'", (worker,)).rowcount
+            self._conn.commit()
+        return released
+
+    def in_progress(self) -> int:
+        """Return nbr of tasks taken by workers - they can still add new tasks
+        """
+        with self._lock:
+            return self._conn.execute("select count(*) from crawl_task where state = 'taken'").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        """Return nbr of pending, taken, done and failed (pending after max attempts) tasks
+        """
+        stats = {"pending": 0, "taken": 0, "done": 0, "failed": 0}
+        with self._lock:
+            rows = self._conn.execute(
+                "select case when state = 'pending' and attempts >= ? then 'failed' else state end, count(*) "
+                "from crawl_task group by 1", (self.max_attempts,)).fetchall()
+        stats.update(rows)
+        return stats
+
+    def put_metrics(self, worker: str, started: datetime, events: List[Dict[str, Any]]) -> None:
+        """Store metrics events recorded by the worker process
+        """
+        data = json.dumps(events, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute("insert or replace into crawl_metrics values (?, ?, ?)",
+                               (worker, started.isoformat(), data))
+            self._conn.commit()
+
+    def iter_metrics(self) -> Iterator[Tuple[str, datetime, List[Dict[str, Any]]]]:
+        """Yield worker name, start of its run and its metrics events for every worker that stored them
+        """
+        with self._lock:
+            rows = self._conn.execute("select worker, started, events from crawl_metrics order by worker").fetchall()
+        for worker, started, events in rows:
+            yield worker, datetime.fromisoformat(started), json.loads(events)
+
+    def iter_results(self, batch_size: int = 100) -> Iterator[List[Dict[str, Any]]]:
+        """Yield parsed rows of completed tasks in the order of the sequential crawl - section by section,
+        page by page
+        """
+        cur = self._conn.execute("select rows from crawl_task where state = 'done' order by section, page")
+        while True:
+            with self._lock:
+                rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield json.loads(row[0])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
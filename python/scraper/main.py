@@ -1,68 +1,262 @@
 from lib.database import Database
-from lib.report import ReportHTML
+from lib.export import SnapshotExport
+from lib.metrics import metrics
 from lib.scraper import BezrealitkyScraper
 from lib.support_functions import init_config, running_script_name, get_path
+from lib.archive import PageArchive
+from datetime import date
 from time import perf_counter
+from typing import Iterable, List, Optional
+from pandas import DataFrame
 import logging
 import argparse
+import cProfile
 import os
 
 
-# basic logger
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(running_script_name(__name__))
-logger.info("Appliaction starts.")
-
-start_time = perf_counter()
-
-# parse arguments provided by CLI
-parser = argparse.ArgumentParser(prog="Bezrealitky_Scraper", description="HTML scraper bezrealitky.cz")
-# add args
-parser.add_argument(
-    '-conf', '--config_path',
-    dest='config_path',
-    required=False,
-    help='path to application config file (default in config in src)'
-)
-parser.add_argument(
-    '-report', '--generate_report',
-    dest='generate_report',
-    required=False,
-    choices=['Y', 'N'],
-    help='generate report [Y/N] (default: Y)'
-)
-# parse input args
-args = parser.parse_args()
-
-# assign default config file - first use conf provided via CLI args otherwise use default
-if args.config_path is not None and os.path.isfile(args.config_path):
-    default_config = init_config(args.config_path)
-    logger.info(f"Using config from args.config_path {default_config}")
-else:
-    default_config = init_config(get_path("config", "config.yaml"))
-    logger.info(f"Using default config {default_config}")
-
-# assign default value for generate report option
-if args.generate_report is not None:
-    report = args.generate_report
-    logger.info(f"Overwrite generate report option to: {report}")
-else:
-    report = default_config["report"]
-
-sql = init_config(get_path("config", "sql.yaml"))
 
-if __name__ == '__main__':
 
-    scraper = BezrealitkyScraper(default_config["url"], default_config["typ_nemovitosti"])
-    data = scraper.main()
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    # parse arguments provided by CLI
+    parser = argparse.ArgumentParser(prog="Bezrealitky_Scraper", description="HTML scraper bezrealitky.cz")
+    # add args
+    parser.add_argument(
+        '-conf', '--config_path',
+        dest='config_path',
+        required=False,
+        help='path to application config file (default in config in src)'
+    )
+    parser.add_argument(
+        '-report', '--generate_report',
+        dest='generate_report',
+        required=False,
+        choices=['Y', 'N'],
+        help='generate report [Y/N] (default: Y)'
+    )
+    parser.add_argument(
+        '--no-cache',
+        dest='no_cache',
+        action='store_true',
+        help='download and parse all listing pages again, ignore http cache'
+    )
+    parser.add_argument(
+        '--incremental',
+        dest='incremental',
+        action='store_true',
+        help='crawl only new and changed ads, full crawl runs once per crawl.full_sweep_days'
+    )
+    parser.add_argument(
+        '--workers',
+        dest='workers',
+        type=int,
+        help='crawl by given nbr of worker processes, 0 crawls in one process (default: distributed.workers)'
+    )
+    parser.add_argument(
+        '--report-only',
+        dest='report_only',
+        action='store_true',
+        help='render report from scraper_data.db without scraping'
+    )
+    parser.add_argument(
+        '--report-source',
+        dest='report_source',
+        choices=['history', 'stage'],
+        default='history',
+        help='data of report-only mode - open ads in history or the last crawl in stage (default: history)'
+    )
+    parser.add_argument(
+        '--replay',
+        dest='replay',
+        type=date.fromisoformat,
+        metavar='YYYY-MM-DD',
+        help='parse and historise the crawl of given day again from archive of pages (output/archive), no network; '
+             'refused when history already contains a later crawl'
+    )
+    parser.add_argument(
+        '--compact-snapshots',
+        dest='compact_snapshots',
+        action='store_true',
+        help='roll daily partitions of exported snapshots (output/snapshots) to monthly ones and exit'
+    )
+    parser.add_argument(
+        '--profile',
+        dest='profile',
+        action='store_true',
+        help='save cProfile stats of the run to output/metrics'
+    )
+    # parse input args
+    return parser.parse_args(argv)
+
 
-    # generate in case property type include "byt" and report option is Y
-    if report == 'Y' and 'byt' in default_config["typ_nemovitosti"]:
-        report = ReportHTML(data)
+def generate_report(db: Database, source: str) -> None:
+    # matplotlib and jinja2 are imported only when the report is generated
+    from lib.report import ReportHTML
+    data = db.read_report_data("Byt", source)
+    if data.empty:
+        logger.warning(f"No flats in {source} data, report is not generated.")
+        return
+    db.refresh_report_tables()
+    report = ReportHTML(data, *db.read_trends("Byt"))
+    with metrics.timer("report"):
         report.create_report()
 
-    db = Database(data, sql)
-    db.save_to_db()
 
-end_time = perf_counter()
-logger.info(f"Application finished successfuly. Total time was {(end_time-start_time):.2f}s.")
+def store_snapshot(db: Database, scraper: BezrealitkyScraper, batches: Iterable[DataFrame]) -> bool:
+    """Stream crawled batches to database, the crawl is marked completed only when every batch has been stored
+    and historised - checkpoint of a crawl with lost pages is kept and the next run resumes it
+    """
+    if not db.stream_to_db(batches):
+        logger.error("Snapshot was not stored completely, checkpoint is kept for the next run.")
+        return False
+    scraper.finish()
+    return True
+
+
+def enrich_details(db: Database, scraper: BezrealitkyScraper) -> None:
+    ads = db.get_detail_candidates()
+    logger.info(f"Downloading details of {len(ads)} new or repriced ad(s).")
+    db.save_details(scraper.iter_details(ads))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    logger.info("Appliaction starts.")
+    start_time = perf_counter()
+    args = parse_args(argv)
+    metrics.reset()
+    metrics_dir = get_path("output", "metrics")
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        run(args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(metrics_dir, exist_ok=True)
+            profile_path = os.path.join(metrics_dir, "run_{}.prof".format(metrics.started.strftime("%Y%m%d_%H%M%S")))
+            profiler.dump_stats(profile_path)
+            logger.info(f"cProfile stats saved to {profile_path}.")
+        summary_path, _ = metrics.write(metrics_dir)
+        logger.info(f"Run metrics saved to {summary_path}.")
+
+    end_time = perf_counter()
+    logger.info(f"Application finished successfuly. Total time was {(end_time-start_time):.2f}s.")
+
+
+def run(args: argparse.Namespace) -> None:
+    """Scrape and save data (or only render the report) as requested by CLI arguments
+    """
+    # assign default config file - first use conf provided via CLI args otherwise use default
+    if args.config_path is not None and os.path.isfile(args.config_path):
+        default_config = init_config(args.config_path)
+        logger.info(f"Using config from args.config_path {default_config}")
+    else:
+        default_config = init_config(get_path("config", "config.yaml"))
+        logger.info(f"Using default config {default_config}")
+
+    # assign default value for generate report option
+    if args.generate_report is not None:
+        report = args.generate_report
+        logger.info(f"Overwrite generate report option to: {report}")
+    else:
+        report = default_config["report"]
+
+    # switch off http cache
+    if args.no_cache:
+        default_config.setdefault("cache", {})["enabled"] = "N"
+        logger.info("Http cache is switched off.")
+
+    # distributed crawl - CLI option overrides config
+    if args.workers is not None:
+        default_config.setdefault("distributed", {})["workers"] = args.workers
+        logger.info(f"Overwrite nbr of crawl workers to: {args.workers}")
+
+    # incremental crawl - CLI flag overrides config
+    incremental = args.incremental or default_config.get("crawl", {}).get("incremental", "N") == "Y"
+
+    # replay of archived crawl - full crawl in this process, pages are neither cached nor archived again
+    if args.replay is not None:
+        for section in ("cache", "checkpoint", "archive"):
+            default_config[section] = {"enabled": "N"}
+        default_config["distributed"] = {"workers": 0}
+        incremental = False
+        logger.info(f"Replaying crawl of {args.replay} from archive of pages.")
+
+    # columnar copy of full snapshots - compaction of finished months, no network needed
+    if args.compact_snapshots:
+        months = SnapshotExport(get_path("output", "snapshots")).compact()
+        logger.info(f"Compacted months: {months}.")
+        return
+
+    sql = init_config(get_path("config", "sql.yaml"))
+
+    # report from data already in database, no network needed
+    if args.report_only:
+        db = Database(None, sql)
+        db.create_table()
+        generate_report(db, args.report_source)
+        db.close()
+        return
+
+    # legacy database that can't be migrated is found before the crawl, not when its data are stored
+    schema = Database(None, sql)
+    ready = schema.create_table()
+    schema.close()
+    if not ready:
+        logger.error("Database output/scraper_data.db is not ready, crawl is not started.")
+        return
+
+    if args.replay is not None:
+        history = Database(None, sql)
+        can_replay = history.can_replay(args.replay)
+        history.close()
+        if not can_replay:
+            logger.error(f"History already contains crawls after {args.replay}, replay would corrupt it - "
+                         f"replay into an empty database (move output/scraper_data.db away) instead.")
+            return
+
+    known_ads = None
+    if incremental:
+        history = Database(None, sql)
+        try:
+            if history.full_sweep_due(default_config.get("crawl", {}).get("full_sweep_days", 1)):
+                logger.info("Last full crawl is too old, running full crawl instead of incremental.")
+            else:
+                known_ads = history.get_open_ads()
+                logger.info(f"Incremental crawl, {len(known_ads)} open ads are known.")
+        finally:
+            history.close()
+
+    scraper = BezrealitkyScraper(default_config["url"], default_config["typ_nemovitosti"], default_config, known_ads)
+    if args.replay is not None:
+        scraper.replay(PageArchive(get_path("output", "archive")), args.replay)
+
+    # scraped data are streamed to stage table in batches, full snapshots also to parquet dataset
+    batches = scraper.iter_batches(default_config.get("crawl", {}).get("batch_size", 1000))
+    export = SnapshotExport.from_config(default_config)
+    if export is not None and known_ads is None:
+        batches = export.write(batches)
+
+    db = Database(None, sql, full_snapshot=known_ads is None)
+    stored = store_snapshot(db, scraper, batches)
+    # detail pages of new and repriced ads
+    if stored and default_config.get("detail", {}).get("enabled", "N") == "Y" and args.replay is None:
+        enrich_details(db, scraper)
+
+    # generate in case property type include "byt" and report option is Y, incremental crawl has only changed ads,
+    # stage of a snapshot that was not stored is not current
+    if report == 'Y' and 'byt' in default_config["typ_nemovitosti"] and known_ads is None:
+        if stored:
+            generate_report(db, "stage")
+        else:
+            logger.warning("Report is not generated, the snapshot was not stored.")
+
+    db.close()
+
+
+if __name__ == '__main__':
+    # basic logger
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,84 @@
+import unittest
+import tempfile
+from datetime import date
+import sys
+import os
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../scraper')))
+from lib.support_functions import get_path
+from lib.archive import ArchiveSession, PageArchive
+
+
+class TestPageArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.archive = PageArchive(self.tmp_dir.name)
+        self.url = "https://www.bezrealitky.cz/vypis/nabidka-prodej/byt/praha"
+        with open(get_path("python", "tests", "unit", "fixtures", "url_praha.html"), "rb") as html:
+            self.page = html.read()
+
+    def tearDown(self):
+        self.archive.close()
+        self.tmp_dir.cleanup()
+
+    def test_put(self):
+        first_day, second_day, third_day = date(2020, 11, 4), date(2020, 11, 5), date(2020, 11, 6)
+        self.assertTrue(self.archive.put(self.url, self.page, first_day))
+        self.assertTrue(self.archive.put(self.url + "?page=2", b"<html>2</html>", first_day))
+        # unchanged page and page not modified refer to the archived version
+        self.assertTrue(self.archive.put(self.url, self.page, second_day))
+        self.assertTrue(self.archive.put(self.url, None, third_day))
+        self.assertFalse(self.archive.put(self.url + "?page=3", None, third_day))
+
+        self.assertEqual(self.archive.get(first_day, self.url), self.page)
+        self.assertEqual(self.archive.get(third_day, self.url), self.page)
+        self.assertEqual(self.archive.get(first_day, self.url + "?page=2"), b"<html>2</html>")
+        self.assertIsNone(self.archive.get(second_day, self.url + "?page=2"))
+        self.assertEqual(self.archive.pages(first_day), 2)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name))[0], "2020-11-04.pages")
+        self.assertLess(os.path.getsize(os.path.join(self.tmp_dir.name, "2020-11-04.pages")), len(self.page) / 4)
+
+    def test_not_found(self):
+        day = date(2020, 11, 4)
+        self.archive.put(self.url, self.page, day)
+        self.assertTrue(self.archive.put(self.url, None, date(2020, 11, 5), not_found=True))
+
+        self.assertIsNone(self.archive.get(date(2020, 11, 5), self.url))
+        self.assertTrue(self.archive.not_found(date(2020, 11, 5), self.url))
+        self.assertFalse(self.archive.not_found(day, self.url))
+        self.assertEqual(self.archive.get(day, self.url), self.page)
+        # page found again refers to the last record with content
+        self.assertTrue(self.archive.put(self.url, self.page, date(2020, 11, 6)))
+        self.assertEqual(self.archive.get(date(2020, 11, 6), self.url), self.page)
+
+        # replay returns the same 404 as the crawl, page missing in the archive is not archived
+        session = ArchiveSession(self.archive, date(2020, 11, 5))
+        with self.assertRaises(requests.exceptions.HTTPError) as not_found:
+            session.get(self.url)
+        with self.assertRaises(requests.exceptions.HTTPError) as not_archived:
+            session.get(self.url + "?page=2")
+        self.assertEqual(not_found.exception.response.reason, "Not Found")
+        self.assertEqual(not_archived.exception.response.reason, "Not archived")
+
+    def test_get_after_append(self):
+        day = date(2020, 11, 4)
+        self.archive.put(self.url, self.page, day)
+        self.assertEqual(self.archive.get(day, self.url), self.page)
+        # file mapped by the first read grows
+        self.archive.put(self.url + "?page=2", b"<html>2</html>", day)
+        self.assertEqual(self.archive.get(day, self.url + "?page=2"), b"<html>2</html>")
+
+    def test_session(self):
+        day = date(2020, 11, 4)
+        self.archive.put(self.url, self.page, day)
+        session = ArchiveSession(self.archive, day)
+
+        self.assertEqual(session.get(self.url).content, self.page)
+        with self.assertRaises(requests.exceptions.HTTPError):
+            session.get(self.url + "?page=2")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../scraper')))
+from lib.cache import HttpCache
+
+
+class TestHttpCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = HttpCache(os.path.join(self.tmp_dir.name, "http_cache.db"), max_age_days=1, max_size_mb=1)
+        self.url = "https://www.bezrealitky.cz/vypis/nabidka-prodej/byt/praha?page=2"
+        self.rows = [{'typ_nemovistosti': 'Byt', 'region': 'Praha', 'dispozice_nemovitosti': '2+kk', 'rozloha': '60',
+                      'cena_nemovitosti': '6700000', 'odkaz': 'https://www.bezrealitky.cz/nemovitosti-byty-domy/649688'}]
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def test_put_get(self):
+        self.assertIsNone(self.cache.get(self.url))
+        self.cache.put(self.url, '"abc"', None, HttpCache.content_hash(b"page"), self.rows)
+
+        entry = self.cache.get(self.url)
+        self.assertEqual(entry.payload, self.rows)
+        self.assertEqual(entry.content_hash, HttpCache.content_hash(b"page"))
+        self.assertEqual(entry.validators(), {"If-None-Match": '"abc"'})
+
+        self.cache.touch(self.url, None, "Wed, 21 Oct 2015 07:28:00 GMT")
+        self.assertEqual(self.cache.get(self.url).validators(),
+                         {"If-None-Match": '"abc"', "If-Modified-Since": "Wed, 21 Oct 2015 07:28:00 GMT"})
+
+    def test_version(self):
+        self.cache.put(self.url, '"abc"', None, HttpCache.content_hash(b"page"), self.rows)
+        self.cache.close()
+
+        # results parsed by another version of the parser are not used and are evicted
+        self.cache = HttpCache(self.cache.path, max_age_days=1, max_size_mb=1, version="v2")
+        self.assertIsNone(self.cache.get(self.url))
+        self.cache.touch(self.url)
+        self.assertEqual(self.cache.evict(), 1)
+        self.cache.put(self.url, '"abc"', None, HttpCache.content_hash(b"page"), [])
+        self.assertEqual(self.cache.get(self.url).payload, [])
+
+    def test_shared_by_workers(self):
+        self.assertEqual(self.cache._conn.execute("PRAGMA journal_mode").fetchone(), ("wal",))
+
+        # cache of another worker process writes while this one is reading
+        worker = HttpCache(self.cache.path, max_age_days=1, max_size_mb=1)
+        self.cache._conn.execute("BEGIN")
+        self.assertIsNone(self.cache.get(self.url))
+        worker.put(self.url, '"abc"', None, HttpCache.content_hash(b"page"), self.rows)
+        self.cache._conn.commit()
+        worker.close()
+        self.assertEqual(self.cache.get(self.url).payload, self.rows)
+
+    def test_evict_age(self):
+        with patch("lib.cache.time.time", return_value=time.time() - 2 * 24 * 3600):
+            self.cache.put(self.url, None, None, "old", self.rows)
+        self.cache.put(self.url + "0", None, None, "new", self.rows)
+
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertIsNone(self.cache.get(self.url))
+        self.assertIsNotNone(self.cache.get(self.url + "0"))
+
+    def test_evict_size(self):
+        payload = "x" * 400 * 1024
+        for i in range(4):
+            with patch("lib.cache.time.time", return_value=time.time() + i):
+                self.cache.put(self.url + str(i), None, None, str(i), payload)
+
+        # 1 MB holds only two most recently used payloads
+        self.assertEqual(self.cache.evict(), 2)
+        self.assertIsNone(self.cache.get(self.url + "0"))
+        self.assertIsNone(self.cache.get(self.url + "1"))
+        self.assertIsNotNone(self.cache.get(self.url + "3"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../scraper')))
+from lib.checkpoint import CrawlCheckpoint
+
+
+class TestCrawlCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "crawl_checkpoint.db")
+        self.checkpoint = CrawlCheckpoint(self.path, max_age_hours=1)
+        self.rows = [{"odkaz": "https://www.bezrealitky.cz/1", "cena_nemovitosti": "100"}]
+
+    def tearDown(self):
+        self.checkpoint.close()
+        self.tmp_dir.cleanup()
+
+    def test_resume(self):
+        self.assertEqual(self.checkpoint.begin("run"), 0)
+        self.checkpoint.put("https://www.bezrealitky.cz/byt/praha", "Byt", "Praha", self.rows, 57)
+        self.checkpoint.put("https://www.bezrealitky.cz/byt/praha?page=2", "Byt", "Praha", self.rows)
+        self.checkpoint.close()
+
+        # the next run with the same key continues
+        self.checkpoint = CrawlCheckpoint(self.path, max_age_hours=1)
+        self.assertEqual(self.checkpoint.begin("run"), 2)
+        self.assertEqual(self.checkpoint.get("https://www.bezrealitky.cz/byt/praha"), (self.rows, 57))
+        self.assertEqual(self.checkpoint.get("https://www.bezrealitky.cz/byt/praha?page=2"), (self.rows, None))
+        self.assertIsNone(self.checkpoint.get("https://www.bezrealitky.cz/byt/praha?page=3"))
+
+    def test_new_run(self):
+        self.checkpoint.begin("run")
+        self.checkpoint.put("https://www.bezrealitky.cz/byt/praha", "Byt", "Praha", self.rows, 57)
+
+        # different crawl starts from scratch
+        self.assertEqual(self.checkpoint.begin("incremental run"), 0)
+        self.assertIsNone(self.checkpoint.get("https://www.bezrealitky.cz/byt/praha"))
+
+        # so does too old crawl
+        self.checkpoint.put("https://www.bezrealitky.cz/byt/praha", "Byt", "Praha", self.rows, 57)
+        with patch("lib.checkpoint.time.time", return_value=time.time() + 3601):
+            self.assertEqual(self.checkpoint.begin("incremental run"), 0)
+
+    def test_finish(self):
+        self.checkpoint.begin("run")
+        self.checkpoint.put("https://www.bezrealitky.cz/byt/praha", "Byt", "Praha", self.rows, 57)
+        self.checkpoint.finish()
+
+        self.assertEqual(self.checkpoint.begin("run"), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,261 @@
+import unittest
+import sqlite3
+import tempfile
+from datetime import date, timedelta
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../scraper')))
+from lib.support_functions import get_path, init_config
+from lib.database import Database
+from lib.scraper import BezrealitkyScraper
+
+
+class TestDatabase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.sql = init_config(get_path("config", "sql.yaml"))
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = Database(None, self.sql)
+        self.db.scraper_database = os.path.join(self.tmp_dir.name, "scraper_data.db")
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def get_ads(ads, download_date=date(2020, 11, 4)):
+        return BezrealitkyScraper.create_df([{
+            'typ_nemovistosti': 'Byt',
+            'region': 'Praha',
+            'dispozice_nemovitosti': '2+kk',
+            'rozloha': '60',
+            'cena_nemovitosti': price,
+            'odkaz': 'https://www.bezrealitky.cz/nemovitosti-byty-domy/{}'.format(ad_id)} for ad_id, price in ads],
+            download_date)
+
+    def query(self, sql):
+        with sqlite3.connect(self.db.scraper_database) as conn:
+            return conn.execute(sql).fetchall()
+
+    def test_stream_to_db(self):
+        batches = [self.get_ads([(1, "100"), (2, "200")]), self.get_ads([(3, "300")])]
+        self.db.stream_to_db(iter(batches))
+
+        stage = self.db.read_stage("Byt")
+        self.assertEqual(len(stage.index), 3)
+        self.assertEqual(list(stage["cena_nemovitosti"]), [100, 200, 300])
+        self.assertEqual(list(stage["datum_stazeni"].unique()), ["2020-11-04"])
+        self.assertEqual(self.query("select distinct start_date from H_Realty"), [(20201104,)])
+        self.assertEqual(self.query("select count(*) from H_Realty where end_date = 99991231"), [(3,)])
+        self.assertEqual(self.query("select ad_id, odkaz from Realty_ad order by ad_id")[0],
+                         (1, 'https://www.bezrealitky.cz/nemovitosti-byty-domy/1'))
+        self.assertEqual(self.query("select * from Dim_region"), [(1, "Praha")])
+        # run is logged with the date of the crawl
+        self.assertEqual(self.query("select run_date, full_sweep from Crawl_log"), [("2020-11-04", 1)])
+        self.assertTrue(self.db.full_sweep_due(1))
+
+    def test_failed_batch_aborts_load(self):
+        self.db.create_table()
+        self.assertEqual(self.db.insert_batches([self.get_ads([(5, "500")])]), 1)
+        batches = [self.get_ads([(1, "100"), (2, "200")]), self.get_ads([(3, "300"), (1, "100")]),
+                   self.get_ads([(4, "400")])]
+        row_count = self.db.insert_batches(iter(batches))
+
+        # the previous stage is kept
+        self.assertIsNone(row_count)
+        self.assertEqual(self.query("select ad_id from Realty_stg"), [(5,)])
+        self.assertEqual(self.query("PRAGMA journal_mode"), [("wal",)])
+
+    def test_failed_batch_keeps_history(self):
+        self.db.stream_to_db([self.get_ads([(1, "100"), (2, "200"), (3, "300")])])
+        history = self.query("select * from H_Realty order by ad_id, end_date")
+        # ads 2 and 3 are still listed, their batch fails on duplicate ad 1
+        batches = [self.get_ads([(1, "150")], date(2020, 11, 5)),
+                   self.get_ads([(2, "200"), (3, "300"), (1, "150")], date(2020, 11, 5))]
+
+        self.assertFalse(self.db.stream_to_db(iter(batches)))
+        self.assertEqual(self.query("select * from H_Realty order by ad_id, end_date"), history)
+        self.assertEqual(self.query("select run_date from Crawl_log"), [("2020-11-04",)])
+
+    def test_can_replay(self):
+        self.assertTrue(self.db.can_replay(date(2020, 11, 4)))
+        self.db.stream_to_db([self.get_ads([(1, "100")])])
+        self.db.stream_to_db([self.get_ads([(1, "150")], date(2020, 11, 5))])
+
+        self.assertFalse(self.db.can_replay(date(2020, 11, 4)))
+        self.assertTrue(self.db.can_replay(date(2020, 11, 5)))
+
+    def test_historisation(self):
+        self.db.stream_to_db([self.get_ads([(1, "100"), (2, "200"), (3, "300")])])
+        # ad 1 changed price, ad 2 was deleted, ad 4 is new
+        self.db.stream_to_db([self.get_ads([(1, "150"), (3, "300"), (4, "400")], date(2020, 11, 5))])
+
+        self.assertEqual(self.db.get_open_ads(), {
+            'https://www.bezrealitky.cz/nemovitosti-byty-domy/1': 150,
+            'https://www.bezrealitky.cz/nemovitosti-byty-domy/3': 300,
+            'https://www.bezrealitky.cz/nemovitosti-byty-domy/4': 400})
+        self.assertEqual(self.query("select count(*) from H_Realty"), [(5,)])
+        # versions are closed by the date of the crawl
+        self.assertEqual(self.query("select distinct end_date from H_Realty where end_date <> 99991231"),
+                         [(20201105,)])
+        self.assertEqual(self.query("select distinct start_date, end_date from V_Realty where odkaz like '%/2'"),
+                         [("2020-11-04", "2020-11-05")])
+
+    def test_historisation_same_day(self):
+        self.db.stream_to_db([self.get_ads([(1, "100"), (2, "200"), (3, "300")])])
+        self.db.full_snapshot = False
+        # hourly incremental runs of the next day - ad 1 is repriced twice, ad 4 is new
+        self.assertTrue(self.db.stream_to_db([self.get_ads([(1, "150"), (4, "400")], date(2020, 11, 5))]))
+        self.assertTrue(self.db.stream_to_db([self.get_ads([(1, "120"), (4, "450")], date(2020, 11, 5))]))
+        self.db.full_snapshot = True
+        # ad 4 is deleted on the day it was published
+        self.assertTrue(self.db.stream_to_db([self.get_ads([(1, "130"), (2, "200"), (3, "300")], date(2020, 11, 5))]))
+
+        self.assertEqual(self.query("select ad_id, cena_nemovitosti, start_date, end_date from H_Realty "
+                                    "order by ad_id, end_date"), [
+            (1, 100, 20201104, 20201105), (1, 130, 20201105, 99991231),
+            (2, 200, 20201104, 99991231), (3, 300, 20201104, 99991231)])
+
+    def test_historisation_plans(self):
+        self.db.create_table()
+        conn = self.db.connect()
+        # lookups go by ad id, partial index of earlier releases is dropped
+        for dml in [self.db.deleted_dml, self.db.changed_dml, self.db.same_day_changed_dml]:
+            plan = " ".join(row[-1] for row in conn.execute("explain query plan " + dml))
+            self.assertIn("SEARCH Realty_stg USING INTEGER PRIMARY KEY", plan)
+        plan = " ".join(row[-1] for row in conn.execute("explain query plan " + self.db.new_dml))
+        self.assertIn("SEARCH H_Realty USING PRIMARY KEY (ad_id=? AND end_date=?)", plan)
+
+        conn.execute("CREATE INDEX H_Realty_open ON H_Realty (ad_id, cena_nemovitosti) WHERE end_date = 99991231")
+        self.db.close()
+        self.db.create_table()
+        self.assertEqual(self.query("select name from sqlite_master where name = 'H_Realty_open'"), [])
+
+    def test_historisation_is_atomic(self):
+        self.db.stream_to_db([self.get_ads([(1, "100"), (2, "200")])])
+        self.db.new_dml = "insert into H_Realty (ad_id) values (1)"
+        self.db.stream_to_db([self.get_ads([(1, "150"), (3, "300")], date(2020, 11, 5))])
+
+        # price change and deletion are rolled back together with the failed insert
+        self.assertEqual(self.query("select odkaz, cena_nemovitosti, end_date from V_Realty order by odkaz"), [
+            ('https://www.bezrealitky.cz/nemovitosti-byty-domy/1', 100, '9999-12-31'),
+            ('https://www.bezrealitky.cz/nemovitosti-byty-domy/2', 200, '9999-12-31')])
+
+    def test_incremental_keeps_unseen_ads(self):
+        self.db.stream_to_db([self.get_ads([(1, "100"), (2, "200")])])
+        self.db.full_snapshot = False
+        self.db.stream_to_db([self.get_ads([(3, "300")], date(2020, 11, 5))])
+
+        self.assertEqual(len(self.db.get_open_ads()), 3)
+
+    def test_refresh_report_tables(self):
+        # deleted ads are closed with the current date
+        yesterday, today = date.today() - timedelta(days=1), date.today()
+        self.db.stream_to_db([self.get_ads([(1, "6000000"), (2, "1200000"), (3, "3000000")], yesterday)])
+        self.db.refresh_report_tables()
+        # ad 1 changed price, ad 2 was deleted, ad 4 is new
+        self.db.stream_to_db([self.get_ads([(1, "5400000"), (3, "3000000"), (4, "2400000")], today)])
+        self.db.refresh_report_tables()
+        self.db.refresh_report_tables()
+
+        trend, activity = self.db.read_trends("Byt")
+        self.assertEqual(list(trend["median_price_m2"]), [50000, 50000])
+        self.assertEqual(list(trend["report_date"]), [yesterday.isoformat(), today.isoformat()])
+        self.assertEqual(activity.values.tolist(), [[yesterday.isoformat(), 3, 0, 0], [today.isoformat(), 1, 1, 1]])
+
+    def test_details(self):
+        self.db.stream_to_db([self.get_ads([(1, "100"), (2, "200")])])
+        self.assertEqual(self.db.get_detail_candidates(), [
+            ('https://www.bezrealitky.cz/nemovitosti-byty-domy/1', 100),
+            ('https://www.bezrealitky.cz/nemovitosti-byty-domy/2', 200)])
+
+        details = [{"odkaz": odkaz, "cena_nemovitosti": price, "podlazi": "3", "lat": 50.1}
+                   for odkaz, price in self.db.get_detail_candidates()]
+        self.assertEqual(self.db.save_details(iter(details), batch_size=1), 2)
+        self.assertEqual(self.db.get_detail_candidates(), [])
+
+        # only new and repriced ads are enriched again
+        self.db.stream_to_db([self.get_ads([(1, "150"), (2, "200"), (3, "300")], date(2020, 11, 5))])
+        self.assertEqual(self.db.get_detail_candidates(), [
+            ('https://www.bezrealitky.cz/nemovitosti-byty-domy/1', 150),
+            ('https://www.bezrealitky.cz/nemovitosti-byty-domy/3', 300)])
+        self.assertEqual(self.query("select podlazi, typ_budovy, lat from Realty_detail where ad_id = 2"),
+                         [("3", None, 50.1)])
+
+    def test_migrate(self):
+        link = "https://www.bezrealitky.cz/nemovitosti-byty-domy/{}-nabidka-prodej-bytu"
+        with sqlite3.connect(self.db.scraper_database) as conn:
+            # layout keyed by links with texts and ISO dates
+            conn.execute("CREATE TABLE Realty_stg (cena_nemovitosti INTEGER, dispozice_nemovitosti TEXT, "
+                         "odkaz TEXT PRIMARY KEY, region TEXT, rozloha INTEGER, typ_nemovistosti TEXT, datum_stazeni DATE)")
+            conn.execute("CREATE TABLE H_Realty (odkaz TEXT NOT NULL, cena_nemovitosti INTEGER NOT NULL, "
+                         "dispozice_nemovitosti TEXT, region TEXT NOT NULL, rozloha INTEGER NOT NULL, "
+                         "typ_nemovistosti TEXT NOT NULL, start_date DATE NOT NULL, end_date DATE NOT NULL, "
+                         "PRIMARY KEY (odkaz, end_date))")
+            conn.execute("CREATE INDEX H_Realty_open ON H_Realty (odkaz, cena_nemovitosti) "
+                         "WHERE end_date = '9999-12-31'")
+            conn.executemany("insert into H_Realty values (?, ?, ?, ?, ?, ?, ?, ?)", [
+                (link.format(1), 100, "2+kk", "Praha", 60, "Byt", "2020-11-04", "2020-11-05"),
+                (link.format(1), 150, "2+kk", "Praha", 60, "Byt", "2020-11-05", "9999-12-31"),
+                (link.format(2), 200, None, "Plzeňský kraj", 120, "Dům", "2020-11-04", "9999-12-31")])
+            conn.execute("insert into Realty_stg values (150, '2+kk', ?, 'Praha', 60, 'Byt', '2020-11-05')",
+                         (link.format(1),))
+            legacy = conn.execute("select * from H_Realty order by odkaz, end_date").fetchall()
+
+        self.assertTrue(self.db.migrate())
+        self.assertFalse(self.db.migrate())
+        self.db.create_table()
+
+        self.assertEqual(self.query("select odkaz, cena_nemovitosti, dispozice_nemovitosti, region, rozloha, "
+                                    "typ_nemovistosti, start_date, end_date from V_Realty order by odkaz, end_date"),
+                         legacy)
+        self.assertEqual(self.query("select ad_id, start_date, end_date from H_Realty order by ad_id, end_date"),
+                         [(1, 20201104, 20201105), (1, 20201105, 99991231), (2, 20201104, 99991231)])
+        self.assertEqual(self.query("select ad_id, cena_nemovitosti from Realty_stg"), [(1, 150)])
+        self.assertEqual(self.query("select name from sqlite_master where name like '%legacy'"), [])
+        # history continues in the new layout, ad 1 keeps its versions under the new link
+        self.db.stream_to_db([self.get_ads([(1, "150"), (3, "300")], date(2020, 11, 6))])
+        self.assertEqual(self.db.get_open_ads(), {
+            'https://www.bezrealitky.cz/nemovitosti-byty-domy/1': 150,
+            'https://www.bezrealitky.cz/nemovitosti-byty-domy/3': 300})
+        self.assertEqual(self.query("select count(*) from H_Realty where ad_id = 1"), [(2,)])
+
+    def test_migrate_refuses_colliding_ids(self):
+        with sqlite3.connect(self.db.scraper_database) as conn:
+            conn.execute("CREATE TABLE H_Realty (odkaz TEXT NOT NULL, cena_nemovitosti INTEGER NOT NULL, "
+                         "dispozice_nemovitosti TEXT, region TEXT NOT NULL, rozloha INTEGER NOT NULL, "
+                         "typ_nemovistosti TEXT NOT NULL, start_date DATE NOT NULL, end_date DATE NOT NULL, "
+                         "PRIMARY KEY (odkaz, end_date))")
+            # two slugs of ad 1 would be merged into one ad
+            conn.executemany("insert into H_Realty values (?, 100, '2+kk', 'Praha', 60, 'Byt', '2020-11-04', "
+                             "'9999-12-31')", [("https://www.bezrealitky.cz/nemovitosti-byty-domy/1-praha",),
+                                              ("https://www.bezrealitky.cz/nemovitosti-byty-domy/1-brno",)])
+
+        with self.assertRaisesRegex(ValueError, "1 ad id"):
+            self.db.migrate()
+        self.assertFalse(self.db.create_table())
+        self.assertFalse(self.db.stream_to_db([self.get_ads([(1, "100")])]))
+        self.assertEqual(self.query("select count(*) from H_Realty"), [(2,)])
+        self.assertEqual(self.query("select name from sqlite_master where type = 'table'"), [("H_Realty",)])
+
+    def test_read_report_data(self):
+        self.db.stream_to_db([self.get_ads([(1, "100"), (2, "200")])])
+        self.db.stream_to_db([self.get_ads([(1, "150")], date(2020, 11, 5))])
+
+        history = self.db.read_report_data("Byt", "history")
+        self.assertEqual(list(history.columns), ["typ_nemovistosti", "region", "dispozice_nemovitosti", "rozloha",
+                                                 "cena_nemovitosti"])
+        self.assertEqual(str(history["cena_nemovitosti"].dtype), "int32")
+        self.assertEqual(sorted(history["cena_nemovitosti"]), [150])
+        self.assertEqual(list(self.db.read_report_data("Byt", "stage", chunksize=1)["cena_nemovitosti"]), [150])
+        self.assertTrue(self.db.read_report_data("Dům").empty)
+        with self.assertRaises(ValueError):
+            self.db.read_report_data("Byt", "web")
+
+
+if __name__ == '__main__':
+    unittest.main()
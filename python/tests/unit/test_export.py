@@ -0,0 +1,74 @@
+import unittest
+import importlib.util
+import tempfile
+from datetime import date
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../scraper')))
+from lib.export import SnapshotExport
+from lib.scraper import BezrealitkyScraper
+
+
+@unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+class TestSnapshotExport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.export = SnapshotExport(self.tmp_dir.name, row_group_size=2)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def get_ads(ads, download_date):
+        return BezrealitkyScraper.create_df([{
+            'typ_nemovistosti': 'Byt',
+            'region': region,
+            'dispozice_nemovitosti': '2+kk',
+            'rozloha': '60',
+            'cena_nemovitosti': price,
+            'odkaz': 'https://www.bezrealitky.cz/nemovitosti-byty-domy/{}'.format(ad_id)} for ad_id, price, region in ads],
+            download_date)
+
+    def test_write(self):
+        batches = [self.get_ads([(1, "100", "Praha"), (2, "200", "Brno")], date(2020, 11, 4)),
+                   self.get_ads([(3, "300", "Praha")], date(2020, 11, 4))]
+        self.assertEqual(list(self.export.write(iter(batches))), batches)
+
+        table = self.export.read(self.export.daily_path(date(2020, 11, 4)))
+        self.assertEqual(table.schema, self.export.schema)
+        self.assertEqual(table.column("cena_nemovitosti").to_pylist(), [100, 200, 300])
+        self.assertEqual(table.column("datum_stazeni").to_pylist(), [date(2020, 11, 4)] * 3)
+        self.assertEqual(str(table.schema.field("region").type), "dictionary<values=string, indices=int32, ordered=0>")
+
+    def test_failed_crawl_keeps_partition(self):
+        list(self.export.write([self.get_ads([(1, "100", "Praha")], date(2020, 11, 4))]))
+
+        def failing_crawl():
+            yield self.get_ads([(2, "200", "Praha")], date(2020, 11, 4))
+            raise SystemError(1)
+
+        with self.assertRaises(SystemError):
+            list(self.export.write(failing_crawl()))
+        table = self.export.read(self.export.daily_path(date(2020, 11, 4)))
+        self.assertEqual(table.column("cena_nemovitosti").to_pylist(), [100])
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir.name, "daily")), ["2020-11-04.parquet"])
+
+    def test_compact(self):
+        for day, price in [(date(2020, 10, 2), "200"), (date(2020, 10, 1), "100"), (date(2020, 11, 1), "300")]:
+            list(self.export.write([self.get_ads([(1, price, "Praha"), (2, price, "Brno")], day)]))
+
+        self.assertEqual(self.export.compact(date(2020, 11, 5)), ["2020-10"])
+        # late partition is merged to the existing month
+        list(self.export.write([self.get_ads([(1, "150", "Ostrava")], date(2020, 10, 31))]))
+        self.assertEqual(self.export.compact(date(2020, 11, 5)), ["2020-10"])
+
+        monthly = self.export.read(self.export.monthly_path("2020-10"))
+        self.assertEqual(monthly.column("cena_nemovitosti").to_pylist(), [100, 100, 200, 200, 150])
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir.name, "daily")), ["2020-11-01.parquet"])
+        self.assertEqual(self.export.dataset().count_rows(), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import json
+import sys
+import os
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../scraper')))
+from lib.support_functions import get_path
+from lib.graphql import GraphQLSource, parse_disposition
+
+
+class TestGraphQLSource(unittest.TestCase):
+
+    def setUp(self):
+        self.source = GraphQLSource("https://api.bezrealitky.cz/graphql/", 200)
+        self.region = {"id": "435514", "name": "Praha", "uri": "praha", "__typename": "Region"}
+        with open(get_path("python", "tests", "unit", "fixtures", "graphql_praha.json"), "rb") as response:
+            self.response = response.read()
+
+    @staticmethod
+    def variables(url):
+        return json.loads(parse_qs(urlsplit(url).query)["variables"][0])
+
+    def test_from_config(self):
+        self.assertIsNone(GraphQLSource.from_config({}))
+        self.assertIsNone(GraphQLSource.from_config({"source": "html"}))
+        # unverified source is not used without explicit opt-in
+        self.assertIsNone(GraphQLSource.from_config({"source": "graphql"}))
+        self.assertIsNone(GraphQLSource.from_config({"source": "graphql", "graphql": {"experimental": "N"}}))
+        source = GraphQLSource.from_config({"source": "graphql", "graphql": {"endpoint": "http://localhost/graphql/",
+                                                                            "page_size": 50, "experimental": "Y"}})
+        self.assertEqual((source.endpoint, source.page_size), ("http://localhost/graphql/", 50))
+
+    def test_parse_disposition(self):
+        self.assertEqual(parse_disposition("DISP_2_KK"), "2+kk")
+        self.assertEqual(parse_disposition("DISP_3_1"), "3+1")
+        self.assertEqual(parse_disposition("GARSONIERA"), "Garsoniéra")
+        self.assertIsNone(parse_disposition(None))
+
+    def test_page_url(self):
+        url = self.source.section_url("chata-chalupa", self.region)
+        self.assertTrue(url.startswith("https://api.bezrealitky.cz/graphql/?query=query+ListAdverts"))
+        variables = self.variables(url)
+        self.assertEqual(variables["estateType"], ["REKREACNI_OBJEKT"])
+        self.assertEqual(variables["regionOsmIds"], ["435514"])
+        self.assertEqual((variables["limit"], variables["offset"]), (200, 0))
+
+        third_page = self.source.page_url(url, 3)
+        self.assertEqual(self.variables(third_page), dict(variables, offset=400))
+        self.assertEqual(self.source.page_url(third_page, 1), url)
+
+    def test_extract_content(self):
+        parsed_page, last_page = self.source.extract_content(self.response, "byt", "Praha")
+
+        self.assertEqual(last_page, 3)
+        self.assertEqual(len(parsed_page), 5)
+        # the same row as parsed from the listing page (test_scraper.test_extract_content)
+        self.assertEqual(parsed_page[0], {
+            'typ_nemovistosti': 'byt',
+            'region': 'Praha',
+            'dispozice_nemovitosti': '2+kk',
+            'rozloha': '60',
+            'cena_nemovitosti': '6700000',
+            'odkaz': 'https://www.bezrealitky.cz/nemovitosti-byty-domy/649688-nabidka-prodej-bytu-kurta-konrada-praha'})
+        self.assertEqual([ad["dispozice_nemovitosti"] for ad in parsed_page[1:]], ["3+1", "Garsoniéra", "Ostatní", "1+kk"])
+        # price on request is dropped by cleaning as on the listing page
+        self.assertIsNone(parsed_page[4]["cena_nemovitosti"])
+
+    def test_extract_content_errors(self):
+        response = b'{"errors": [{"message": "Cannot query field \\"listAdverts\\""}], "data": null}'
+        with self.assertRaisesRegex(ValueError, "Cannot query field"):
+            self.source.extract_content(response, "byt", "Praha")
+        for response in (b'{"data": null}', b'{"data": {"listAdverts": null}}'):
+            with self.assertRaisesRegex(ValueError, "no listAdverts"):
+                self.source.extract_content(response, "byt", "Praha")
+        self.assertEqual(self.source.extract_content(b'{"data": {"listAdverts": {"totalCount": null, "list": null}}}',
+                                                     "byt", "Praha"), ([], 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from unittest.mock import Mock, patch
+import subprocess
+from datetime import date
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../scraper')))
+from lib.support_functions import get_path
+from main import parse_args, run, store_snapshot
+
+
+class TestMain(unittest.TestCase):
+
+    def test_parse_args(self):
+        args = parse_args(["-report", "N", "--incremental"])
+        self.assertEqual(args.generate_report, "N")
+        self.assertTrue(args.incremental)
+        self.assertFalse(args.no_cache)
+        self.assertIsNone(args.config_path)
+        self.assertFalse(args.report_only)
+
+    def test_parse_args_report_only(self):
+        args = parse_args(["--report-only", "--report-source", "stage"])
+        self.assertTrue(args.report_only)
+        self.assertEqual(args.report_source, "stage")
+        self.assertEqual(parse_args(["--report-only"]).report_source, "history")
+
+    def test_parse_args_replay(self):
+        self.assertEqual(parse_args(["--replay", "2020-11-04"]).replay, date(2020, 11, 4))
+        self.assertIsNone(parse_args([]).replay)
+
+    def test_store_snapshot(self):
+        db, scraper = Mock(), Mock()
+        db.stream_to_db.return_value = False
+        # failed batch - crawl is resumed by the next run
+        self.assertFalse(store_snapshot(db, scraper, iter([])))
+        scraper.finish.assert_not_called()
+
+        db.stream_to_db.return_value = True
+        self.assertTrue(store_snapshot(db, scraper, iter([])))
+        scraper.finish.assert_called_once_with()
+
+    def test_run_stops_before_crawl(self):
+        # legacy database can't be migrated - nothing is crawled
+        with patch("main.Database") as database, patch("main.BezrealitkyScraper") as scraper:
+            database.return_value.create_table.return_value = False
+            run(parse_args(["-report", "N"]))
+        scraper.assert_not_called()
+        database.return_value.close.assert_called_once_with()
+
+    def test_run_closes_history_of_incremental_crawl(self):
+        schema, history, db = Mock(), Mock(), Mock()
+        schema.create_table.return_value = True
+        history.full_sweep_due.return_value = False
+        history.get_open_ads.return_value = {1: 1000000}
+        with patch("main.Database", side_effect=[schema, history, db]), patch("main.BezrealitkyScraper") as scraper, \
+                patch("main.SnapshotExport.from_config", return_value=None), \
+                patch("main.store_snapshot", return_value=True):
+            run(parse_args(["-report", "N", "--incremental"]))
+        history.close.assert_called_once_with()
+        self.assertEqual({1: 1000000}, scraper.call_args.args[3])
+
+    def test_run_skips_report_of_failed_snapshot(self):
+        with patch("main.Database") as database, patch("main.BezrealitkyScraper"), \
+                patch("main.SnapshotExport.from_config", return_value=None), \
+                patch("main.store_snapshot", return_value=False), patch("main.generate_report") as report:
+            database.return_value.create_table.return_value = True
+            run(parse_args(["-report", "Y"]))
+        report.assert_not_called()
+
+        with patch("main.Database") as database, patch("main.BezrealitkyScraper"), \
+                patch("main.SnapshotExport.from_config", return_value=None), \
+                patch("main.store_snapshot", return_value=True), patch("main.generate_report") as report:
+            database.return_value.create_table.return_value = True
+            run(parse_args(["-report", "Y"]))
+        report.assert_called_once_with(database.return_value, "stage")
+
+    def test_report_stack_is_not_imported(self):
+        # fresh interpreter, modules imported by other tests don't count
+        result = subprocess.run(
+            [sys.executable, "-c", "import sys, main; print(any(module in sys.modules for module in "
+                                   "('lib.report', 'matplotlib', 'jinja2')))"],
+            cwd=get_path("python", "scraper"), stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        self.assertEqual(result.stdout.strip(), "False")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import csv
+from datetime import timedelta
+import json
+import tempfile
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../scraper')))
+from lib.metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_timer(self):
+        with self.metrics.timer("extract", url="https://www.bezrealitky.cz/1") as record:
+            record["ads"] = 15
+
+        event, = self.metrics.events
+        self.assertEqual(event["stage"], "extract")
+        self.assertEqual(event["ads"], 15)
+        self.assertEqual(event["url"], "https://www.bezrealitky.cz/1")
+        self.assertGreaterEqual(event["seconds"], 0)
+
+    def test_summary(self):
+        for seconds, size in [(0.1, 1000), (0.3, 3000), (0.2, 2000)]:
+            self.metrics.record("fetch", seconds, url="https://www.bezrealitky.cz", status=200, bytes=size)
+        self.metrics.record("create_df", 0.5, ads=30, rows=28)
+
+        stages = self.metrics.summary()["stages"]
+        self.assertEqual(stages["fetch"]["count"], 3)
+        self.assertAlmostEqual(stages["fetch"]["seconds"], 0.6)
+        self.assertEqual(stages["fetch"]["p50"], 0.2)
+        self.assertEqual(stages["fetch"]["max"], 0.3)
+        self.assertEqual(stages["fetch"]["bytes"], 6000)
+        self.assertNotIn("status", stages["fetch"])
+        self.assertEqual(stages["create_df"]["rows"], 28)
+
+    def test_merge(self):
+        worker = Metrics()
+        worker.started = self.metrics.started + timedelta(seconds=2)
+        worker.record("fetch", 0.1, url="https://www.bezrealitky.cz", status=200, bytes=1000)
+        self.metrics.record("fetch", 0.2, url="https://www.bezrealitky.cz", status=200, bytes=2000)
+
+        self.metrics.merge(worker.events, worker.started, worker="worker-0")
+        local, merged = self.metrics.events
+        self.assertEqual(merged["worker"], "worker-0")
+        self.assertAlmostEqual(merged["start"], worker.events[0]["start"] + 2)
+        self.assertEqual(self.metrics.summary()["stages"]["fetch"]["bytes"], 3000)
+
+    def test_write(self):
+        self.metrics.record("fetch", 0.1, url="https://www.bezrealitky.cz", status=200, bytes=1000)
+        self.metrics.record("insert", 0.2, rows=1000)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            summary_path, events_path = self.metrics.write(os.path.join(tmp_dir, "metrics"))
+            with open(summary_path, encoding="utf8") as summary_file:
+                self.assertEqual(set(json.load(summary_file)["stages"]), {"fetch", "insert"})
+            with open(events_path, encoding="utf8", newline="") as events_file:
+                rows = list(csv.DictReader(events_file))
+
+        self.assertEqual([row["stage"] for row in rows], ["fetch", "insert"])
+        self.assertEqual(rows[1]["rows"], "1000")
+
+
+if __name__ == '__main__':
+    unittest.main()
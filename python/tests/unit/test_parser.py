@@ -0,0 +1,122 @@
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../scraper')))
+from lib.support_functions import get_path
+from lib.parser import (AD_COLUMNS, SoupParser, LxmlParser, get_parser, parse_ad, parse_ad_id, parse_detail,
+                        parse_listing, property_type_slug, select_lastpage)
+
+
+class TestParser(unittest.TestCase):
+    """Every parser backend has to return the same results as BeautifulSoup
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.homepage = cls.get_fixtures("base_url.html")
+        cls.page = cls.get_fixtures("url_praha.html")
+        cls.detail = cls.get_fixtures("detail.html")
+        cls.soup_parser = SoupParser()
+        cls.lxml_parser = LxmlParser()
+
+    @staticmethod
+    def get_fixtures(file):
+        file_path = get_path("python", "tests", "unit", "fixtures", file)
+        with open(file_path, "rb") as html:
+            return html.read()
+
+    def test_get_parser(self):
+        self.assertIsInstance(get_parser("bs4"), SoupParser)
+        self.assertIsInstance(get_parser("lxml"), LxmlParser)
+        with self.assertRaises(ValueError):
+            get_parser("regex")
+
+    def test_extract_content(self):
+        for prop_type in ("Byt", "Dům"):
+            expected = self.soup_parser.extract_content(self.soup_parser.parse(self.page), prop_type, "Praha")
+            result = self.lxml_parser.extract_content(self.lxml_parser.parse(self.page), prop_type, "Praha")
+            self.assertEqual(len(result), 10)
+            self.assertEqual(result, expected)
+
+    def test_parse_listing(self):
+        expected = self.soup_parser.extract_content(self.soup_parser.parse(self.page), "Byt", "Praha")
+        for engine in ("bs4", "lxml"):
+            rows, last_page = parse_listing(engine, self.page, "Byt", "Praha", lastpage=True)
+            self.assertEqual([dict(zip(AD_COLUMNS, row)) for row in rows], expected)
+            self.assertEqual(last_page, 57)
+        self.assertIsNone(parse_listing("lxml", self.page, "Byt", "Praha")[1])
+
+    def test_get_property_type(self):
+        prop_type = ["byt", "dum", "garaz"]
+        expected = self.soup_parser.get_property_type(self.soup_parser.parse(self.homepage), prop_type)
+        result = self.lxml_parser.get_property_type(self.lxml_parser.parse(self.homepage), prop_type)
+        self.assertEqual(result, expected)
+        self.assertEqual(list(result.values()), prop_type)
+
+    def test_get_regions(self):
+        expected = self.soup_parser.get_regions(self.soup_parser.parse(self.homepage))
+        result = self.lxml_parser.get_regions(self.lxml_parser.parse(self.homepage))
+        self.assertEqual(len(result), 14)
+        self.assertEqual(result, expected)
+
+    def test_get_lastpage(self):
+        self.assertEqual(self.soup_parser.get_lastpage(self.soup_parser.parse(self.page)), 57)
+        self.assertEqual(self.lxml_parser.get_lastpage(self.lxml_parser.parse(self.page)), 57)
+
+    def test_extract_detail(self):
+        expected = {"podlazi": "3", "typ_budovy": "Cihla", "vlastnictvi": "Osobní", "energeticka_trida": "C",
+                    "lat": 50.1048, "lng": 14.4893}
+        self.assertEqual(self.soup_parser.extract_detail(self.soup_parser.parse(self.detail)), expected)
+        self.assertEqual(self.lxml_parser.extract_detail(self.lxml_parser.parse(self.detail)), expected)
+
+        # page without parameters and map
+        self.assertEqual(self.lxml_parser.extract_detail(self.lxml_parser.parse(self.page)),
+                         dict.fromkeys(expected))
+
+    def test_parse_detail(self):
+        detail = parse_detail([("Konstrukce\n budovy:", " Panel "), ("PENB:", "Mimořádně nehospodárná"),
+                               ("Podlaží:", "")], "50,1", None)
+        self.assertEqual(detail, {"podlazi": None, "typ_budovy": "Panel", "vlastnictvi": None,
+                                  "energeticka_trida": "Mimořádně nehospodárná", "lat": None, "lng": None})
+
+    def test_parse_ad(self):
+        ad = parse_ad("\n   6.700.000 Kč\n", "\n   Prodej bytu 2+kk, 60 m²\n", "/649688", "Byt", "Praha")
+        self.assertEqual((ad["cena_nemovitosti"], ad["dispozice_nemovitosti"], ad["rozloha"]), ("6700000", "2+kk", "60"))
+        self.assertEqual(ad["odkaz"], "https://www.bezrealitky.cz/649688")
+
+        notes = {"Dům": "Prodej domu, 1.150 m²", "Chata, chalupa": "Prodej chaty, chalupy, 80 m²",
+                 "Nebytový prostor": "Prodej nebytového\xa0prostoru, 45 m²",
+                 # property type missing in the table
+                 "Vinný sklep": "Prodej vinného sklepa, 30 m²"}
+        areas = {"Dům": "1150", "Chata, chalupa": "80", "Nebytový prostor": "45", "Vinný sklep": "30"}
+        for prop_type, note in notes.items():
+            ad = parse_ad("1 Kč", note, "/1", prop_type, "Praha")
+            self.assertIsNone(ad["dispozice_nemovitosti"])
+            self.assertEqual(ad["rozloha"], areas[prop_type])
+
+    def test_parse_ad_id(self):
+        self.assertEqual(parse_ad_id(
+            "https://www.bezrealitky.cz/nemovitosti-byty-domy/649688-nabidka-prodej-bytu-kurta-konrada-praha"), 649688)
+        self.assertEqual(parse_ad_id("https://www.bezrealitky.cz/nemovitosti-byty-domy/1"), 1)
+        self.assertEqual(parse_ad_id("https://www.bezrealitky.cz/nemovitosti-byty-domy/12-praha/?utm=1-2#3"), 12)
+        # link without the id gets a stable negative id
+        self.assertLess(parse_ad_id("https://www.bezrealitky.cz/nemovitosti-byty-domy/bez-cisla"), 0)
+        self.assertEqual(parse_ad_id("https://www.bezrealitky.cz/nemovitosti-byty-domy/bez-cisla"),
+                         parse_ad_id("https://www.bezrealitky.cz/nemovitosti-byty-domy/bez-cisla"))
+
+    def test_property_type_slug(self):
+        self.assertEqual(property_type_slug("Byt"), "byt")
+        self.assertEqual(property_type_slug("Dům"), "dum")
+        self.assertEqual(property_type_slug("Chata, chalupa"), "chata-chalupa")
+        self.assertEqual(property_type_slug("Nebytový prostor"), "nebytovy-prostor")
+
+    def test_select_lastpage(self):
+        # compared as numbers, not as strings
+        self.assertEqual(select_lastpage(["1", "2", "3", "4", "5", "...", "12"]), 12)
+        # region without pagination has one page
+        self.assertEqual(select_lastpage([]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
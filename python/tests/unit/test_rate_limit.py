@@ -0,0 +1,51 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, sleep
+import threading
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../scraper')))
+from lib.rate_limit import RateLimiter
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_invalid_args(self):
+        with self.assertRaises(ValueError):
+            RateLimiter(0, 1)
+        with self.assertRaises(ValueError):
+            RateLimiter(1, 0)
+
+    def test_rate(self):
+        limiter = RateLimiter(requests_per_second=50, max_in_flight=1)
+        start = perf_counter()
+        for _ in range(11):
+            with limiter:
+                pass
+        # first token is available immediately, the other 10 are refilled at 50/s
+        self.assertGreaterEqual(perf_counter() - start, 0.19)
+
+    def test_max_in_flight(self):
+        limiter = RateLimiter(requests_per_second=1000, max_in_flight=2)
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+
+        def request(_):
+            with limiter:
+                with lock:
+                    running[0] += 1
+                    peak[0] = max(peak[0], running[0])
+                sleep(0.01)
+                with lock:
+                    running[0] -= 1
+
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            list(executor.map(request, range(12)))
+
+        self.assertEqual(peak[0], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
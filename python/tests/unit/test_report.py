@@ -3,6 +3,7 @@ from unittest.mock import patch
 from typing import Dict
 import pandas as pd
 import numpy as np
+import tempfile
 from pandas.testing import assert_frame_equal, assert_series_equal
 from datetime import datetime
 
@@ -10,8 +11,8 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../scraper')))
 
-from lib.support_functions import get_folder_path
-from lib.report import ReportHTML
+from lib.support_functions import get_path
+from lib.report import ReportHTML, horizontal_bar_chart, make_pie
 
 
 class TestReportHTML(unittest.TestCase):
@@ -21,13 +22,13 @@ class TestReportHTML(unittest.TestCase):
         df = cls.get_fixtures("df_scraper_data.txt")
         cls.data = df[(df["typ_nemovistosti"] == "Byt")]
         cls.itemsPie = 4
-        cls.output_dir = get_folder_path("python", "tests")
-        cls.template_dir = get_folder_path("templates")
+        cls.output_dir = get_path("python", "tests")
+        cls.template_dir = get_path("templates")
         cls.template_file = "report.html"
 
     @staticmethod
     def get_fixtures(file):
-        file_path = get_folder_path("python", "tests", "unit", "fixtures", file)
+        file_path = get_path("python", "tests", "unit", "fixtures", file)
         df = pd.read_csv(file_path)
         return df
 
@@ -116,11 +117,45 @@ class TestReportHTML(unittest.TestCase):
 
         report = ReportHTML.generate_html(self, template_vars)
 
-        with open(get_folder_path("python", "tests", "unit", "fixtures", "report.html"), "r", encoding="utf8") as rep:
+        with open(get_path("python", "tests", "unit", "fixtures", "report.html"), "r", encoding="utf8") as rep:
             expected_report = rep.read()
 
         self.assertEqual(report, expected_report)
 
+    def test_render_charts(self):
+        sq_m_avg = ReportHTML.get_avg_price_sq_m(self)
+        flats_ttl = ReportHTML.get_total_flats_by_region(self, self.itemsPie)
+        charts = [("prumer.png", horizontal_bar_chart, sq_m_avg, ()),
+                  ("kraje.png", make_pie, flats_ttl, ('Pastel1', 'Počet nabídek podle kraje'))]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            report = ReportHTML(self.data)
+            report.tmp_dir = tmp_dir
+            report.chart_cache = os.path.join(tmp_dir, "charts.json")
+
+            self.assertEqual(report.render_charts(charts), ["prumer.png", "kraje.png"])
+            self.assertTrue(os.path.isfile(os.path.join(tmp_dir, "prumer.png")))
+            self.assertTrue(os.path.isfile(os.path.join(tmp_dir, "kraje.png")))
+            # unchanged data are served from cache, only changed chart is rendered again
+            self.assertEqual(report.render_charts(charts), [])
+            charts[1] = ("kraje.png", make_pie, flats_ttl + 1, ('Pastel1', 'Počet nabídek podle kraje'))
+            self.assertEqual(report.render_charts(charts), ["kraje.png"])
+
+    def test_prepare_trend_vars(self):
+        trend = pd.DataFrame({"report_date": ["2020-11-04", "2020-11-04", "2020-11-05", "2020-11-05"],
+                              "region": ["Praha", "Zlínský kraj", "Praha", "Zlínský kraj"],
+                              "median_price_m2": [100000, 40000, 101000, 40000]})
+        activity = pd.DataFrame({"report_date": ["2020-11-04", "2020-11-05"], "new_ads": [1000, 20],
+                                 "deleted_ads": [0, 15], "repriced_ads": [0, 8]})
+        report = ReportHTML(self.data, trend, activity)
+
+        price_trend = report.get_price_trend()
+        self.assertEqual(list(price_trend.columns), ["Praha", "Zlínský kraj"])
+        self.assertEqual(list(price_trend["Praha"]), [100000, 101000])
+        self.assertEqual(report.prepare_trend_vars(price_trend, report.get_daily_activity(30)), {
+            "trend": True, "trend_od": "04.11.2020", "posledni_den": "05.11.2020", "nove_inzeraty": 20,
+            "smazane_inzeraty": 15, "zmenene_ceny": 8})
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -2,15 +2,25 @@ import unittest
 from unittest.mock import patch
 from bs4 import BeautifulSoup
 from typing import List
-from pandas import DataFrame
+from pandas import CategoricalDtype, DataFrame, Timestamp, concat
+from pandas.api.types import is_datetime64_any_dtype
 from pandas.testing import assert_frame_equal
 from datetime import date
+import requests
+import tempfile
 import sys
 import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../scraper')))
-from lib.support_functions import get_folder_path
-from lib.scraper import BezrealitkyScraper
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../benchmarks')))
+from lib.support_functions import get_path
+from lib.scraper import BezrealitkyScraper, parser_version
+from lib.cache import HttpCache
+from lib.checkpoint import CrawlCheckpoint
+from lib.archive import PageArchive
+from lib.metrics import metrics
+from lib.work_queue import CrawlTask, WorkQueue
+from standin import StandInSite
 
 
 class TestBezrealitkyScraper(unittest.TestCase):
@@ -26,7 +36,7 @@ class TestBezrealitkyScraper(unittest.TestCase):
 
     @staticmethod
     def get_fixtures(file):
-        file_path = get_folder_path("python", "tests", "unit", "fixtures", file)
+        file_path = get_path("python", "tests", "unit", "fixtures", file)
         with open(file_path, encoding="utf8") as html:
             return BeautifulSoup(html, "html.parser")
 
@@ -94,6 +104,7 @@ class TestBezrealitkyScraper(unittest.TestCase):
         self.assertEqual(len(df.index), 10)
         self.assertEqual(df.dtypes.get("cena_nemovitosti"), "int32")
         self.assertEqual(df.dtypes.get("rozloha"), "int32")
+        self.assertEqual(df.dtypes.get("ad_id"), "int64")
 
         result = [{'typ_nemovistosti': 'byt',
                   'region': 'Praha',
@@ -101,13 +112,378 @@ class TestBezrealitkyScraper(unittest.TestCase):
                   'rozloha': '60',
                   'cena_nemovitosti': '6700000',
                   'odkaz': 'https://www.bezrealitky.cz/nemovitosti-byty-domy/649688-nabidka-prodej-bytu-kurta-konrada-praha',
-                  'datum_stazeni': date.today()}]
+                  'datum_stazeni': Timestamp(date.today()),
+                  'ad_id': 649688}]
 
         df_result = DataFrame(result)
         df_result = df_result.astype({'cena_nemovitosti': 'int32', 'rozloha': 'int32'})
 
         self.assertFalse(df.empty)
-        assert_frame_equal(df_result, df.head(1), check_dtype=True)
+        for column in ("typ_nemovistosti", "region", "dispozice_nemovitosti"):
+            self.assertIsInstance(df.dtypes.get(column), CategoricalDtype)
+        self.assertTrue(is_datetime64_any_dtype(df.dtypes.get("datum_stazeni")))
+        assert_frame_equal(df_result, df.head(1).astype({"typ_nemovistosti": object, "region": object,
+                                                         "dispozice_nemovitosti": object}), check_dtype=False)
+        assert_frame_equal(df_result[["rozloha", "cena_nemovitosti"]], df.head(1)[["rozloha", "cena_nemovitosti"]])
+
+    def test_create_df_cleaning(self):
+        ad = {'typ_nemovistosti': 'Byt', 'region': 'Praha', 'dispozice_nemovitosti': '2+kk', 'rozloha': '60',
+              'cena_nemovitosti': '6700000', 'odkaz': 'https://www.bezrealitky.cz/nemovitosti-byty-domy/1'}
+        ads = [ad,
+               dict(ad, rozloha=''),
+               dict(ad, rozloha=None),
+               dict(ad, dispozice_nemovitosti=''),
+               dict(ad, dispozice_nemovitosti=None),
+               dict(ad, typ_nemovistosti='Dům', dispozice_nemovitosti=None),
+               dict(ad, cena_nemovitosti='1'),
+               dict(ad, cena_nemovitosti=''),
+               dict(ad, cena_nemovitosti=None),
+               dict(ad, cena_nemovitosti='6700000+provize')]
+        df = BezrealitkyScraper.create_df(ads)
+
+        self.assertEqual(list(df.index), [0, 5])
+        self.assertEqual(list(df["typ_nemovistosti"]), ['Byt', 'Dům'])
+
+    def test_main(self):
+        scraper = BezrealitkyScraper(self.base_url, ["byt"], {"crawl": {"requests_per_second": 100, "max_in_flight": 4}})
+        requested = []
+        pages = {}
+        for file in ("base_url.html", "url_praha.html"):
+            with open(get_path("python", "tests", "unit", "fixtures", file), "rb") as html:
+                pages[file] = html.read()
+
+        def fetch(url, headers=None, missing_ok=False):
+            requested.append(url)
+            response = requests.Response()
+            response.status_code = 200
+            response._content = pages["base_url.html"] if url == self.base_url else pages["url_praha.html"]
+            return response
+
+        extract = scraper.extract
+        page_ids = {}
+
+        def extract_page(doc, url, prop_type, region):
+            # every page of the mocked site has different ads
+            prefix = "/nemovitosti-byty-domy/{}".format(page_ids.setdefault(url, len(page_ids) + 1))
+            return [dict(ad, odkaz=ad["odkaz"].replace("/nemovitosti-byty-domy/", prefix))
+                    for ad in extract(doc, url, prop_type, region)]
+
+        with patch.object(scraper, "fetch", side_effect=fetch), \
+                patch.object(scraper, "extract", side_effect=extract_page), \
+                patch.object(scraper.parser, "get_lastpage", return_value=3):
+            df = scraper.main()
+
+        # homepage + 14 regions x 3 pages
+        self.assertEqual(len(requested), 1 + 14 * 3)
+        self.assertIn("https://www.bezrealitky.cz/vypis/nabidka-prodej/byt/praha?page=3", requested)
+        self.assertEqual(len(df.index), 14 * 3 * 10)
+        # rows keep the order of regions from homepage
+        self.assertEqual(df["region"].iloc[0], "Plzeňský kraj")
+        self.assertEqual(df["region"].iloc[-1], "Praha")
+
+    def test_iter_batches(self):
+        parsed_page = BezrealitkyScraper.extract_content(self.soup, "Byt", "Praha")
+        pages = [[dict(ad, odkaz=ad["odkaz"].replace("/nemovitosti-byty-domy/", "/nemovitosti-byty-domy/{}".format(i + 1)))
+                  for ad in parsed_page] for i in range(5)]
+        scraper = BezrealitkyScraper(self.base_url, self.prop_type)
+        with patch.object(scraper, "iter_pages", return_value=iter(pages)):
+            batches = list(scraper.iter_batches(batch_size=20))
+
+        self.assertEqual([len(batch.index) for batch in batches], [20, 20, 10])
+        self.assertEqual(batches[0].dtypes.get("cena_nemovitosti"), "int32")
+
+    def test_iter_batches_skips_duplicates(self):
+        parsed_page = BezrealitkyScraper.extract_content(self.soup, "Byt", "Praha")
+        # ads 9 and 10 of the first page are shifted to the second page, ad 1 is listed in another region too
+        new_ads = [dict(ad, odkaz=ad["odkaz"].replace("/nemovitosti-byty-domy/", "/nemovitosti-byty-domy/2"))
+                   for ad in parsed_page[:8]]
+        pages = [parsed_page, parsed_page[8:] + new_ads, [dict(parsed_page[0], region="Brno")],
+                 # the same ad with another slug
+                 [dict(parsed_page[1], odkaz=parsed_page[1]["odkaz"] + "-libeň")]]
+        scraper = BezrealitkyScraper(self.base_url, self.prop_type)
+        metrics.reset()
+        with patch.object(scraper, "iter_pages", return_value=iter(pages)):
+            df = concat(scraper.iter_batches(batch_size=20))
+
+        self.assertEqual(len(df.index), 18)
+        self.assertTrue(df["odkaz"].is_unique)
+        self.assertEqual((scraper.dedup.duplicates, scraper.dedup.page_shifts), (4, 2))
+        self.assertEqual(metrics.summary()["stages"]["dedup"]["duplicates"], 4)
+
+    def test_scrape_section_incremental(self):
+        parsed_page = BezrealitkyScraper.extract_content(self.soup, "Byt", "Praha")
+        known_ads = {ad["odkaz"]: int(ad["cena_nemovitosti"]) for ad in parsed_page}
+        url = self.base_url + "byt/praha"
+
+        def scrape_page(page_url, prop_type, region):
+            # page 2 has one repriced ad, page 3 has only known ads
+            if page_url.endswith("?page=2"):
+                return [dict(parsed_page[0], cena_nemovitosti="7000000")] + parsed_page[1:]
+            return parsed_page
+
+        new_ad = dict(parsed_page[0], odkaz="https://www.bezrealitky.cz/nemovitosti-byty-domy/1-nabidka-prodej-bytu")
+        scraper = BezrealitkyScraper(self.base_url, self.prop_type, known_ads=known_ads)
+        with patch.object(scraper, "scrape_first_page", return_value=([new_ad], 57)), \
+                patch.object(scraper, "scrape_page", side_effect=scrape_page) as mocked_page:
+            parsed_section = scraper.scrape_section(url, "Byt", "Praha")
+
+        self.assertEqual(mocked_page.call_count, 2)
+        self.assertEqual(len(parsed_section), 21)
+        self.assertTrue(scraper.is_known_page(parsed_page))
+        self.assertFalse(scraper.is_known_page([new_ad]))
+        # ads dropped by cleaning are never in history, they don't make the page unknown
+        unpriced_ads = [dict(new_ad, cena_nemovitosti=price) for price in (None, "1", "5000+")]
+        self.assertTrue(scraper.is_known_page(parsed_page + unpriced_ads + [dict(new_ad, rozloha=None)]))
+        self.assertFalse(scraper.is_known_page(parsed_page + unpriced_ads + [new_ad]))
+
+    def test_parser_version(self):
+        self.assertEqual(parser_version("lxml", "html"), parser_version("lxml", "html"))
+        self.assertNotEqual(parser_version("lxml", "html"), parser_version("bs4", "html"))
+        self.assertNotEqual(parser_version("lxml", "html"), parser_version("lxml", "graphql"))
+
+    def test_get_parsed_cache(self):
+        scraper = BezrealitkyScraper(self.base_url, self.prop_type)
+        url = self.base_url + "byt/praha"
+        with open(get_path("python", "tests", "unit", "fixtures", "url_praha.html"), "rb") as html:
+            content = html.read()
+
+        def get_response(status, body):
+            response = requests.Response()
+            response.status_code = status
+            response.headers["ETag"] = '"v1"'
+            response._content = body
+            return response
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            scraper.cache = HttpCache(os.path.join(tmp_dir, "http_cache.db"))
+            responses = [get_response(200, content), get_response(304, b""), get_response(200, content)]
+            with patch.object(scraper, "fetch", side_effect=responses) as mocked_fetch, \
+                    patch.object(scraper.parser, "extract_content", wraps=scraper.parser.extract_content) as parse:
+                first = scraper.scrape_page(url, "Byt", "Praha")
+                not_modified = scraper.scrape_page(url, "Byt", "Praha")
+                same_hash = scraper.scrape_page(url, "Byt", "Praha")
+            scraper.cache.close()
+
+        # page is parsed only once, then served from cache
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual(len(first), 10)
+        self.assertEqual(first, not_modified)
+        self.assertEqual(first, same_hash)
+        self.assertEqual(mocked_fetch.call_args_list[1].args[1], {"If-None-Match": '"v1"'})
+
+    def test_missing_listing_page(self):
+        scraper = BezrealitkyScraper(self.base_url, self.prop_type)
+        url = self.base_url + "byt/praha"
+
+        def http_error(status):
+            response = requests.Response()
+            response.status_code = status
+            return requests.exceptions.HTTPError(response=response)
+
+        # listing page that disappeared during the crawl is a page without ads, other errors stop the run
+        with patch.object(scraper.session, "get", side_effect=http_error(404)):
+            self.assertEqual(scraper.scrape_first_page(url, "Byt", "Praha"), ([], 1))
+            self.assertEqual(scraper.scrape_page(url + "?page=2", "Byt", "Praha"), [])
+            with self.assertRaises(SystemError):
+                scraper.get_content(self.base_url)
+        with patch.object(scraper.session, "get", side_effect=http_error(403)):
+            with self.assertRaises(SystemError):
+                scraper.scrape_page(url + "?page=2", "Byt", "Praha")
+
+    def test_crawl_standin(self):
+        config = {"parser": "lxml", "crawl": {"requests_per_second": 1000, "max_in_flight": 4}}
+        with StandInSite(regions=3, pages=2, ads_per_page=5, prop_types=("byt", "dum")) as site, \
+                tempfile.TemporaryDirectory() as tmp_dir:
+            scraper = BezrealitkyScraper(site.url, self.prop_type, config)
+            scraper.cache = HttpCache(os.path.join(tmp_dir, "http_cache.db"))
+            df = scraper.main()
+            metrics.reset()
+            # the second crawl is served from cache - every listing page is not modified
+            cached_df = scraper.main()
+            scraper.cache.close()
+
+        self.assertEqual(len(df.index), site.total_ads)
+        self.assertEqual(list(df["typ_nemovistosti"].unique()), ["Byt", "Dům"])
+        self.assertEqual(df["odkaz"].nunique(), site.total_ads)
+        assert_frame_equal(df, cached_df)
+        self.assertEqual({event["status"] for event in metrics.events if event["stage"] == "fetch"}, {200, 304})
+        self.assertNotIn("extract", {event["stage"] for event in metrics.events})
+
+    def test_parsing_pool(self):
+        config = {"parser": "lxml", "crawl": {"requests_per_second": 1000, "max_in_flight": 4}}
+        with StandInSite(regions=3, pages=3, ads_per_page=5) as site:
+            df = BezrealitkyScraper(site.url, ["byt"], config).main()
+            metrics.reset()
+            config["crawl"]["parse_workers"] = 2
+            scraper = BezrealitkyScraper(site.url, ["byt"], config)
+            pool_df = scraper.main()
+
+        assert_frame_equal(df, pool_df)
+        stages = {event["stage"] for event in metrics.events}
+        # listing pages are parsed in the pool, the homepage by the crawling process
+        self.assertEqual(metrics.summary()["stages"]["parse_pool"]["count"], 3 * 3)
+        self.assertNotIn("extract", stages)
+        self.assertIsNone(scraper.parse_pool)
+
+    def test_graphql_source(self):
+        config = {"parser": "lxml", "crawl": {"requests_per_second": 1000, "max_in_flight": 4}}
+        with StandInSite(regions=3, pages=3, ads_per_page=5, prop_types=("byt", "dum")) as site:
+            df = BezrealitkyScraper(site.url, self.prop_type, config).main()
+            metrics.reset()
+            # 15 ads of every section in 4 requests of the API
+            config.update(source="graphql", graphql={"endpoint": site.graphql_url, "page_size": 4,
+                                                     "experimental": "Y"})
+            scraper = BezrealitkyScraper(site.url, self.prop_type, config)
+            graphql_df = scraper.main()
+            fetched = [event["url"] for event in metrics.events if event["stage"] == "fetch"]
+
+            # incremental crawl stops at the first request of every section - all ads are known
+            known_ads = dict(zip(df["odkaz"], df["cena_nemovitosti"]))
+            incremental = BezrealitkyScraper(site.url, self.prop_type, config, known_ads).main()
+            graphql_url = site.graphql_url
+
+        assert_frame_equal(df, graphql_df)
+        self.assertEqual(len(fetched), 1 + 2 * 3 * 4)
+        self.assertTrue(all(url.startswith(graphql_url) for url in fetched[1:]))
+        self.assertEqual(len(incremental.index), 2 * 3 * 4)
+
+    def test_replay(self):
+        config = {"parser": "lxml", "crawl": {"requests_per_second": 1000, "max_in_flight": 4}}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with StandInSite(regions=3, pages=3, ads_per_page=5) as site:
+                scraper = BezrealitkyScraper(site.url, ["byt"], config)
+                scraper.archive = PageArchive(tmp_dir)
+                df = scraper.main()
+                scraper.archive.close()
+                url = site.url
+
+            # the site is down, pages are read from archive
+            scraper = BezrealitkyScraper(url, ["byt"], dict(config, parser="bs4"))
+            scraper.replay(PageArchive(tmp_dir), date(2020, 11, 4))
+            with self.assertRaises(SystemError):
+                scraper.main()
+            scraper.replay(PageArchive(tmp_dir), date.today())
+            replayed_df = scraper.main()
+            scraper.session.close()
+
+        assert_frame_equal(df, replayed_df, check_categorical=False)
+        self.assertEqual(len(replayed_df.index), site.total_ads)
+
+    def test_archive_crawl_date(self):
+        first_day, second_day = date(2020, 11, 4), date(2020, 11, 5)
+        url = self.base_url + "byt/praha"
+        response = requests.Response()
+        response.status_code = 404
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive = PageArchive(tmp_dir)
+            scraper = BezrealitkyScraper(self.base_url, self.prop_type)
+            scraper.archive = archive
+            scraper.checkpoint = CrawlCheckpoint(os.path.join(tmp_dir, "crawl_checkpoint.db"))
+            # crawl started before midnight archives pages with its date, page not found is archived too
+            scraper.crawl_date = first_day
+            with patch.object(scraper.session, "get", side_effect=requests.exceptions.HTTPError(response=response)):
+                self.assertEqual(scraper.scrape_page(url + "?page=2", "Byt", "Praha"), [])
+            archive.put(url, b"<html></html>", first_day)
+            scraper.checkpoint.put(url, "Byt", "Praha", [{"odkaz": "1"}], 1)
+
+            # resumed crawl takes the page from checkpoint and archives it with its own date
+            scraper.crawl_date = second_day
+            self.assertEqual(scraper.scrape_first_page(url, "Byt", "Praha"), ([{"odkaz": "1"}], 1))
+            archived = archive.get(second_day, url)
+
+            replayed = BezrealitkyScraper(self.base_url, self.prop_type)
+            replayed.replay(archive, first_day)
+            replayed.crawl_date = first_day
+            replayed_page = replayed.scrape_page(url + "?page=2", "Byt", "Praha")
+            scraper.checkpoint.close()
+            archive.close()
+
+        self.assertEqual(archived, b"<html></html>")
+        # replay of the page not found gives the same empty page as the crawl
+        self.assertEqual(replayed_page, [])
+
+    def test_resume_crawl(self):
+        config = {"parser": "lxml", "crawl": {"requests_per_second": 1000, "max_in_flight": 4}}
+        with StandInSite(regions=3, pages=4, ads_per_page=5) as site, tempfile.TemporaryDirectory() as tmp_dir:
+            scraper = BezrealitkyScraper(site.url, ["byt"], config)
+            scraper.checkpoint = CrawlCheckpoint(os.path.join(tmp_dir, "crawl_checkpoint.db"))
+            failing_url = site.url + "byt/" + site.region_uris[2] + "?page=3"
+            get_parsed = scraper.get_parsed
+
+            def fail_on_page(url, parse, missing=None):
+                if url == failing_url:
+                    raise SystemError(1)
+                return get_parsed(url, parse, missing)
+
+            with patch.object(scraper, "get_parsed", side_effect=fail_on_page):
+                with self.assertRaises(SystemError):
+                    scraper.main()
+
+            metrics.reset()
+            df = scraper.main()
+            resumed_fetches = [event["url"] for event in metrics.events if event["stage"] == "fetch"]
+            scraper.finish()
+            scraper.checkpoint.close()
+
+        self.assertEqual(len(df.index), site.total_ads)
+        self.assertEqual(df["odkaz"].nunique(), site.total_ads)
+        # homepage and pages not completed by the failed crawl
+        self.assertIn(failing_url, resumed_fetches)
+        self.assertLess(len(resumed_fetches), 1 + 3 * 4)
+
+    def test_distributed_crawl(self):
+        config = {"parser": "lxml", "crawl": {"requests_per_second": 1000, "max_in_flight": 2}}
+        with StandInSite(regions=3, pages=3, ads_per_page=5, prop_types=("byt", "dum")) as site, \
+                tempfile.TemporaryDirectory() as tmp_dir:
+            df = BezrealitkyScraper(site.url, self.prop_type, config).main()
+
+            scraper = BezrealitkyScraper(site.url, self.prop_type, dict(config, distributed={"workers": 2}))
+            scraper.queue_path = os.path.join(tmp_dir, "crawl_queue.db")
+            distributed_df = scraper.main()
+
+        # the same data in the same order as the crawl in one process
+        assert_frame_equal(df, distributed_df)
+        self.assertEqual(len(distributed_df.index), site.total_ads)
+        # pages fetched by workers are in the run metrics
+        fetched = [event for event in metrics.events if event["stage"] == "fetch" and "worker" in event]
+        self.assertEqual(len(fetched), 2 * 3 * 3)
+
+    def test_work_failed_task(self):
+        scraper = BezrealitkyScraper(self.base_url, self.prop_type, {"crawl": {"max_in_flight": 1}})
+        url = self.base_url + "byt/"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            queue = WorkQueue(os.path.join(tmp_dir, "crawl_queue.db"), max_attempts=2)
+            queue.reset([CrawlTask(0, 1, url + "praha", "Byt", "Praha"), CrawlTask(1, 1, url + "brno", "Byt", "Brno")])
+
+            def scrape_first_page(task_url, prop_type, region):
+                if region == "Praha":
+                    raise SystemError(1)
+                return [{"odkaz": task_url}], 1
+
+            # failing page doesn't stop the worker, it is tried max attempts times
+            with patch.object(scraper, "scrape_first_page", side_effect=scrape_first_page) as mocked_scrape:
+                completed = scraper.work(queue, "worker-0")
+            stats = queue.stats()
+            queue.close()
+
+        self.assertEqual(completed, 1)
+        self.assertEqual(mocked_scrape.call_count, 1 + 2)
+        self.assertEqual(stats, {"pending": 0, "taken": 0, "done": 1, "failed": 1})
+
+    def test_iter_details(self):
+        config = {"parser": "lxml", "crawl": {"requests_per_second": 1000, "max_in_flight": 4}}
+        with StandInSite(regions=1, pages=1, ads_per_page=10) as site:
+            scraper = BezrealitkyScraper(site.url, ["byt"], config)
+            ads = [(ad["odkaz"], int(ad["cena_nemovitosti"])) for ad in next(scraper.iter_pages())]
+            # ad removed from web
+            ads.append(("https://www.bezrealitky.cz/nemovitosti-byty-domy/999-nabidka-prodej-byt", 100))
+            details = list(scraper.iter_details(ads))
+
+        self.assertEqual([(detail["odkaz"], detail["cena_nemovitosti"]) for detail in details], ads[:-1])
+        self.assertEqual(details[3]["podlazi"], "3")
+        self.assertEqual(details[3]["energeticka_trida"], "D")
+        self.assertIsInstance(details[3]["lat"], float)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from unittest.mock import patch
+import requests
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../scraper')))
+from lib.session import HttpSession
+
+
+class TestHttpSession(unittest.TestCase):
+
+    def setUp(self):
+        self.url = "https://www.bezrealitky.cz/vypis/nabidka-prodej/byt/praha"
+        self.http = HttpSession(retries=3, backoff_factor=0.5)
+
+    @staticmethod
+    def get_response(status, headers=None):
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers or {})
+        response._content = b"<html></html>"
+        return response
+
+    def test_backoff(self):
+        self.assertEqual(self.http.backoff(0), 0.5)
+        self.assertEqual(self.http.backoff(3), 4.0)
+        self.assertEqual(self.http.backoff(20), 60.0)
+        self.assertEqual(self.http.backoff(0, self.get_response(429, {"Retry-After": "7"})), 7.0)
+        self.assertEqual(self.http.backoff(0, self.get_response(503, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})), 0.0)
+
+    @patch("lib.session.time.sleep")
+    def test_get_retry(self, mocked_sleep):
+        responses = [self.get_response(503), self.get_response(429, {"Retry-After": "2"}), self.get_response(200)]
+        with patch.object(self.http.session, "get", side_effect=responses) as mocked_get:
+            response = self.http.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mocked_get.call_count, 3)
+        self.assertEqual([c.args[0] for c in mocked_sleep.call_args_list], [0.5, 2.0])
+        self.assertEqual(mocked_get.call_args.kwargs["timeout"], (5, 30))
+
+    @patch("lib.session.time.sleep")
+    def test_get_retries_exhausted(self, mocked_sleep):
+        side_effect = [requests.exceptions.ConnectionError()] + [self.get_response(500)] * 3
+        with patch.object(self.http.session, "get", side_effect=side_effect):
+            with self.assertRaises(requests.exceptions.HTTPError):
+                self.http.get(self.url)
+        self.assertEqual(mocked_sleep.call_count, 3)
+
+    def test_no_retry_on_client_error(self):
+        with patch.object(self.http.session, "get", return_value=self.get_response(404)) as mocked_get:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                self.http.get(self.url)
+        self.assertEqual(mocked_get.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import tempfile
+from datetime import datetime
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../scraper')))
+from lib.work_queue import CrawlTask, WorkQueue
+
+
+class TestWorkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.queue = WorkQueue(os.path.join(self.tmp_dir.name, "crawl_queue.db"), max_attempts=2)
+        self.url = "https://www.bezrealitky.cz/vypis/nabidka-prodej/byt/"
+        self.queue.reset([CrawlTask(0, 1, self.url + "praha", "Byt", "Praha"),
+                          CrawlTask(1, 1, self.url + "brno", "Byt", "Brno")])
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmp_dir.cleanup()
+
+    def test_claim(self):
+        first = self.queue.claim("worker-0")
+        self.assertEqual(first, CrawlTask(0, 1, self.url + "praha", "Byt", "Praha"))
+        self.queue.complete(first, [{"odkaz": "1"}], [first._replace(page=2, url=first.url + "?page=2")])
+
+        # first pages of all sections go first
+        self.assertEqual(self.queue.claim("worker-1").region, "Brno")
+        self.assertEqual(self.queue.claim("worker-0").url, self.url + "praha?page=2")
+        self.assertIsNone(self.queue.claim("worker-0"))
+        self.assertEqual(self.queue.in_progress(), 2)
+        self.assertEqual(self.queue.stats(), {"pending": 0, "taken": 2, "done": 1, "failed": 0})
+
+    def test_release(self):
+        task = self.queue.claim("worker-0")
+        self.queue.release(task)
+        self.assertEqual(self.queue.claim("worker-1"), task)
+
+        # worker process died, its task is returned once more - max attempts is reached then
+        self.assertEqual(self.queue.release_worker("worker-1"), 1)
+        self.assertEqual(self.queue.stats(), {"pending": 1, "taken": 0, "done": 0, "failed": 1})
+        self.assertEqual(self.queue.claim("worker-0").region, "Brno")
+        self.assertIsNone(self.queue.claim("worker-0"))
+
+    def test_metrics(self):
+        started = datetime(2020, 11, 4, 10, 0, 0)
+        events = [{"stage": "fetch", "start": 0.5, "seconds": 0.1, "url": self.url, "status": 200}]
+        self.queue.put_metrics("worker-0", started, events)
+        self.assertEqual(list(self.queue.iter_metrics()), [("worker-0", started, events)])
+
+        # metrics of the previous crawl are removed with its tasks
+        self.queue.reset([])
+        self.assertEqual(list(self.queue.iter_metrics()), [])
+
+    def test_iter_results(self):
+        brno = CrawlTask(1, 1, self.url + "brno", "Byt", "Brno")
+        praha = CrawlTask(0, 1, self.url + "praha", "Byt", "Praha")
+        praha_2 = praha._replace(page=2, url=praha.url + "?page=2")
+        self.queue.complete(brno, [{"odkaz": "3"}])
+        self.queue.complete(praha, [{"odkaz": "1"}], [praha_2])
+        self.queue.complete(praha_2, [{"odkaz": "2"}])
+
+        # order of the sequential crawl, not the order of completion
+        self.assertEqual(list(self.queue.iter_results(batch_size=2)), [[{"odkaz": "1"}], [{"odkaz": "2"}], [{"odkaz": "3"}]])
+
+
+if __name__ == '__main__':
+    unittest.main()